@@ -1,17 +1,42 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response
+from flask import Flask, Request, render_template, request, redirect, url_for, session, flash, jsonify, make_response
 from werkzeug.middleware.proxy_fix import ProxyFix
+from markupsafe import Markup, escape
 from project import Project
 from handcraft import Admin
+import database
+import migrations
+import like_buffer
+import login_guard
+import metrics
+import page_cache
+import session_store
+import stats
+import thumbnails
+import upload_ingest
+import hashlib
 import os
 import random
 import re
 import uuid
 from math import ceil
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+# 已登录管理员添加 / 编辑项目时，表单中的图片在解析时直接边校验边写入上传目录
+# （不再先缓存到 werkzeug 的临时文件）；其他请求（如匿名的登录、点赞）仍使用 werkzeug 默认的文件流
+INGEST_ENDPOINTS = {'add_new_project', 'edit_existing_project'}
+
+class IngestRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in INGEST_ENDPOINTS and 'admin' in session:
+            return upload_ingest.IngestFile(app.config['UPLOAD_FOLDER'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
 
 app = Flask(__name__)
+app.request_class = IngestRequest
 app.secret_key = 'sercet_key_here'
 app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
+# 请求体上限：单张图片上限加上表单字段的余量，超出时在读取请求体之前返回 413
+app.config['MAX_CONTENT_LENGTH'] = upload_ingest.MAX_BYTES + 1024 * 1024
 
 # 配置HTTPS（在反向代理后运行时需要）
 #app.config['PREFERRED_URL_SCHEME'] = 'https'
@@ -29,40 +54,29 @@ app.wsgi_app = ProxyFix(
 # 设置会话永久性（1天）
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
 
-# 🔑 1. 把迁移函数放在这里
-def migrate_duration_days():
-    import sqlite3
-    from datetime import datetime
-    try:
-        conn = sqlite3.connect('handshop.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        # 查找所有状态为已完成，但 duration_days 为空的数据
-        cursor.execute("SELECT id, created_at, completed_at FROM projects WHERE status='已完成' AND (duration_days IS NULL)")
-        rows = cursor.fetchall()
-        
-        count = 0
-        for row in rows:
-            if row['created_at'] and row['completed_at']:
-                try:
-                    d1 = datetime.strptime(row['created_at'].split()[0], '%Y-%m-%d')
-                    d2 = datetime.strptime(row['completed_at'].split()[0], '%Y-%m-%d')
-                    days = max(0, (d2 - d1).days)
-                    cursor.execute("UPDATE projects SET duration_days = ? WHERE id = ?", (days, row['id']))
-                    count += 1
-                except Exception:
-                    pass
-        conn.commit()
-        conn.close()
-        if count > 0:
-            print(f"[INFO] 成功自动迁移并计算了 {count} 个已完成项目的历史天数！")
-    except Exception as e:
-        print(f"[ERROR] 迁移用时字段失败: {e}")
-
-# 🔑 2. 在 Flask 首次运行请求前或启动时调用一次
-with app.app_context():
-    migrate_duration_days()
-    Project.init_likes_table()
+# 最后活动时间的刷新间隔：间隔内的请求不改写会话，会话 Cookie 也不会每次重新签发
+app.config['SESSION_ACTIVITY_REFRESH'] = timedelta(minutes=5)
+# 会话未修改时不重新下发 Cookie（有效期随最后活动时间的刷新一起延长）
+app.config['SESSION_REFRESH_EACH_REQUEST'] = False
+
+# 可选的服务端会话存储（HANDSHOP_SESSION_STORE=sqlite）
+if session_store.ENABLED:
+    app.session_interface = session_store.SqliteSessionInterface()
+
+# 请求耗时与 SQL 统计：最先开始计时、最后记录，响应头 Server-Timing 给出总耗时与数据库耗时
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    timing = metrics.finish_request(request.endpoint or 'unmatched', request.method, response.status_code)
+    if timing:
+        response.headers.add('Server-Timing', timing)
+    return response
+
+# 数据库结构迁移由 `python migrations.py` 或 gunicorn 的 on_starting 钩子在启动 worker 前执行，
+# 导入 app 时不访问数据库
 
 # ==========================================================================
 # 1. Miku 主题与全局上下文注入 (Context Processors)
@@ -83,6 +97,40 @@ def inject_miku_theme():
         'current_year': datetime.now().year
     }
 
+# 多尺寸压缩图的 srcset 属性值
+@app.template_filter('srcset')
+def thumbnail_srcset(project):
+    """没有多尺寸压缩图（旧数据或任务未完成）时返回空字符串"""
+    return ', '.join(
+        f"{url_for('static', filename=path)} {width}w" for width, path in project.get_thumbnail_variants()
+    )
+
+# 搜索结果高亮：先转义文本，再把高亮标记替换为 <mark>
+@app.template_filter('search_highlight')
+def search_highlight(text):
+    escaped = str(escape(text or ''))
+    return Markup(escaped.replace(Project.SEARCH_MARK_START, '<mark>').replace(Project.SEARCH_MARK_END, '</mark>'))
+
+# 按内容哈希命名的上传图片及其压缩图内容永不变化，允许浏览器长期缓存
+HASHED_UPLOAD_RE = re.compile(r'^uploads/(thumbnail/)?[0-9a-f]{64}(_\d+)?\.[a-z]+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+@app.after_request
+def cache_hashed_uploads(response):
+    if request.endpoint == 'static' and response.status_code in (200, 206, 304) \
+            and HASHED_UPLOAD_RE.match((request.view_args or {}).get('filename', '')):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+# 请求体超过 MAX_CONTENT_LENGTH：回到原页面提示
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    flash(f'上传的文件过大，图片不能超过 {upload_ingest.MAX_BYTES / 1024 / 1024:g} MB', 'error')
+    return redirect(request.url)
+
 # 获取设备类型
 def get_device_type():
     """根据User-Agent判断设备类型"""
@@ -103,13 +151,17 @@ def get_background():
 def check_session_expiry():
     if 'admin' in session:
         if session.permanent:
+            now = datetime.now()
             last_activity = session.get('_last_activity')
             if last_activity:
                 last_activity = datetime.fromisoformat(last_activity)
-                if datetime.now() - last_activity > app.config['PERMANENT_SESSION_LIFETIME']:
+                if now - last_activity > app.config['PERMANENT_SESSION_LIFETIME']:
                     session.clear()
                     return False
-            session['_last_activity'] = datetime.now().isoformat()
+                # 距上次刷新不足间隔时不改写会话
+                if now - last_activity < app.config['SESSION_ACTIVITY_REFRESH']:
+                    return True
+            session['_last_activity'] = now.isoformat()
         return True
     return True
 
@@ -122,14 +174,83 @@ def login_required(f):
         if not check_session_expiry():
             flash('登录已过期，请重新登录 (登录超时)', 'error')
             return redirect(url_for('admin_login'))
+        # 未登录（会话中没有管理员）时同样跳转登录页
+        if 'admin' not in session:
+            return redirect(url_for('admin_login'))
         return f(*args, **kwargs)
     return decorated_function
 
-# 每次请求前更新最后活动时间
+# 公开页面的条件请求：ETag 由内容版本、页面地址、设备类型、登录状态与访客标识派生，
+# 内容未变化时直接返回 304，不查询项目也不渲染模板；需要渲染时匿名访客共用渲染缓存
+PAGE_TEMPLATE_VERSION = str(max(
+    os.path.getmtime(os.path.join(root, name))
+    for root, _, names in os.walk(os.path.join(app.root_path, 'templates')) for name in names
+))
+
+def page_etag():
+    version, _ = database.content_version()
+    parts = [version, PAGE_TEMPLATE_VERSION, request.full_path, get_device_type(), datetime.now().year,
+             session.get('admin', ''), request.cookies.get('client_token', '')]
+    if like_buffer.ENABLED:
+        parts.append(like_buffer.local_version())
+    return hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+def render_cached_page(render, *params):
+    """
+    render() 按未点赞状态渲染页面，返回 (html, 页面中的项目 id)。
+    匿名访客且没有提示消息时使用渲染缓存，最后按访客替换点赞图标。
+    缓存键只包含端点与影响输出的参数 params（已解析的分类、页码等），不使用原始查询字符串，
+    随意附加的参数不会产生新的缓存项；没有项目的页面（不存在的分类、超出范围的页码）不缓存。
+    """
+    cacheable = page_cache.ENABLED and not session.get('admin') and '_flashes' not in session
+    entry = None
+    if cacheable:
+        version, _ = database.content_version()
+        key = (PAGE_TEMPLATE_VERSION, request.endpoint, params, get_device_type(), datetime.now().year)
+        entry = page_cache.get(version, key)
+    if entry is None:
+        entry = render()
+        if cacheable and entry[1]:
+            page_cache.put(version, key, *entry)
+
+    html, project_ids = entry
+    liked_project_ids = Project.get_liked_project_ids(request.cookies.get('client_token'), project_ids)
+    return page_cache.apply_liked(html, liked_project_ids)
+
+def conditional_page(f):
+    from functools import wraps
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        check_session_expiry()
+        # 有待显示的提示消息时正常渲染（消息只显示一次）
+        if '_flashes' in session:
+            return f(*args, **kwargs)
+
+        etag = page_etag()
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(f(*args, **kwargs))
+        response.set_etag(etag)
+        _, updated_at = database.content_version()
+        if updated_at:
+            response.last_modified = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        # 页面因访客而异，只允许浏览器缓存且每次都要验证
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.update(('Cookie', 'User-Agent'))
+        return response
+    return decorated_function
+
+# 每次请求前确认数据库版本并启动压缩图任务（最后活动时间由 check_session_expiry 按间隔刷新）。
+# 会话心跳只读取会话，不做这些工作
 @app.before_request
 def before_request():
-    if session.get('_last_activity'):
-        session['_last_activity'] = datetime.now().isoformat()
+    if request.endpoint == 'check_session':
+        return
+    migrations.ensure_current()
+    thumbnails.start_worker()
 
 # ==========================================================================
 # 2. 路由视图函数 (Routes)
@@ -137,51 +258,172 @@ def before_request():
 
 # 首页视图
 @app.route('/')
+@conditional_page
 def home():
-    check_session_expiry()
-    client_token = request.cookies.get('client_token')
-    liked_project_ids = Project.get_liked_project_ids(client_token)
-    all_projects = Project.get_all()
-    latest_projects = all_projects[:4]
+    def render():
+        latest_projects = Project.get_latest(4)
+        html = render_template('index.html',
+                               background=get_background(),
+                               device_type=get_device_type(),
+                               latest_projects=latest_projects,
+                               liked_project_ids=set())
+        return html, [p.id for p in latest_projects]
 
-    return render_template('index.html', 
-                           background=get_background(),
-                           device_type=get_device_type(),
-                           latest_projects=latest_projects,
-                           liked_project_ids=liked_project_ids)
+    return render_cached_page(render)
 
 # 分类视图
 @app.route('/category/<category>')
+@conditional_page
 def show_category(category):
-    client_token = request.cookies.get('client_token')
-    liked_project_ids = Project.get_liked_project_ids(client_token)
     page = request.args.get("page", 1, type=int)
     per_page = 6
 
-    projects = Project.get_all(category)
-    total = len(projects)
-    total_pages = ceil(total / per_page)
+    def render():
+        total = Project.count(category)
+        total_pages = ceil(total / per_page)
+        # 第一页同时取得游标，之后由页面通过 /api/projects 无限滚动加载
+        next_cursor = None
+        if page == 1:
+            projects_paginated, next_cursor = Project.get_after(category=category, limit=per_page)
+        else:
+            projects_paginated = Project.get_page(category, page=page, per_page=per_page)
+        html = render_template(
+            'category.html',
+            category=category,
+            projects=projects_paginated,
+            background=get_background(),
+            device_type=get_device_type(),
+            page=page,
+            total_pages=total_pages,
+            next_cursor=next_cursor,
+            per_page=per_page,
+            liked_project_ids=set(),
+        )
+        return html, [p.id for p in projects_paginated]
 
-    start = (page - 1) * per_page
-    end = start + per_page
-    projects_paginated = projects[start:end]
+    return render_cached_page(render, category, page)
+
+# 全文搜索
+@app.route('/search')
+@conditional_page
+def search_projects():
+    query = request.args.get('q', '').strip()[:100]
+    page = request.args.get('page', 1, type=int)
+    per_page = 6
+
+    results, total = Project.search(query, page=page, per_page=per_page) if query else ([], 0)
+    liked_project_ids = Project.get_liked_project_ids(
+        request.cookies.get('client_token'), [project.id for project, _, _ in results])
 
     return render_template(
-        'category.html',
-        category=category,
-        projects=projects_paginated,
+        'search.html',
+        query=query,
+        results=results,
+        total=total,
         background=get_background(),
         device_type=get_device_type(),
         page=page,
-        total_pages=total_pages,
+        total_pages=ceil(total / per_page),
         liked_project_ids=liked_project_ids,
     )
 
+# 只读 JSON 列表接口：按列表顺序的游标（keyset）分页，供页面无限滚动加载
+API_DEFAULT_LIMIT = 12
+API_MAX_LIMIT = 50
+
+def _static_url(path):
+    return url_for('static', filename=path) if path else None
+
+# 可通过 fields 参数选择的字段
+API_FIELDS = {
+    'id': lambda p: p.id,
+    'title': lambda p: p.title,
+    'description': lambda p: p.description,
+    'category': lambda p: p.category,
+    'status': lambda p: p.status,
+    'stars': lambda p: p.stars or 0,
+    'duration_days': lambda p: p.duration_days,
+    'created_at': lambda p: p.get_created_date_for_input() or None,
+    'completed_at': lambda p: p.get_completed_date_for_input() or None,
+    'created_date': lambda p: p.format_created_date(),
+    'completed_date': lambda p: p.format_completed_date(),
+    'image_url': lambda p: _static_url(p.image_path),
+    'thumbnail_url': lambda p: _static_url(p.thumbnail_path),
+    'srcset': lambda p: thumbnail_srcset(p) or None,
+}
+
+@app.route('/api/projects')
+@conditional_page
+def api_projects():
+    """
+    参数：category、status 筛选；cursor 为上一页返回的 next_cursor；
+    limit 每页条数（1 ~ 50）；fields 逗号分隔的字段名，另有 liked 表示当前访客是否点过赞。
+    """
+    category = request.args.get('category') or None
+    status = request.args.get('status') or None
+    cursor = request.args.get('cursor') or None
+    limit = min(max(request.args.get('limit', API_DEFAULT_LIMIT, type=int), 1), API_MAX_LIMIT)
+
+    fields = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    fields = list(dict.fromkeys(fields)) or [*API_FIELDS, 'liked']
+    unknown = [name for name in fields if name not in API_FIELDS and name != 'liked']
+    if unknown:
+        return jsonify({'success': False, 'message': f"未知字段: {', '.join(unknown)}"}), 400
+    if cursor and Project.decode_cursor(cursor) is None:
+        return jsonify({'success': False, 'message': '无效的游标'}), 400
+
+    projects, next_cursor = Project.get_after(cursor, category, status, limit)
+    liked_project_ids = set()
+    if 'liked' in fields:
+        liked_project_ids = Project.get_liked_project_ids(
+            request.cookies.get('client_token'), [p.id for p in projects])
+
+    items = []
+    for project in projects:
+        item = {name: API_FIELDS[name](project) for name in fields if name != 'liked'}
+        if 'liked' in fields:
+            item['liked'] = project.id in liked_project_ids
+        items.append(item)
+    return jsonify({'success': True, 'projects': items, 'next_cursor': next_cursor})
+
+# 统计：只读取由触发器维护的汇总表，与历史数据量无关
+CATEGORY_LABELS = {'knitting': '针织类', 'crafting': '手工类'}
+
+@app.route('/stats')
+@conditional_page
+def show_stats():
+    return render_template(
+        'stats.html',
+        stats=stats.summary(),
+        category_labels=CATEGORY_LABELS,
+        background=get_background(),
+        device_type=get_device_type(),
+    )
+
+@app.route('/api/stats')
+@conditional_page
+def api_stats():
+    return jsonify({'success': True, **stats.summary()})
+
+# Prometheus 指标（汇总所有 worker），只允许本机直接访问或已登录的管理员访问。
+# 按 ProxyFix 改写前的套接字地址判断，经反向代理转发（带 X-Forwarded-For）的请求不算本机
+def is_direct_local_request():
+    original = request.environ.get('werkzeug.proxy_fix.orig', {})
+    remote_addr = original.get('REMOTE_ADDR', request.environ.get('REMOTE_ADDR'))
+    return remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if not is_direct_local_request() and 'admin' not in session:
+        return 'Forbidden', 403
+    return app.response_class(metrics.collect(), mimetype='text/plain; version=0.0.4')
+
 # 会话在线探针/检查点
 @app.route('/check_session')
 def check_session():
+    """心跳：不渲染模板，过期时返回 401 由前端跳转登录页"""
     if not check_session_expiry():
-        return redirect(url_for('admin_login'))
+        return '', 401
     return '', 204
 
 # 管理员登录
@@ -190,8 +432,19 @@ def admin_login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        
-        if Admin.verify_password(username, password):
+
+        # 被限流，或短暂等待后仍没有空闲的密码校验槽位时直接拒绝，不渲染模板
+        retry_after = login_guard.acquire(request.remote_addr, username)
+        if retry_after:
+            return make_response('尝试次数过多，请稍后再试', 429, {'Retry-After': str(retry_after)})
+        try:
+            verified = Admin.verify_password(username, password)
+        except login_guard.Busy:
+            return make_response('服务器繁忙，请稍后再试', 503, {'Retry-After': '5'})
+
+        if verified:
+            login_guard.reset_user(request.remote_addr, username)
+            session_store.rotate(session)
             session['admin'] = username
             session.permanent = True
             session['login_time'] = datetime.now().isoformat()
@@ -209,6 +462,7 @@ def admin_login():
 @app.route('/logout')
 def admin_logout():
     session.clear()
+    session_store.rotate(session)
     flash('已安全退出控制台', 'success')
     return redirect(url_for('home'))
 
@@ -216,8 +470,8 @@ def admin_logout():
 @app.route('/dashboard')
 @login_required
 def admin_dashboard():
-    knitting_projects = [p for p in Project.get_all('knitting') if p.status != '已完成']
-    crafting_projects = [p for p in Project.get_all('crafting') if p.status != '已完成']
+    knitting_projects = Project.get_unfinished('knitting')
+    crafting_projects = Project.get_unfinished('crafting')
 
     return render_template('dashboard.html', 
                            knitting_projects=knitting_projects,
@@ -232,13 +486,13 @@ def completed_projects():
     page = request.args.get("page", 1, type=int)
     per_page = 8
 
-    completed_projects_list = [p for p in Project.get_all() if p.status.strip() == '已完成']
-    total = len(completed_projects_list)
+    total = Project.count(status='已完成')
     total_pages = ceil(total / per_page)
-
-    start = (page - 1) * per_page
-    end = start + per_page
-    projects_paginated = completed_projects_list[start:end]
+    next_cursor = None
+    if page == 1:
+        projects_paginated, next_cursor = Project.get_after(status='已完成', limit=per_page)
+    else:
+        projects_paginated = Project.get_page(status='已完成', page=page, per_page=per_page)
 
     return render_template(
         'completed_projects.html',
@@ -246,7 +500,9 @@ def completed_projects():
         background=get_background(),
         device_type=get_device_type(),
         page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor,
+        per_page=per_page
     )
 
 # 添加新项目
@@ -288,7 +544,11 @@ def add_new_project():
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename != '':
-                image_path, thumbnail_path = Project.save_uploaded_file(file)
+                try:
+                    image_path, thumbnail_path = Project.save_uploaded_file(file)
+                except upload_ingest.UploadRejected as e:
+                    flash(f'图片未保存：{e}', 'warning')
+                    image_path = thumbnail_path = Project.DEFAULT_IMAGE
                 project.image_path = image_path
                 project.thumbnail_path = thumbnail_path
             else:
@@ -320,6 +580,7 @@ def edit_existing_project(project_id):
     if request.method == 'POST':
         old_image_path = project.image_path
         old_thumbnail_path = project.thumbnail_path
+        old_image_files = project.image_files()
 
         project.title = request.form['title']
         project.description = request.form.get('description', '').strip()
@@ -353,22 +614,12 @@ def edit_existing_project(project_id):
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename != '':
-                # 清理旧图片资源
-                if old_image_path and old_image_path != Project.DEFAULT_IMAGE:
-                    old_file_path = os.path.join('static', old_image_path)
-                    try:
-                        if os.path.exists(old_file_path):
-                            os.remove(old_file_path)
-                    except Exception as e:
-                        print(f"删除旧图片出错: {e}")
-
-                if old_thumbnail_path and old_thumbnail_path != Project.DEFAULT_IMAGE:
-                    old_thumb_path = os.path.join('static', old_thumbnail_path)
-                    if os.path.exists(old_thumb_path):
-                        os.remove(old_thumb_path)
-
-                # 保存新上传的文件
-                image_path, thumbnail_path = Project.save_uploaded_file(file)
+                # 保存新上传的文件（与旧图内容相同时得到同一路径），不合格时保留旧图
+                try:
+                    image_path, thumbnail_path = Project.save_uploaded_file(file)
+                except upload_ingest.UploadRejected as e:
+                    flash(f'图片未保存：{e}', 'warning')
+                    image_path, thumbnail_path = old_image_path, old_thumbnail_path
                 project.image_path = image_path
                 project.thumbnail_path = thumbnail_path
             else:
@@ -376,6 +627,11 @@ def edit_existing_project(project_id):
                 project.thumbnail_path = old_thumbnail_path
         
         project.save()
+
+        # 旧图片已没有项目引用时清理（含各尺寸压缩图）
+        if project.image_path != old_image_path:
+            Project.release_files(old_image_path, old_image_files)
+
         flash('项目更新成功！', 'success')
 
         if project.status == '已完成':
@@ -453,6 +709,7 @@ def toggle_like(project_id):
     return response
 
 if __name__ == '__main__':
+    migrations.migrate()
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
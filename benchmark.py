@@ -0,0 +1,621 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+# 基准测试：在临时目录中生成测试数据库（项目、点赞、合成图片），
+# 分别在进程内（Flask test client）和本地多 worker 服务器上按设定并发请求各页面，
+# 输出吞吐量与 p50 / p95 / p99 延迟、每个请求的 SQL 语句数、压缩图编码耗时，结果为 JSON，
+# 可用 `python benchmark.py compare 旧.json 新.json` 对比两次运行。
+# 不会读写项目目录下的 handshop.db 与 static/uploads。
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CATEGORIES = ('knitting', 'crafting')
+STATUSES = ('制作中', '排队中', '已完成')
+SCENARIOS = ('home', 'category', 'completed_projects', 'like', 'add_project')
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'admin123'
+
+# 每个分类页测试的页码范围（第 1 页走游标，之后的页走 OFFSET）
+CATEGORY_PAGES = 5
+# 点赞场景中每个并发线程轮换使用的访客数
+LIKE_VISITORS = 20
+SERVER_START_TIMEOUT = 30
+
+
+# ==========================================================================
+# 统计
+# ==========================================================================
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位数，sorted_values 需已升序排列"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        'mean': round(sum(values) / len(values), 3),
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(values[-1], 3),
+    }
+
+
+# ==========================================================================
+# 测试数据
+# ==========================================================================
+
+def synthetic_jpeg(rng, width, height):
+    """带渐变、色块与噪点的 JPEG，编码与解码开销接近真实照片"""
+    from PIL import Image, ImageDraw
+
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(30):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(width // 8, width // 2), rng.randrange(height // 8, height // 2)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.ellipse((x - w // 2, y - h // 2, x + w // 2, y + h // 2), fill=color)
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    img = Image.blend(img, noise, 0.15)
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=88)
+    return buf.getvalue()
+
+
+def _random_date(rng, days_back):
+    return (date.today() - timedelta(days=rng.randrange(days_back))).isoformat()
+
+
+def seed(rng, projects, likes, images, image_size):
+    """生成项目、点赞与合成图片，返回 (原图路径列表, 耗时统计)"""
+    import database
+    import migrations
+    import thumbnails
+    from project import Project
+
+    started = time.perf_counter()
+    migrations.migrate()
+
+    width, height = image_size
+    image_paths = [
+        Project.store_image(io.BytesIO(synthetic_jpeg(rng, width, height)))
+        for _ in range(images)
+    ]
+    images_done = time.perf_counter()
+
+    rows = []
+    for i in range(projects):
+        status = rng.choice(STATUSES)
+        created_at = _random_date(rng, 3 * 365)
+        completed_at = None
+        if status == '已完成':
+            completed_at = (date.fromisoformat(created_at) + timedelta(days=rng.randrange(1, 120))).isoformat()
+        image_path = image_paths[i % len(image_paths)] if image_paths else Project.DEFAULT_IMAGE
+        rows.append((
+            f'测试作品 {i}', f'第 {i} 个测试作品的描述，用于基准测试。' * rng.randint(0, 3) or None,
+            rng.choice(CATEGORIES), status, image_path, image_path, created_at, completed_at,
+        ))
+    with database.transaction(immediate=True) as conn:
+        conn.executemany('''
+            INSERT INTO projects (title, description, category, status, image_path, thumbnail_path,
+                                  created_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.executemany(
+            'INSERT OR IGNORE INTO project_likes (project_id, client_token) VALUES (?, ?)',
+            ((rng.randint(1, projects), f'seed-{rng.randrange(max(1, likes // 3))}') for _ in range(likes))
+        )
+        conn.execute('''
+            UPDATE projects SET stars = (
+                SELECT COUNT(*) FROM project_likes WHERE project_likes.project_id = projects.id
+            )
+        ''')
+        conn.execute(f'UPDATE projects SET duration_days = {Project.DURATION_SQL}')
+        database.bump_content_version(conn)
+    rows_done = time.perf_counter()
+
+    thumbnails.ensure_many(image_paths)
+    thumbnails.run_worker(1, stop_when_idle=True)
+    finished = time.perf_counter()
+
+    return image_paths, {
+        'images_seconds': round(images_done - started, 3),
+        'rows_seconds': round(rows_done - images_done, 3),
+        'thumbnail_worker_seconds': round(finished - rows_done, 3),
+    }
+
+
+def measure_thumbnails(image_paths):
+    """逐张计时压缩图编码（写到临时目录，不影响已生成的压缩图）"""
+    import thumbnails
+
+    timings = []
+    scratch = os.path.join(thumbnails.STATIC_DIR, 'bench')
+    for i, image_path in enumerate(image_paths):
+        started = time.perf_counter()
+        thumbnails.generate_thumbnail(thumbnails.STATIC_DIR, image_path, f'bench/encode_{i}.webp')
+        timings.append((time.perf_counter() - started) * 1000)
+    shutil.rmtree(scratch, ignore_errors=True)
+    return {'images': len(timings), 'encode_ms': summarize(timings)}
+
+
+# ==========================================================================
+# 请求
+# ==========================================================================
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Workload:
+    """按场景生成请求 (method, path, headers, body)，同一参数下每次运行生成的请求序列相同"""
+
+    def __init__(self, seed, projects, admin_cookie, upload_images):
+        self.seed = seed
+        self.projects = projects
+        self.admin_cookie = admin_cookie
+        self.upload_images = upload_images
+
+    def request(self, scenario, worker, index):
+        rng = random.Random(f'{self.seed}-{scenario}-{worker}-{index}')
+        if scenario == 'home':
+            return 'GET', '/', {}, None
+        if scenario == 'category':
+            page = index % CATEGORY_PAGES + 1
+            return 'GET', f'/category/{rng.choice(CATEGORIES)}?page={page}', {}, None
+        if scenario == 'completed_projects':
+            page = index % CATEGORY_PAGES + 1
+            return 'GET', f'/completed_projects?page={page}', {'Cookie': self.admin_cookie}, None
+        if scenario == 'like':
+            token = f'bench-{worker}-{index % LIKE_VISITORS}'
+            return 'POST', f'/project/{rng.randint(1, self.projects)}/like', {'Cookie': f'client_token={token}'}, None
+        if scenario == 'add_project':
+            # 在合成图片末尾追加随机字节，保证每次上传的内容哈希都不同
+            image = self.upload_images[index % len(self.upload_images)] + uuid.uuid4().bytes
+            body, content_type = _multipart(
+                {
+                    'title': f'基准上传 {worker}-{index}',
+                    'description': '基准测试上传',
+                    'category': rng.choice(CATEGORIES),
+                    'status': rng.choice(STATUSES),
+                    'completed_at': _random_date(rng, 365),
+                },
+                {'image': ('bench.jpg', image, 'image/jpeg')},
+            )
+            return 'POST', '/add_project', {'Cookie': self.admin_cookie, 'Content-Type': content_type}, body
+        raise ValueError(f'未知场景: {scenario}')
+
+
+# 应用在 Server-Timing 头中给出的本次请求 SQL 语句数，进程内与服务器模式都从这里读取，口径一致
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def server_timing_queries(value):
+    match = SERVER_TIMING_QUERIES.search(value or '')
+    return int(match.group(1)) if match else None
+
+
+class InProcessClient:
+    """通过 Flask test client 在当前线程内处理请求"""
+
+    def __init__(self, app):
+        self.client = app.test_client(use_cookies=False)
+
+    def send(self, method, path, headers, body):
+        headers = dict(headers)
+        content_type = headers.pop('Content-Type', None)
+        response = self.client.open(path, method=method, headers=headers, data=body, content_type=content_type)
+        response.close()
+        queries = server_timing_queries(response.headers.get('Server-Timing'))
+        return response.status_code, queries, response.headers.getlist('Set-Cookie')
+
+
+class HttpClient:
+    """长连接 HTTP 客户端，服务器关闭连接时自动重连；SQL 语句数取自 Server-Timing 响应头"""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def send(self, method, path, headers, body):
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            return 0, None, []
+        if response.will_close:
+            self.conn.close()
+        queries = server_timing_queries(response.getheader('Server-Timing'))
+        return response.status, queries, response.headers.get_all('Set-Cookie') or []
+
+
+def login_cookie(client):
+    """登录一次，返回会话 Cookie（name=value）"""
+    body = urlencode({'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    status, _, cookies = client.send(
+        'POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    for cookie in cookies:
+        pair = cookie.split(';', 1)[0]
+        if pair.startswith('session='):
+            return pair
+    raise RuntimeError(f'管理员登录失败（HTTP {status}）')
+
+
+def run_scenario(make_client, workload, scenario, requests, concurrency, warmup):
+    """concurrency 个线程共同完成 requests 个请求，返回吞吐量、延迟与 SQL 语句数统计"""
+    warm = make_client()
+    for index in range(warmup):
+        warm.send(*workload.request(scenario, 'warmup', index))
+
+    latencies, queries, statuses = [], [], Counter()
+    lock = threading.Lock()
+    next_index = iter(range(requests))
+
+    def worker(number):
+        client = make_client()
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            request = workload.request(scenario, number, index)
+            started = time.perf_counter()
+            status, count, _ = client.send(*request)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+                if count is not None:
+                    queries.append(count)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(requests / seconds, 1) if seconds else None,
+        'latency_ms': summarize(latencies),
+        'errors': sum(n for status, n in statuses.items() if not 200 <= status < 400),
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'db_queries': summarize(queries),
+    }
+
+
+# ==========================================================================
+# 服务器
+# ==========================================================================
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, workers, port):
+    env = dict(os.environ, HANDSHOP_THUMBNAIL_WORKERS='0')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    if kind == 'gunicorn':
+        cmd = ['gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), '--pythonpath', ROOT,
+               '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    else:
+        cmd = [sys.executable, os.path.join(ROOT, 'benchmark.py'), 'serve',
+               '--port', str(port), '--workers', str(workers)]
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'服务器启动失败: {" ".join(cmd)}')
+        status, _, _ = HttpClient(port).send('GET', '/check_session', {}, None)
+        if status:
+            return process
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('等待服务器启动超时')
+
+
+def serve(port, workers):
+    """
+    没有 gunicorn 时使用的预派生（pre-fork）服务器：主进程监听端口后 fork 出 workers 个
+    werkzeug 单线程服务器共同 accept，与 gunicorn 的 sync worker 模式相同。
+    """
+    import logging
+    import signal
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', port))
+    sock.listen(128)
+
+    children = []
+    for _ in range(max(1, workers)):
+        pid = os.fork()
+        if pid == 0:
+            make_server('127.0.0.1', port, app, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in children:
+        os.wait()
+
+
+def run_login_attack(port, workload, requests, concurrency, attackers):
+    """
+    attackers 个线程持续用随机 IP（X-Forwarded-For）和错误密码尝试登录真实的管理员账号，
+    每次尝试都会在服务端计算一次密码哈希；同时测量分类页的延迟，
+    检验登录限流与密码校验并发上限对公开页面的保护效果。
+    """
+    stop = threading.Event()
+    attempts = Counter()
+    lock = threading.Lock()
+
+    def attack(number):
+        client = HttpClient(port)
+        rng = random.Random(f'attack-{number}')
+        while not stop.is_set():
+            ip = f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+            body = urlencode({'username': ADMIN_USERNAME, 'password': f'wrong-{rng.randrange(10 ** 9)}'})
+            status, _, _ = client.send('POST', '/login', {
+                'Content-Type': 'application/x-www-form-urlencoded', 'X-Forwarded-For': ip,
+            }, body)
+            with lock:
+                attempts[status] += 1
+
+    threads = [threading.Thread(target=attack, args=(n,), daemon=True) for n in range(attackers)]
+    for thread in threads:
+        thread.start()
+    try:
+        result = run_scenario(lambda: HttpClient(port), workload, 'category', requests, concurrency, 0)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    result['attack'] = {
+        'attackers': attackers,
+        'attempts': sum(attempts.values()),
+        'statuses': {str(status): n for status, n in sorted(attempts.items())},
+    }
+    return result
+
+
+# ==========================================================================
+# 命令
+# ==========================================================================
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _parse_size(text):
+    width, height = (int(part) for part in text.lower().split('x'))
+    return width, height
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='handshop-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(os.path.abspath(workdir), 'handshop.db')
+    if os.path.exists(db_path):
+        raise SystemExit(f'[ERROR] {db_path} 已存在，请指定新的 --workdir')
+
+    # 上传文件写入工作目录下的 static/，数据库使用工作目录中的新文件，应用内不启动压缩图任务
+    os.environ['HANDSHOP_DB'] = db_path
+    os.environ['HANDSHOP_THUMBNAIL_WORKERS'] = '0'
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    result = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'config': {
+                key: value for key, value in vars(args).items()
+                if key not in ('command', 'output', 'workdir', 'keep')
+            },
+        },
+    }
+
+    try:
+        print(f"[INFO] 生成测试数据: {args.projects} 个项目, {args.likes} 个点赞, {args.images} 张图片")
+        image_size = _parse_size(args.image_size)
+        image_paths, seed_timings = seed(rng, args.projects, args.likes, args.images, image_size)
+        result['seed'] = {'projects': args.projects, 'likes': args.likes, 'images': args.images,
+                          'image_size': args.image_size, **seed_timings}
+        result['thumbnails'] = {'image_size': args.image_size, **measure_thumbnails(image_paths)}
+
+        upload_images = [synthetic_jpeg(rng, *image_size) for _ in range(min(10, max(1, args.requests)))]
+        scenarios = args.scenarios or list(SCENARIOS)
+
+        if not args.skip_in_process:
+            from app import app
+
+            admin_cookie = login_cookie(InProcessClient(app))
+            workload = Workload(args.seed, args.projects, admin_cookie, upload_images)
+            result['in_process'] = {}
+            for scenario in scenarios:
+                print(f"[INFO] 进程内: {scenario}")
+                result['in_process'][scenario] = run_scenario(
+                    lambda: InProcessClient(app), workload, scenario, args.requests, args.concurrency, args.warmup)
+
+        kind = args.server
+        if kind == 'auto':
+            kind = 'gunicorn' if shutil.which('gunicorn') else 'werkzeug'
+        if kind != 'none':
+            port = _free_port()
+            process = start_server(kind, args.workers, port)
+            try:
+                admin_cookie = login_cookie(HttpClient(port))
+                workload = Workload(args.seed, args.projects, admin_cookie, upload_images)
+                result['server'] = {'kind': kind, 'workers': args.workers, 'scenarios': {}}
+                for scenario in scenarios:
+                    print(f"[INFO] 服务器（{kind} × {args.workers}）: {scenario}")
+                    result['server']['scenarios'][scenario] = run_scenario(
+                        lambda: HttpClient(port), workload, scenario, args.requests, args.concurrency, args.warmup)
+                if args.attackers > 0:
+                    print(f"[INFO] 服务器: 登录攻击下的分类页（{args.attackers} 个攻击线程）")
+                    result['server']['category_under_login_attack'] = run_login_attack(
+                        port, workload, args.requests, args.concurrency, args.attackers)
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+    finally:
+        os.chdir(ROOT)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"[INFO] 结果已写入 {args.output}")
+    else:
+        print(output)
+
+
+def _scenario_rows(result):
+    """把一次运行的结果展开为 {(模式, 场景): 统计}"""
+    rows = {('in_process', name): data for name, data in result.get('in_process', {}).items()}
+    server = result.get('server', {})
+    rows.update({('server', name): data for name, data in server.get('scenarios', {}).items()})
+    if 'category_under_login_attack' in server:
+        rows[('server', 'category_under_login_attack')] = server['category_under_login_attack']
+    return rows
+
+
+def _change(old, new):
+    if not old or new is None:
+        return f'{old} -> {new}'
+    return f'{old} -> {new} ({(new - old) / old * 100:+.1f}%)'
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"基准: {old['meta'].get('commit')}  对比: {new['meta'].get('commit')}")
+
+    old_rows, new_rows = _scenario_rows(old), _scenario_rows(new)
+    for key in sorted(set(old_rows) & set(new_rows)):
+        a, b = old_rows[key], new_rows[key]
+        print(f"\n[{key[0]}] {key[1]}")
+        print(f"  吞吐量 (req/s)  {_change(a['throughput_rps'], b['throughput_rps'])}")
+        for pct in ('p50', 'p95', 'p99'):
+            print(f"  {pct} (ms)        {_change(a['latency_ms'][pct], b['latency_ms'][pct])}")
+        if a.get('db_queries') and b.get('db_queries'):
+            print(f"  SQL 语句/请求   {_change(a['db_queries']['mean'], b['db_queries']['mean'])}")
+        if a['errors'] or b['errors']:
+            print(f"  错误数          {a['errors']} -> {b['errors']}")
+
+    a, b = old.get('thumbnails', {}).get('encode_ms'), new.get('thumbnails', {}).get('encode_ms')
+    if a and b:
+        print("\n[thumbnails] 编码耗时")
+        for pct in ('p50', 'p95'):
+            print(f"  {pct} (ms)        {_change(a[pct], b[pct])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='性能基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    bench = sub.add_parser('run', help='生成测试数据并运行基准测试')
+    bench.add_argument('--projects', type=int, default=2000)
+    bench.add_argument('--likes', type=int, default=5000)
+    bench.add_argument('--images', type=int, default=20, help='合成图片数（项目轮流引用）')
+    bench.add_argument('--image-size', default='1600x1200', help='合成图片尺寸，如 4032x3024')
+    bench.add_argument('--requests', type=int, default=300, help='每个场景的请求数')
+    bench.add_argument('--concurrency', type=int, default=4)
+    bench.add_argument('--warmup', type=int, default=20, help='每个场景正式计时前的预热请求数')
+    bench.add_argument('--scenarios', nargs='+', choices=SCENARIOS)
+    bench.add_argument('--server', choices=['auto', 'gunicorn', 'werkzeug', 'none'], default='auto',
+                       help='多 worker 服务器，auto 时优先使用 gunicorn')
+    bench.add_argument('--workers', type=int, default=4, help='服务器 worker 数')
+    bench.add_argument('--attackers', type=int, default=4, help='登录攻击线程数，0 表示不测试')
+    bench.add_argument('--skip-in-process', action='store_true')
+    bench.add_argument('--seed', type=int, default=1, help='随机数种子')
+    bench.add_argument('--workdir', help='测试数据目录（默认使用临时目录并在结束后删除）')
+    bench.add_argument('--keep', action='store_true', help='保留临时目录')
+    bench.add_argument('-o', '--output', help='结果 JSON 文件（默认输出到终端）')
+
+    diff = sub.add_parser('compare', help='对比两次运行的结果')
+    diff.add_argument('old')
+    diff.add_argument('new')
+
+    server = sub.add_parser('serve', help=argparse.SUPPRESS)
+    server.add_argument('--port', type=int, required=True)
+    server.add_argument('--workers', type=int, default=4)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        compare(args.old, args.new)
+    else:
+        serve(args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
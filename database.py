@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# 数据库文件路径（可通过环境变量 HANDSHOP_DB 覆盖）
+DB_PATH = os.environ.get('HANDSHOP_DB', 'handshop.db')
+
+# 遇到写锁时的等待时间（毫秒）
+BUSY_TIMEOUT_MS = int(os.environ.get('HANDSHOP_DB_BUSY_TIMEOUT', 5000))
+
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+# fork 前打开、被子进程继承的连接：子进程中不能关闭也不能被垃圾回收（sqlite3_close 会操作父进程的文件锁与句柄），
+# 留在这里直到进程退出
+_inherited = []
+
+
+class _Cursor(sqlite3.Cursor):
+    """记录每条 SQL 的执行耗时（到返回第一行为止，不含之后逐行读取的时间）"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - started)
+
+
+class _Connection(sqlite3.Connection):
+    """conn.execute() 也经过 _Cursor，关闭指标时直接使用 sqlite3.Connection"""
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def configure(path=None, busy_timeout_ms=None):
+    """修改数据库路径或等待时间，已有连接会在下次获取时自动重建"""
+    global DB_PATH, BUSY_TIMEOUT_MS
+    if path is not None:
+        DB_PATH = path
+    if busy_timeout_ms is not None:
+        BUSY_TIMEOUT_MS = int(busy_timeout_ms)
+
+
+def _connect():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=_Connection if metrics.ENABLED else sqlite3.Connection,
+    )
+    metrics.inc('handshop_db_connections_total')
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_connection():
+    """
+    获取当前线程复用的数据库连接。
+    gunicorn fork 出的子进程不使用（也不关闭）从父进程继承的连接，路径变更后也会重新连接。
+    """
+    conn = getattr(_local, 'conn', None)
+    key = (os.getpid(), DB_PATH, BUSY_TIMEOUT_MS)
+    if conn is None or _local.key != key:
+        if conn is not None:
+            _release(conn, _local.key[0])
+        conn = _connect()
+        _local.conn = conn
+        _local.key = key
+    return conn
+
+
+def close_connection():
+    """关闭当前线程持有的连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _release(conn, _local.key[0])
+        _local.conn = None
+
+
+def _release(conn, pid):
+    """关闭本进程打开的连接；从父进程继承来的连接只保留引用"""
+    if pid == os.getpid():
+        conn.close()
+    else:
+        _inherited.append(conn)
+
+
+def data_version():
+    """当前连接看到的数据版本，其他连接提交写入后会变化"""
+    return get_connection().execute('PRAGMA data_version').fetchone()[0]
+
+
+def init_content_version():
+    """初始化内容版本计数器（单行表），页面 ETag 由它派生"""
+    with transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS content_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO content_version (id, version) VALUES (1, 0)')
+
+
+def bump_content_version(conn):
+    """在写事务内把内容版本加一，所有 worker 都会看到新版本"""
+    conn.execute('''
+        UPDATE content_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+    ''')
+    _local.content_version = None
+
+
+def content_version():
+    """
+    返回 (版本号, 最后修改时间)，时间为 UTC 的 YYYY-MM-DD HH:MM:SS 字符串。
+    其他连接没有提交过写入（PRAGMA data_version 未变）时直接沿用上次读取的结果。
+    """
+    conn = get_connection()
+    version = data_version()
+    cached = getattr(_local, 'content_version', None)
+    if cached and cached[0] is conn and cached[1] == version:
+        return cached[2]
+
+    row = conn.execute('SELECT version, updated_at FROM content_version WHERE id = 1').fetchone()
+    result = (row['version'], row['updated_at']) if row else (0, None)
+    _local.content_version = (conn, version, result)
+    return result
+
+
+@contextmanager
+def transaction(immediate=False):
+    """
+    在复用连接上执行一个事务，成功提交、异常回滚。
+    immediate=True 时使用 BEGIN IMMEDIATE 提前拿到写锁，避免读后写的锁升级冲突。
+    嵌套调用时并入外层事务。
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    if immediate:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
@@ -0,0 +1,12 @@
+# gunicorn 配置：主进程启动 worker 前执行一次数据库迁移，worker 启动时不再访问数据库
+import database
+import metrics
+import migrations
+
+
+def on_starting(server):
+    migrations.migrate()
+    # 清空上次运行留下的各 worker 指标快照
+    metrics.reset()
+    # 关闭迁移用的连接，fork 出的 worker 不继承打开的数据库连接
+    database.close_connection()
@@ -1,58 +1,8 @@
-import sqlite3
-from werkzeug.security import generate_password_hash
+import migrations
 
 def init_db():
-    conn = sqlite3.connect('handshop.db')
-    cursor = conn.cursor()
-
-    # 创建项目表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS projects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        description TEXT,
-        category TEXT NOT NULL,
-        status TEXT NOT NULL,
-        image_path TEXT,
-        thumbnail_path TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        completed_at TIMESTAMP NULL,
-        duration_days INTEGER,
-        stars INTEGER DEFAULT 0
-    )
-    ''')
-
-    # 创建管理员表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS admins (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS project_likes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        project_id INTEGER NOT NULL,
-        client_token TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
-    )
-    ''')
-
-    # 添加默认管理员
-    try:
-        cursor.execute(
-            'INSERT INTO admins (username, password_hash) VALUES (?, ?)',
-            ('admin', generate_password_hash('admin123'))
-        )
-    except sqlite3.IntegrityError:
-        pass  # 管理员已存在
-
-    conn.commit()
-    conn.close()
+    # 建表、默认管理员及之后的所有结构变更都由 migrations 按版本执行
+    migrations.migrate()
 
 if __name__ == '__main__':
     init_db()
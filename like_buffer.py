@@ -0,0 +1,204 @@
+import atexit
+import os
+import threading
+
+import database
+
+# 点赞写回缓冲（write-behind）：开启后点赞请求只在内存中登记，由后台线程批量写入数据库。
+# 同一 worker 内的状态立即可见；其他 worker 最多延迟一个刷新周期才能看到。
+ENABLED = os.environ.get('HANDSHOP_LIKE_WRITE_BEHIND', '0') == '1'
+
+# 刷新周期（毫秒）与触发提前刷新的待写入条数
+FLUSH_INTERVAL_MS = int(os.environ.get('HANDSHOP_LIKE_FLUSH_MS', 500))
+FLUSH_MAX_EVENTS = int(os.environ.get('HANDSHOP_LIKE_FLUSH_EVENTS', 100))
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+# (project_id, client_token) -> (数据库中的状态, 期望状态)，两者不同才会保留
+_pending = {}
+# 已取出、正在写入数据库的批次
+_in_flight = {}
+# project_id -> 尚未落库的点赞数变化
+_star_delta = {}
+# 每次批次提交后加一，用于发现读库期间发生的提交
+_generation = 0
+# 每次切换点赞加一，页面 ETag 据此感知尚未落库的变化
+_toggles = 0
+_flusher_pid = None
+
+
+def configure(enabled=None, flush_interval_ms=None, flush_max_events=None):
+    global ENABLED, FLUSH_INTERVAL_MS, FLUSH_MAX_EVENTS
+    if enabled is not None:
+        ENABLED = bool(enabled)
+    if flush_interval_ms is not None:
+        FLUSH_INTERVAL_MS = int(flush_interval_ms)
+    if flush_max_events is not None:
+        FLUSH_MAX_EVENTS = int(flush_max_events)
+
+
+def _ensure_flusher():
+    """在当前进程中启动后台刷新线程（gunicorn fork 后每个 worker 各自启动一次）"""
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_run, name='like-flusher', daemon=True).start()
+    atexit.register(_flush_quietly)
+
+
+def _run():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL_MS / 1000)
+        _wakeup.clear()
+        _flush_quietly()
+
+
+def _flush_quietly():
+    try:
+        flush()
+    except Exception as e:
+        print(f"[ERROR] 点赞批量写入失败，稍后重试: {e}")
+
+
+def _current_state(key):
+    """返回 (数据库中的状态, 当前状态)，不在缓冲区中时返回 None"""
+    if key in _pending:
+        return _pending[key]
+    if key in _in_flight:
+        desired = _in_flight[key][1]
+        return desired, desired
+    return None
+
+
+def toggle(project_id, client_token):
+    """
+    在缓冲区中切换点赞状态，返回 (action, 预估点赞数)；项目不存在时返回 (None, 0)。
+    只读取一次数据库，不产生写事务。
+    """
+    global _toggles
+    _ensure_flusher()
+    key = (project_id, str(client_token))
+    conn = database.get_connection()
+
+    while True:
+        with _lock:
+            generation = _generation
+        row = conn.execute('''
+            SELECT stars, EXISTS(
+                SELECT 1 FROM project_likes WHERE project_id = projects.id AND client_token = ?
+            ) AS liked
+            FROM projects WHERE id = ?
+        ''', (key[1], project_id)).fetchone()
+        if row is None:
+            return None, 0
+
+        with _lock:
+            # 读库期间有批次提交，数据库状态可能已过期，重新读取
+            if generation != _generation:
+                continue
+
+            state = _current_state(key)
+            persisted, current = state if state else (bool(row['liked']), bool(row['liked']))
+            desired = not current
+            if desired == persisted:
+                _pending.pop(key, None)
+            else:
+                _pending[key] = (persisted, desired)
+
+            delta = _star_delta.get(project_id, 0) + (1 if desired else -1)
+            if delta:
+                _star_delta[project_id] = delta
+            else:
+                _star_delta.pop(project_id, None)
+            pending_count = len(_pending)
+            _toggles += 1
+            break
+
+    if pending_count >= FLUSH_MAX_EVENTS:
+        _wakeup.set()
+    stars = max(0, (row['stars'] or 0) + delta)
+    return ('liked' if desired else 'unliked'), stars
+
+
+def local_version():
+    """当前 worker 内点赞切换的次数（不跨进程）"""
+    return _toggles
+
+
+def apply_pending(client_token, liked_ids):
+    """把当前 worker 中尚未落库的点赞 / 取消叠加到已点赞集合上"""
+    if not client_token:
+        return liked_ids
+    client_token = str(client_token)
+    with _lock:
+        entries = list(_in_flight.items()) + list(_pending.items())
+    for (project_id, token), (_, desired) in entries:
+        if token != client_token:
+            continue
+        if desired:
+            liked_ids.add(project_id)
+        else:
+            liked_ids.discard(project_id)
+    return liked_ids
+
+
+def flush():
+    """把缓冲区中的点赞在一个事务内批量写入数据库，返回写入的条数"""
+    global _pending, _generation
+    with _lock:
+        if not _pending:
+            return 0
+        batch = _pending
+        _pending = {}
+        _in_flight.update(batch)
+
+    try:
+        with database.transaction(immediate=True) as conn:
+            changes = {}
+            for (project_id, client_token), (_, desired) in batch.items():
+                if desired:
+                    changed = conn.execute('''
+                        INSERT INTO project_likes (project_id, client_token)
+                        SELECT id, ? FROM projects WHERE id = ?
+                        ON CONFLICT (project_id, client_token) DO NOTHING
+                    ''', (client_token, project_id)).rowcount
+                else:
+                    changed = -conn.execute(
+                        'DELETE FROM project_likes WHERE project_id = ? AND client_token = ?',
+                        (project_id, client_token)
+                    ).rowcount
+                if changed:
+                    changes[project_id] = changes.get(project_id, 0) + changed
+
+            # 按实际变更的行数调整点赞数，其他 worker 已写入的记录不会被重复计数
+            conn.executemany(
+                'UPDATE projects SET stars = MAX(COALESCE(stars, 0) + ?, 0) WHERE id = ?',
+                [(delta, project_id) for project_id, delta in changes.items()]
+            )
+            if changes:
+                database.bump_content_version(conn)
+    except Exception:
+        # 写入失败：放回缓冲区，与期间新产生的操作合并后等待下次刷新
+        with _lock:
+            for key, (persisted, desired) in batch.items():
+                _in_flight.pop(key, None)
+                if key in _pending:
+                    desired = _pending[key][1]
+                if desired == persisted:
+                    _pending.pop(key, None)
+                else:
+                    _pending[key] = (persisted, desired)
+        raise
+
+    with _lock:
+        for (project_id, client_token), (_, desired) in batch.items():
+            _in_flight.pop((project_id, client_token), None)
+            delta = _star_delta.get(project_id, 0) - (1 if desired else -1)
+            if delta:
+                _star_delta[project_id] = delta
+            else:
+                _star_delta.pop(project_id, None)
+        _generation += 1
+    return len(batch)
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from werkzeug.security import check_password_hash
+
+import database
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只在进程内限制
+    fcntl = None
+
+# 登录保护：
+# 1. 令牌桶限流，桶状态保存在 SQLite 中，所有 worker 共享：按 IP 限制总尝试次数，
+#    按（用户名, IP）限制对同一账号的尝试。用户名的桶不跨 IP 共享，
+#    其他客户端猜测 admin 的密码不会把真正的管理员锁在门外。
+#    被拒绝的客户端在本 worker 内记住解封时间，之后的请求不访问数据库直接拒绝。
+# 2. 所有 worker 合计同时校验密码（pbkdf2）的请求数不超过 HASH_WORKERS（文件锁槽位），
+#    槽位全被占用时最多等待 HASH_WAIT_SECONDS，仍无空闲槽位才返回繁忙，
+#    管理员的登录不会因为一次撞库请求正好占着槽位就被拒绝。同步 worker 每次只处理一个请求，
+#    等待中的请求同样占着一个同步 worker，设置 HASH_WAIT_SECONDS 为 0 时不等待，
+#    撞库请求最多占住 HASH_WORKERS 个 worker，但管理员更容易遇到繁忙。
+
+# 令牌桶容量与恢复一个令牌所需的秒数
+IP_CAPACITY = int(os.environ.get('HANDSHOP_LOGIN_IP_CAPACITY', 10))
+IP_REFILL_SECONDS = float(os.environ.get('HANDSHOP_LOGIN_IP_REFILL', 30))
+USER_CAPACITY = int(os.environ.get('HANDSHOP_LOGIN_USER_CAPACITY', 5))
+USER_REFILL_SECONDS = float(os.environ.get('HANDSHOP_LOGIN_USER_REFILL', 60))
+
+# 所有 worker 合计同时校验密码的请求数，以及没有空闲槽位时最多等待的秒数
+HASH_WORKERS = int(os.environ.get('HANDSHOP_HASH_WORKERS', 2))
+HASH_WAIT_SECONDS = float(os.environ.get('HANDSHOP_HASH_WAIT', 0.5))
+
+# 等待槽位时的轮询间隔（秒）
+HASH_POLL_SECONDS = 0.05
+
+# 本 worker 内记住的被拒绝客户端上限
+BLOCKED_CACHE_SIZE = 4096
+
+
+class Busy(Exception):
+    """同时校验密码的请求已达上限"""
+
+
+_lock = threading.Lock()
+# key -> 可以再次尝试的时间（time.time()）
+_blocked = {}
+# 没有 fcntl 时的进程内槽位
+_local_slots = None
+
+
+def init_buckets_table():
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS login_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_login_buckets_updated ON login_buckets (updated_at)')
+
+
+def _user_key(ip, username):
+    return f'user:{username.strip().lower()}@{ip}'
+
+
+def _buckets(ip, username):
+    buckets = [(f'ip:{ip}', IP_CAPACITY, IP_REFILL_SECONDS)]
+    if username:
+        buckets.append((_user_key(ip, username), USER_CAPACITY, USER_REFILL_SECONDS))
+    return buckets
+
+
+def _blocked_until(keys, now):
+    with _lock:
+        until = max((_blocked.get(key, 0) for key in keys), default=0)
+    return until if until > now else 0
+
+
+def _remember_block(key, until):
+    with _lock:
+        if len(_blocked) >= BLOCKED_CACHE_SIZE:
+            now = time.time()
+            for stale in [k for k, v in _blocked.items() if v <= now]:
+                del _blocked[stale]
+            if len(_blocked) >= BLOCKED_CACHE_SIZE:
+                _blocked.clear()
+        _blocked[key] = until
+
+
+def acquire(ip, username):
+    """
+    为一次登录尝试从 IP 与（用户名, IP）的令牌桶各取一个令牌。
+    允许时返回 0，被限流时返回需要等待的秒数（不消耗令牌）。
+    """
+    buckets = _buckets(ip, username)
+    now = time.time()
+
+    # 快速拒绝：本 worker 已知被限流的客户端不访问数据库
+    until = _blocked_until([key for key, _, _ in buckets], now)
+    if until:
+        return int(until - now) + 1
+
+    with database.transaction(immediate=True) as conn:
+        states = []
+        for key, capacity, refill in buckets:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM login_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(
+                capacity, row['tokens'] + (now - row['updated_at']) / refill)
+            if tokens < 1:
+                until = now + (1 - tokens) * refill
+                _remember_block(key, until)
+                return int(until - now) + 1
+            states.append((key, tokens - 1))
+
+        conn.executemany('''
+            INSERT INTO login_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+        ''', [(key, tokens, now) for key, tokens in states])
+        # 一天没有活动的桶早已回满，删除即可
+        conn.execute('DELETE FROM login_buckets WHERE updated_at < ?', (now - 86400,))
+    return 0
+
+
+def reset_user(ip, username):
+    """登录成功后恢复该客户端对这个用户名的令牌桶"""
+    if not username:
+        return
+    key = _user_key(ip, username)
+    with database.transaction() as conn:
+        conn.execute('DELETE FROM login_buckets WHERE key = ?', (key,))
+    with _lock:
+        _blocked.pop(key, None)
+
+
+def _try_slot():
+    """不等待地尝试占用一个文件锁槽位，成功时返回持有锁的文件，全部被占用时返回 None"""
+    for index in range(HASH_WORKERS):
+        lock_file = open(f'{database.DB_PATH}.hash{index}.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            continue
+        return lock_file
+    return None
+
+
+@contextmanager
+def _hash_slot():
+    """占用一个密码校验槽位，等待 HASH_WAIT_SECONDS 后仍全部被占用时抛出 Busy"""
+    global _local_slots
+    if fcntl is None:
+        with _lock:
+            if _local_slots is None:
+                _local_slots = threading.BoundedSemaphore(HASH_WORKERS)
+        if not _local_slots.acquire(timeout=HASH_WAIT_SECONDS):
+            raise Busy()
+        try:
+            yield
+        finally:
+            _local_slots.release()
+        return
+
+    deadline = time.monotonic() + HASH_WAIT_SECONDS
+    lock_file = _try_slot()
+    while lock_file is None:
+        if time.monotonic() >= deadline:
+            raise Busy()
+        time.sleep(HASH_POLL_SECONDS)
+        lock_file = _try_slot()
+    try:
+        yield
+    finally:
+        # 关闭文件即释放锁
+        lock_file.close()
+
+
+def check_password(password_hash, password):
+    """占用一个槽位后在当前线程中校验密码，等待超时仍没有空闲槽位时抛出 Busy"""
+    with _hash_slot():
+        return check_password_hash(password_hash, password)
@@ -0,0 +1,264 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# 运行指标：请求耗时、SQL 语句数与耗时、数据库连接数、上传与压缩图编码耗时。
+# 每个进程在内存中累计（每次记录只是一次加锁的字典更新），由后台线程每隔 FLUSH_SECONDS 把快照写入
+# 指标目录下的 metrics-<pid>.json，请求中不做序列化与文件写入；/metrics 合并目录中所有进程的快照，按 Prometheus 文本格式输出。
+# 已退出 worker 的快照保留到下次启动服务（gunicorn 的 on_starting 钩子会清空目录），计数因此不会倒退。
+ENABLED = os.environ.get('HANDSHOP_METRICS', '1') == '1'
+
+# 指标目录，默认为数据库文件旁的 <数据库>.metrics/
+METRICS_DIR = os.environ.get('HANDSHOP_METRICS_DIR')
+
+# 单条 SQL 超过该毫秒数时输出慢查询日志，0 表示不记录
+SLOW_QUERY_MS = float(os.environ.get('HANDSHOP_SLOW_QUERY_MS', 0))
+
+FLUSH_SECONDS = 5
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+ENCODE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# 名称 -> (类型, 说明, 直方图分桶)
+DEFINITIONS = {
+    'handshop_http_requests_total': ('counter', '按端点、方法与状态码统计的请求数', None),
+    'handshop_http_request_duration_seconds': ('histogram', '请求处理耗时（秒）', LATENCY_BUCKETS),
+    'handshop_db_queries_per_request': ('histogram', '每个请求执行的 SQL 语句数', QUERY_COUNT_BUCKETS),
+    'handshop_db_query_duration_seconds': ('histogram', '单条 SQL 的执行耗时（秒）', QUERY_BUCKETS),
+    'handshop_db_slow_queries_total': ('counter', '超过慢查询阈值的 SQL 数', None),
+    'handshop_db_connections_total': ('counter', '新建的数据库连接数', None),
+    'handshop_upload_store_seconds': ('histogram', '上传图片计算哈希并写入磁盘的耗时（秒）', LATENCY_BUCKETS),
+    'handshop_thumbnail_encode_seconds': ('histogram', '单张图片生成全部尺寸压缩图的耗时（秒）', ENCODE_BUCKETS),
+    'handshop_thumbnail_jobs_total': ('counter', '按结果统计的压缩图任务数', None),
+}
+
+_lock = threading.Lock()
+_local = threading.local()
+# (名称, 标签) -> 数值
+_counters = {}
+# (名称, 标签) -> [各分桶计数..., +Inf 分桶计数, 总和]
+_histograms = {}
+_last_flush = 0.0
+_flusher_pid = None
+
+
+def configure(enabled=None, directory=None, slow_query_ms=None):
+    global ENABLED, METRICS_DIR, SLOW_QUERY_MS
+    if enabled is not None:
+        ENABLED = bool(enabled)
+    if directory is not None:
+        METRICS_DIR = directory
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = float(slow_query_ms)
+
+
+def _reset_after_fork():
+    """fork 出的子进程不继承父进程（gunicorn 主进程）的计数"""
+    global _lock, _last_flush
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+    _last_flush = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def inc(name, labels=(), value=1):
+    if not ENABLED:
+        return
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, labels=()):
+    if not ENABLED:
+        return
+    buckets = DEFINITIONS[name][2]
+    index = bisect_left(buckets, value)
+    key = (name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[index] += 1
+        histogram[-1] += value
+
+
+# ==========================================================================
+# 请求与 SQL
+# ==========================================================================
+
+def start_request():
+    _local.started = time.perf_counter()
+    _local.queries = 0
+    _local.db_seconds = 0.0
+
+
+def record_query(sql, seconds):
+    """由 database 的连接在每条 SQL 执行后调用"""
+    _local.queries = getattr(_local, 'queries', 0) + 1
+    _local.db_seconds = getattr(_local, 'db_seconds', 0.0) + seconds
+    observe('handshop_db_query_duration_seconds', seconds)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        inc('handshop_db_slow_queries_total')
+        print(f"[INFO] 慢查询 {seconds * 1000:.1f} ms: {' '.join(sql.split())[:300]}")
+
+
+def finish_request(endpoint, method, status):
+    """记录本次请求，返回 Server-Timing 响应头的值"""
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return None
+    _local.started = None
+    seconds = time.perf_counter() - started
+    queries, db_seconds = _local.queries, _local.db_seconds
+
+    inc('handshop_http_requests_total', (('endpoint', endpoint), ('method', method), ('status', str(status))))
+    observe('handshop_http_request_duration_seconds', seconds, (('endpoint', endpoint),))
+    observe('handshop_db_queries_per_request', queries, (('endpoint', endpoint),))
+    _ensure_flusher()
+    return f'app;dur={seconds * 1000:.2f}, db;dur={db_seconds * 1000:.2f};desc="{queries} queries"'
+
+
+# ==========================================================================
+# 跨进程汇总
+# ==========================================================================
+
+def _directory():
+    if METRICS_DIR:
+        return METRICS_DIR
+    import database
+    return database.DB_PATH + '.metrics'
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def _ensure_flusher():
+    """在当前进程中启动后台写入线程（gunicorn fork 后每个 worker 各自启动一次）"""
+    global _flusher_pid
+    if not ENABLED or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_run_flusher, name='metrics-flusher', daemon=True).start()
+    atexit.register(flush, force=True)
+
+
+def _run_flusher():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        flush(force=True)
+
+
+def flush(force=False):
+    """把本进程的计数写入指标目录（距上次写入不足 FLUSH_SECONDS 时跳过）"""
+    global _last_flush
+    if not ENABLED:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_SECONDS:
+        return
+    _last_flush = now
+    try:
+        directory = _directory()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(_snapshot(), f, ensure_ascii=False)
+        os.replace(f'{path}.tmp', path)
+    except OSError as e:
+        print(f"[ERROR] 写入运行指标失败: {e}")
+
+
+def reset():
+    """清空指标目录（服务启动时调用）"""
+    directory = _directory()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith('metrics-'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _merge():
+    counters, histograms = {}, {}
+    directory = _directory()
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    for name in names:
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in snapshot.get('counters', []):
+            key = (metric, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, values in snapshot.get('histograms', []):
+            key = (metric, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None or len(merged) != len(values):
+                histograms[key] = list(values)
+            else:
+                histograms[key] = [a + b for a, b in zip(merged, values)]
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def collect():
+    """写入本进程的最新计数后合并所有进程，返回 Prometheus 文本格式"""
+    flush(force=True)
+    counters, histograms = _merge()
+
+    lines = []
+    for name, (kind, description, buckets) in DEFINITIONS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(values[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
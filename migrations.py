@@ -0,0 +1,196 @@
+import argparse
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+from werkzeug.security import generate_password_hash
+
+import database
+import login_guard
+import read_model
+import reconcile
+import session_store
+import stats
+import thumbnails
+import transfer
+from project import Project
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，只在单进程下运行
+    fcntl = None
+
+# 数据库结构迁移：已执行到的版本记录在 PRAGMA user_version 中，每个版本只执行一次。
+# 由命令行（python migrations.py）或 gunicorn 主进程的 on_starting 钩子在启动 worker 前执行，
+# worker 导入 app 时不再访问数据库。多个进程同时执行时通过文件锁排队。
+# 新增迁移时在 MIGRATIONS 末尾追加，不要修改或删除已发布的步骤。
+
+
+def create_base_tables():
+    """项目、管理员、点赞记录表，以及默认管理员"""
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                description TEXT,
+                category TEXT NOT NULL,
+                status TEXT NOT NULL,
+                image_path TEXT,
+                thumbnail_path TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP NULL,
+                duration_days INTEGER,
+                stars INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS admins (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS project_likes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER NOT NULL,
+                client_token TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+            )
+        ''')
+        # 只在没有任何管理员（新建的数据库）时添加默认管理员；旧数据库升级时管理员可能已改名或删除，
+        # 不能重新建出使用公开默认密码的账号。检查与插入在迁移的同一个写事务内
+        if conn.execute('SELECT 1 FROM admins LIMIT 1').fetchone() is None:
+            conn.execute(
+                'INSERT INTO admins (username, password_hash) VALUES (?, ?)',
+                ('admin', generate_password_hash('admin123'))
+            )
+
+
+def migrate_duration_days():
+    """所有状态为已完成，但 duration_days 为空的数据，直接在 SQL 中计算天数"""
+    with database.transaction() as conn:
+        count = conn.execute(f'''
+            UPDATE projects SET duration_days = {Project.DURATION_SQL}
+            WHERE status='已完成' AND duration_days IS NULL
+              AND date(created_at) IS NOT NULL AND date(completed_at) IS NOT NULL
+        ''').rowcount
+    if count > 0:
+        print(f"[INFO] 成功自动迁移并计算了 {count} 个已完成项目的历史天数！")
+
+
+# (版本号, 说明, 迁移函数)，版本号从 1 开始连续递增
+MIGRATIONS = [
+    (1, '基础数据表与默认管理员', create_base_tables),
+    (2, '排序生成列与索引，日期统一为 ISO 格式', Project.init_sort_columns),
+    (3, '补算已完成项目的用时天数', migrate_duration_days),
+    (4, '点赞唯一索引', Project.init_likes_table),
+    (5, '压缩图任务表与多尺寸压缩图字段', thumbnails.init_jobs_table),
+    (6, '内容版本计数器', database.init_content_version),
+    (7, '项目变更日志与触发器', read_model.init_change_log),
+    (8, '服务端会话表', session_store.init_sessions_table),
+    (9, '登录限流令牌桶', login_guard.init_buckets_table),
+    (10, '标题 / 描述全文索引', Project.init_search_index),
+    (11, '批量导入记录', transfer.init_imports_table),
+    (12, '统计汇总表与触发器', stats.init_rollups),
+    (13, '上传目录对账进度与压缩图路径索引', reconcile.init_state_table),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# 需要的最低 SQLite 版本：点赞与压缩图任务使用 RETURNING（3.35），全文索引使用 FTS5 trigram 分词（3.34）
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+
+def check_sqlite_version():
+    """Python 链接的 SQLite 过旧时直接报错，而不是在点赞或迁移时才失败"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        required = '.'.join(map(str, MIN_SQLITE_VERSION))
+        raise RuntimeError(
+            f"需要 SQLite {required} 及以上版本，当前 Python 使用的是 {sqlite3.sqlite_version}"
+            f"（RETURNING 语句与 FTS5 trigram 分词），请升级 Python 或其链接的 SQLite"
+        )
+
+
+def current_version():
+    return database.get_connection().execute('PRAGMA user_version').fetchone()[0]
+
+
+@contextmanager
+def _file_lock():
+    """同一数据库的迁移在多个进程间串行执行"""
+    if fcntl is None:
+        yield
+        return
+    with open(database.DB_PATH + '.migrate.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate():
+    """执行所有未执行的迁移，返回执行的步骤数"""
+    check_sqlite_version()
+    applied = 0
+    with _file_lock():
+        version = current_version()
+        for target, description, step in MIGRATIONS:
+            if target <= version:
+                continue
+            # 每个步骤与版本号在同一个事务内提交，中途失败时下次从该步骤重新执行
+            with database.transaction(immediate=True) as conn:
+                step()
+                conn.execute(f'PRAGMA user_version = {int(target)}')
+            print(f"[INFO] 数据库迁移 {target}: {description}")
+            applied += 1
+    return applied
+
+
+_checked_pid = None
+
+
+def ensure_current():
+    """
+    worker 处理第一个请求时确认数据库已迁移到最新版本（每个进程只检查一次），
+    未通过命令行或 gunicorn 钩子迁移时在这里补做。
+    """
+    global _checked_pid
+    if _checked_pid == os.getpid():
+        return
+    check_sqlite_version()
+    if current_version() < LATEST_VERSION:
+        migrate()
+    _checked_pid = os.getpid()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库结构迁移')
+    parser.add_argument('command', nargs='?', choices=['upgrade', 'status'], default='upgrade')
+    args = parser.parse_args()
+
+    try:
+        check_sqlite_version()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == 'status':
+        version = current_version()
+        print(f"数据库: {database.DB_PATH}")
+        print(f"当前版本: {version} / 最新版本: {LATEST_VERSION}")
+        for target, description, _ in MIGRATIONS:
+            print(f"  [{'x' if target <= version else ' '}] {target}: {description}")
+    else:
+        applied = migrate()
+        print(f"数据库已是最新版本 {LATEST_VERSION}（本次执行 {applied} 个迁移）")
+
+
+if __name__ == '__main__':
+    main()
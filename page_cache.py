@@ -0,0 +1,68 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# 公开页面的渲染结果缓存：首页与分类页对所有访客相同，只有点赞状态不同。
+# 缓存键包含数据库中的内容版本（content_version），任何 worker 写入后版本变化，
+# 各 worker 的旧缓存自然失效，不需要跨进程通知。点赞状态在取出缓存后按访客替换。
+ENABLED = os.environ.get('HANDSHOP_PAGE_CACHE', '1') == '1'
+
+# 每个 worker 最多缓存的页面数
+MAX_ENTRIES = int(os.environ.get('HANDSHOP_PAGE_CACHE_SIZE', 256))
+
+# 模板中未点赞的图标：<i data-like-id="项目id" class="like-icon far fa-heart"
+LIKE_ICON_RE = re.compile(r'data-like-id="(\d+)" class="like-icon far ')
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_version = None
+
+
+def configure(enabled=None, max_entries=None):
+    global ENABLED, MAX_ENTRIES
+    if enabled is not None:
+        ENABLED = bool(enabled)
+    if max_entries is not None:
+        MAX_ENTRIES = int(max_entries)
+
+
+def get(version, key):
+    """返回缓存的 (html, 项目 id 列表)，版本变化时清空整个缓存"""
+    global _version
+    with _lock:
+        if _version is None or version > _version:
+            _version = version
+            _entries.clear()
+            return None
+        if version < _version:
+            # 其他线程已看到更新的版本，本次不使用缓存
+            return None
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+        return entry
+
+
+def put(version, key, html, project_ids):
+    with _lock:
+        if _version != version:
+            return
+        _entries[key] = (html, tuple(project_ids))
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def apply_liked(html, liked_ids):
+    """把访客点过赞的项目图标替换为实心（页面按未点赞状态渲染）"""
+    if not liked_ids:
+        return html
+    return LIKE_ICON_RE.sub(
+        lambda m: m.group(0).replace(' far ', ' fas ') if int(m.group(1)) in liked_ids else m.group(0),
+        html
+    )
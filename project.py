@@ -1,15 +1,83 @@
-import sqlite3
 import os
-import uuid
-from werkzeug.utils import secure_filename
-from datetime import datetime
-from PIL import Image
+import time
+import json
+import base64
+import threading
+from collections import OrderedDict
+from datetime import datetime, date
+
+import database
+import like_buffer
+import metrics
+import read_model
+import thumbnails
+import upload_ingest
 
 class Project:
     # 默认图片路径
     DEFAULT_IMAGE = 'undo.png'
-    
-    def __init__(self, id=None, title=None, description=None, category=None, status=None, image_path=None, created_at=None, completed_at=None, thumbnail_path=None, duration_days=None , stars=None):
+
+    # 上传图片按内容哈希命名，相同图片只存一份；被多个项目引用时，最后一个引用移除后才删除文件。
+    # 刚上传（或刚被复用）的文件在 UPLOAD_GRACE_SECONDS 内不删除，避免与正在保存的同图项目冲突；
+    # 这类文件在宽限期过后由后台定时器再检查一次，进程先退出时留给 reconcile.py --delete 清理。
+    UPLOAD_DIR = 'uploads'
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    UPLOAD_GRACE_SECONDS = 60
+
+    # 列表排序：制作中 → 排队中 → 已完成，同状态内按时间倒序，id 兜底保证分页顺序稳定。
+    # 排序键以生成列 status_rank / sort_date 持久化，配合复合索引可直接按索引顺序读取。
+    SORT_RANK_SQL = '''
+        CASE status
+            WHEN '制作中' THEN 0
+            WHEN '排队中' THEN 1
+            WHEN '已完成' THEN 2
+            ELSE 3
+        END'''
+    SORT_DATE_SQL = '''
+        COALESCE(CASE
+            WHEN status = '已完成' AND completed_at IS NOT NULL THEN completed_at
+            ELSE created_at
+        END, '')'''
+    ORDER_BY_SQL = 'status_rank ASC, sort_date DESC, id DESC'
+
+    # 已完成项目的整数用时天数（保证非负）
+    DURATION_SQL = '''
+        CASE
+            WHEN status = '已完成' AND created_at IS NOT NULL AND completed_at IS NOT NULL
+            THEN MAX(0, CAST(julianday(date(completed_at)) - julianday(date(created_at)) AS INTEGER))
+        END'''
+
+    # 历史数据中可能出现的日期写法，统一后按 ISO 格式存储
+    DATE_INPUT_FORMATS = (
+        '%Y-%m-%d',
+        '%Y-%m-%d %H:%M:%S',
+        '%Y-%m-%d %H:%M',
+        '%Y-%m-%d %H:%M:%S.%f',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%dT%H:%M',
+        '%Y/%m/%d',
+        '%Y/%m/%d %H:%M:%S',
+        '%Y.%m.%d',
+    )
+
+    # 搜索结果中高亮片段的起止标记（输出前转义并替换为 <mark>）
+    SEARCH_MARK_START = '\x02'
+    SEARCH_MARK_END = '\x03'
+
+    # 按访客缓存的点赞状态：client_token -> {project_id: 是否已点赞}
+    LIKED_CACHE_SIZE = 1024
+    _liked_cache = OrderedDict()
+    _liked_cache_lock = threading.Lock()
+    _liked_cache_local = threading.local()
+
+    # 实例只保存这些字段，不再为每个对象分配 __dict__
+    __slots__ = (
+        'id', 'title', 'description', 'category', 'status', 'image_path', 'thumbnail_path',
+        'duration_days', 'stars', 'thumbnail_variants',
+        '_created_at', '_completed_at', '_formatted',
+    )
+
+    def __init__(self, id=None, title=None, description=None, category=None, status=None, image_path=None, created_at=None, completed_at=None, thumbnail_path=None, duration_days=None , stars=None, thumbnail_variants=None):
         self.id = id
         self.title = title
         self.description = description
@@ -17,12 +85,39 @@ class Project:
         self.status = status
         # 如果没有提供图片路径，使用默认图片
         self.image_path = image_path if image_path else self.DEFAULT_IMAGE
-        self.created_at = self._parse_datetime(created_at)
-        self.completed_at = self._parse_datetime(completed_at)
+        self.created_at = created_at
+        self.completed_at = completed_at
         self.thumbnail_path = thumbnail_path if thumbnail_path else self.DEFAULT_IMAGE
         self.duration_days = duration_days
         self.stars = stars
-    
+        # 多尺寸压缩图（JSON：{宽度: 路径}），由压缩图后台任务写入
+        self.thumbnail_variants = thumbnail_variants
+
+    # created_at / completed_at 保存原始值，第一次读取时才解析为 datetime，格式化结果按格式缓存
+    @property
+    def created_at(self):
+        value = self._created_at
+        if value is not None and not isinstance(value, datetime):
+            value = self._created_at = self._parse_datetime(value)
+        return value
+
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+        self._formatted = None
+
+    @property
+    def completed_at(self):
+        value = self._completed_at
+        if value is not None and not isinstance(value, datetime):
+            value = self._completed_at = self._parse_datetime(value)
+        return value
+
+    @completed_at.setter
+    def completed_at(self, value):
+        self._completed_at = value
+        self._formatted = None
+
     def _parse_datetime(self, dt_value):
         """将日期时间值转换为 datetime 对象"""
         if dt_value is None:
@@ -30,18 +125,22 @@ class Project:
         
         if isinstance(dt_value, datetime):
             return dt_value
+
+        if isinstance(dt_value, date):
+            return datetime(dt_value.year, dt_value.month, dt_value.day)
         
         if isinstance(dt_value, str):
-            # 尝试解析多种日期时间格式
-            formats = [
-                '%Y-%m-%d',
-                '%Y-%m-%d %H:%M:%S',
-                '%Y-%m-%d %H:%M',
-            ]
-            
-            for fmt in formats:
+            text = dt_value.strip()
+            # 数据库中统一存储 ISO 格式，一次解析即可
+            try:
+                return datetime.fromisoformat(text)
+            except ValueError:
+                pass
+
+            # 兼容其他写法
+            for fmt in self.DATE_INPUT_FORMATS:
                 try:
-                    return datetime.strptime(dt_value.strip(), fmt)
+                    return datetime.strptime(text, fmt)
                 except ValueError:
                     continue
         
@@ -49,240 +148,637 @@ class Project:
         return dt_value
 
     @classmethod
-    def get_all(cls, category=None):
-        conn = sqlite3.connect('handshop.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+    def _from_row(cls, row):
+        """由查询结果（sqlite3.Row 或读模型中的 dict）直接构造，不经过 __init__"""
+        p = cls.__new__(cls)
+        p.id = row['id']
+        p.title = row['title']
+        p.description = row['description']
+        p.category = row['category']
+        p.status = row['status']
+        p.image_path = row['image_path'] or cls.DEFAULT_IMAGE
+        p.thumbnail_path = row['thumbnail_path'] or cls.DEFAULT_IMAGE
+        p._created_at = row['created_at']
+        p._completed_at = row['completed_at']
+        p._formatted = None
+        p.duration_days = row['duration_days']
+        p.stars = row['stars']
+        p.thumbnail_variants = row['thumbnail_variants']
+        return p
+
+    @staticmethod
+    def _where(category=None, status=None, exclude_status=None):
+        """根据分类 / 状态拼接 WHERE 条件"""
+        clauses, params = [], []
         if category:
-            cursor.execute('''
-                SELECT * FROM projects 
-                WHERE category=?
-                ORDER BY 
-                    CASE status 
-                        WHEN '制作中' THEN 0
-                        WHEN '排队中' THEN 1
-                        WHEN '已完成' THEN 2
-                        ELSE 3
-                    END,
-                    CASE 
-                        WHEN status = '已完成' AND completed_at IS NOT NULL THEN completed_at
-                        ELSE created_at
-                    END DESC
-            ''', (category,))
+            clauses.append('category = ?')
+            params.append(category)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if exclude_status:
+            clauses.append('status != ?')
+            params.append(exclude_status)
+        return clauses, params
+
+    @staticmethod
+    def _where_sql(clauses):
+        return f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    @classmethod
+    def get_all(cls, category=None):
+        if read_model.active():
+            return [cls._from_row(row) for row in read_model.select(category)]
+        clauses, params = cls._where(category)
+        cursor = database.get_connection().cursor()
+        cursor.execute(f'SELECT * FROM projects {cls._where_sql(clauses)} ORDER BY {cls.ORDER_BY_SQL}', params)
+        return [cls._from_row(row) for row in cursor.fetchall()]
+
+    @classmethod
+    def count(cls, category=None, status=None):
+        """统计符合条件的项目数量"""
+        if read_model.active():
+            return len(read_model.select(category, status))
+        clauses, params = cls._where(category, status)
+        cursor = database.get_connection().cursor()
+        cursor.execute(f'SELECT COUNT(*) FROM projects {cls._where_sql(clauses)}', params)
+        return cursor.fetchone()[0]
+
+    @classmethod
+    def get_page(cls, category=None, status=None, page=1, per_page=6):
+        """按页码分页查询（LIMIT / OFFSET），page 从 1 开始"""
+        page = max(1, page)
+        if read_model.active():
+            rows = read_model.select(category, status)
+            return [cls._from_row(row) for row in rows[(page - 1) * per_page:page * per_page]]
+        clauses, params = cls._where(category, status)
+        cursor = database.get_connection().cursor()
+        cursor.execute(f'''
+            SELECT * FROM projects {cls._where_sql(clauses)}
+            ORDER BY {cls.ORDER_BY_SQL}
+            LIMIT ? OFFSET ?
+        ''', (*params, per_page, (page - 1) * per_page))
+        return [cls._from_row(row) for row in cursor.fetchall()]
+
+    @classmethod
+    def get_latest(cls, limit=4, category=None):
+        """按列表排序取前 limit 个项目（首页展示用）"""
+        return cls.get_page(category, page=1, per_page=limit)
+
+    @classmethod
+    def get_unfinished(cls, category=None):
+        """未完成（制作中 / 排队中）的项目，过滤在 SQL 中完成（管理面板用）"""
+        if read_model.active():
+            return [cls._from_row(row) for row in read_model.select(category, exclude_status='已完成')]
+        clauses, params = cls._where(category, exclude_status='已完成')
+        cursor = database.get_connection().cursor()
+        cursor.execute(f'SELECT * FROM projects {cls._where_sql(clauses)} ORDER BY {cls.ORDER_BY_SQL}', params)
+        return [cls._from_row(row) for row in cursor.fetchall()]
+
+    @classmethod
+    def get_after(cls, cursor_token=None, category=None, status=None, limit=6):
+        """
+        游标（keyset）分页：从 cursor_token 之后继续取 limit 条，翻得再深也不用跳过前面的行。
+        返回 (projects, next_cursor)，没有更多数据时 next_cursor 为 None。
+        """
+        position = cls.decode_cursor(cursor_token) if cursor_token else None
+        if read_model.active():
+            rows = read_model.select(category, status)
+            start = read_model.after(rows, position) if position else 0
+            rows = rows[start:start + limit + 1]
         else:
-            cursor.execute('''
-                SELECT * FROM projects 
-                ORDER BY 
-                    CASE status 
-                        WHEN '制作中' THEN 0
-                        WHEN '排队中' THEN 1
-                        WHEN '已完成' THEN 2
-                        ELSE 3
-                    END,
-                    CASE 
-                        WHEN status = '已完成' AND completed_at IS NOT NULL THEN completed_at
-                        ELSE created_at
-                    END DESC
+            rows = cls._get_after_rows(position, category, status, limit)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = cls.encode_cursor(last['status_rank'], last['sort_date'], last['id'])
+        return [cls._from_row(row) for row in rows], next_cursor
+
+    @classmethod
+    def _get_after_rows(cls, position, category=None, status=None, limit=6):
+        """在 SQL 中按游标取 limit + 1 行"""
+        clauses, params = cls._where(category, status)
+        cursor = database.get_connection().cursor()
+        rows = []
+
+        if position:
+            rank, sort_date, last_id = position
+            # 1. 先取同一状态内、位于游标之后的行（索引范围扫描）
+            cursor.execute(f'''
+                SELECT * FROM projects
+                {cls._where_sql(clauses + ['status_rank = ?', '(sort_date, id) < (?, ?)'])}
+                ORDER BY {cls.ORDER_BY_SQL}
+                LIMIT ?
+            ''', (*params, rank, sort_date, last_id, limit + 1))
+            rows = cursor.fetchall()
+            # 2. 不够再从后续状态继续取
+            clauses = clauses + ['status_rank > ?']
+            params = params + [rank]
+
+        if len(rows) <= limit:
+            cursor.execute(f'''
+                SELECT * FROM projects {cls._where_sql(clauses)}
+                ORDER BY {cls.ORDER_BY_SQL}
+                LIMIT ?
+            ''', (*params, limit + 1 - len(rows)))
+            rows += cursor.fetchall()
+        return rows
+
+    @staticmethod
+    def encode_cursor(rank, sort_date, project_id):
+        raw = json.dumps([rank, sort_date, project_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(token):
+        """解析游标，格式不正确时返回 None（视为从头开始）"""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            rank, sort_date, project_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return int(rank), str(sort_date), int(project_id)
+        except (ValueError, TypeError):
+            return None
+
+    @classmethod
+    def init_search_index(cls):
+        """
+        建立标题 / 描述的 FTS5 全文索引（trigram 分词，中文可按任意三字以上片段检索），
+        由触发器与 projects 保持同步；首次建立时回填已有项目。
+        """
+        with database.transaction() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='projects_fts'"
+            ).fetchone()
+            conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(
+                    title, description,
+                    content='projects', content_rowid='id',
+                    tokenize='trigram'
+                )
             ''')
-        
-        projects = []
-        for row in cursor.fetchall():
-            p = cls()
-            p.id = row['id']
-            p.title = row['title']
-            p.description = row['description']
-            p.category = row['category']
-            p.status = row['status']
-            p.image_path = row['image_path']
-            p.thumbnail_path = row['thumbnail_path']
-            p.created_at = row['created_at']
-            p.completed_at = row['completed_at']
-            p.duration_days = row['duration_days'] if 'duration_days' in row.keys() else None
-            p.stars = row['stars'] if 'stars' in row.keys() else None
-            
-            projects.append(p)
-        
-        conn.close()
-        return projects
-    
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS projects_fts_insert AFTER INSERT ON projects
+                BEGIN
+                    INSERT INTO projects_fts (rowid, title, description)
+                    VALUES (NEW.id, NEW.title, NEW.description);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS projects_fts_delete AFTER DELETE ON projects
+                BEGIN
+                    INSERT INTO projects_fts (projects_fts, rowid, title, description)
+                    VALUES ('delete', OLD.id, OLD.title, OLD.description);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS projects_fts_update AFTER UPDATE OF title, description ON projects
+                BEGIN
+                    INSERT INTO projects_fts (projects_fts, rowid, title, description)
+                    VALUES ('delete', OLD.id, OLD.title, OLD.description);
+                    INSERT INTO projects_fts (rowid, title, description)
+                    VALUES (NEW.id, NEW.title, NEW.description);
+                END
+            ''')
+            if not exists:
+                conn.execute("INSERT INTO projects_fts (projects_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _search_terms(query):
+        """拆分关键词：三个字以上的走全文索引，更短的（trigram 无法索引）用 LIKE 在结果中过滤"""
+        terms = [term for term in (query or '').split() if term][:8]
+        indexed = [term for term in terms if len(term) >= 3]
+        short = [term for term in terms if len(term) < 3]
+        # 每个词作为短语查询，双引号转义后不会被当作 FTS5 语法
+        match = ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in indexed)
+        return match, short
+
+    @classmethod
+    def search(cls, query, page=1, per_page=6):
+        """
+        全文搜索，返回 (结果, 总数)。结果为 [(项目, 高亮标题, 描述摘要)]，
+        高亮部分以 SEARCH_MARK_START / SEARCH_MARK_END 标记，由调用方转义后替换为 HTML。
+        """
+        match, short = cls._search_terms(query)
+        if not match and not short:
+            return [], 0
+        page = max(1, page)
+        offset = (page - 1) * per_page
+        conn = database.get_connection()
+
+        like_clauses, like_params = [], []
+        for term in short:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            like_clauses.append("(p.title LIKE ? ESCAPE '\\' OR p.description LIKE ? ESCAPE '\\')")
+            like_params += [pattern, pattern]
+
+        if not match:
+            # 只有一两个字的关键词时无法使用 trigram 索引，退回扫描（按列表顺序）
+            where = ' AND '.join(like_clauses)
+            total = conn.execute(f'SELECT COUNT(*) FROM projects p WHERE {where}', like_params).fetchone()[0]
+            rows = conn.execute(f'''
+                SELECT p.* FROM projects p WHERE {where}
+                ORDER BY {cls.ORDER_BY_SQL}
+                LIMIT ? OFFSET ?
+            ''', like_params + [per_page, offset]).fetchall()
+            return [(cls._from_row(row), row['title'], (row['description'] or '')[:60]) for row in rows], total
+
+        # 1. 先只在索引中计数并按 bm25 相关度（标题权重高于描述）取出当前页的 id
+        if like_clauses:
+            source = 'projects_fts JOIN projects p ON p.id = projects_fts.rowid'
+            where = ' AND '.join(['projects_fts MATCH ?'] + like_clauses)
+        else:
+            source, where = 'projects_fts', 'projects_fts MATCH ?'
+        params = [match] + like_params
+        total = conn.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', params).fetchone()[0]
+        ids = [row[0] for row in conn.execute(f'''
+            SELECT projects_fts.rowid FROM {source} WHERE {where}
+            ORDER BY bm25(projects_fts, 10.0, 1.0), projects_fts.rowid DESC
+            LIMIT ? OFFSET ?
+        ''', params + [per_page, offset])]
+        if not ids:
+            return [], total
+
+        # 2. 只为当前页生成高亮与摘要
+        placeholders = ', '.join('?' * len(ids))
+        start, end = cls.SEARCH_MARK_START, cls.SEARCH_MARK_END
+        rows = {row['rowid']: row for row in conn.execute(f'''
+            SELECT projects_fts.rowid AS rowid, p.*,
+                   highlight(projects_fts, 0, ?, ?) AS title_highlight,
+                   snippet(projects_fts, 1, ?, ?, '…', 24) AS description_snippet
+            FROM projects_fts JOIN projects p ON p.id = projects_fts.rowid
+            WHERE projects_fts MATCH ? AND projects_fts.rowid IN ({placeholders})
+        ''', [start, end, start, end, match] + ids)}
+
+        return [
+            (cls._from_row(rows[i]), rows[i]['title_highlight'], rows[i]['description_snippet'])
+            for i in ids if i in rows
+        ], total
+
     @classmethod
     def init_likes_table(cls):
         """初始化点赞防刷记录表"""
-        conn = sqlite3.connect('handshop.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS project_likes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER NOT NULL,
-                client_token TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with database.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS project_likes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project_id INTEGER NOT NULL,
+                    client_token TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+                )
+            ''')
+
+            index = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_project_likes_unique'"
+            ).fetchone()
+            if not index:
+                # 建唯一索引前清理并发写入留下的重复点赞，并按实际记录重算点赞数
+                removed = conn.execute('''
+                    DELETE FROM project_likes WHERE id NOT IN (
+                        SELECT MIN(id) FROM project_likes GROUP BY project_id, client_token
+                    )
+                ''').rowcount
+                conn.execute('''
+                    CREATE UNIQUE INDEX idx_project_likes_unique
+                    ON project_likes (project_id, client_token)
+                ''')
+                if removed > 0:
+                    conn.execute('''
+                        UPDATE projects SET stars = (
+                            SELECT COUNT(*) FROM project_likes WHERE project_likes.project_id = projects.id
+                        )
+                    ''')
+                    print(f"[INFO] 清理了 {removed} 条重复点赞记录")
+
+            # 按访客查询点赞状态用
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_project_likes_token
+                ON project_likes (client_token, project_id)
+            ''')
+
+    @classmethod
+    def init_sort_columns(cls):
+        """
+        为列表排序添加生成列与复合索引，并把历史数据中的日期统一为 ISO 格式。
+        可重复执行，已完成的步骤会被跳过。
+        """
+        conn = database.get_connection()
+        columns = {row['name'] for row in conn.execute('PRAGMA table_xinfo(projects)')}
+
+        with database.transaction() as conn:
+            if 'status_rank' not in columns:
+                conn.execute(f'''
+                    ALTER TABLE projects ADD COLUMN status_rank INTEGER
+                    GENERATED ALWAYS AS ({cls.SORT_RANK_SQL}) VIRTUAL
+                ''')
+            if 'sort_date' not in columns:
+                conn.execute(f'''
+                    ALTER TABLE projects ADD COLUMN sort_date TEXT
+                    GENERATED ALWAYS AS ({cls.SORT_DATE_SQL}) VIRTUAL
+                ''')
+
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_projects_category_sort
+                ON projects (category, status_rank, sort_date DESC, id DESC)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_projects_status_sort
+                ON projects (status, status_rank, sort_date DESC, id DESC)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_projects_sort
+                ON projects (status_rank, sort_date DESC, id DESC)
+            ''')
+
+            # 只处理不符合 YYYY-MM-DD[ HH:MM:SS] 的旧数据
+            iso_date = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+            iso_datetime = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]'"
+            rows = conn.execute(f'''
+                SELECT id, created_at, completed_at FROM projects
+                WHERE (created_at IS NOT NULL AND NOT (created_at GLOB {iso_date} OR created_at GLOB {iso_datetime}))
+                   OR (completed_at IS NOT NULL AND NOT (completed_at GLOB {iso_date} OR completed_at GLOB {iso_datetime}))
+            ''').fetchall()
+
+            count = 0
+            for row in rows:
+                created_at = cls._normalize_date(row['created_at']) or row['created_at']
+                completed_at = cls._normalize_date(row['completed_at']) or row['completed_at']
+                if (created_at, completed_at) != (row['created_at'], row['completed_at']):
+                    conn.execute(
+                        'UPDATE projects SET created_at = ?, completed_at = ? WHERE id = ?',
+                        (created_at, completed_at, row['id'])
+                    )
+                    count += 1
+
+        if count > 0:
+            print(f"[INFO] 已将 {count} 个项目的日期统一为 ISO 格式")
 
     @classmethod
     def toggle_like(cls, project_id, client_token):
-        conn = sqlite3.connect('handshop.db', timeout=3.0)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            # 1. 检查项目是否存在
-            cursor.execute('SELECT id, stars FROM projects WHERE id = ?', (project_id,))
-            project = cursor.fetchone()
-            if not project:
-                return None, 0
-            
-            current_stars = project['stars'] if project['stars'] is not None else 0
+        """
+        切换点赞状态，返回 (action, stars)；项目不存在时返回 (None, 0)。
+        整个过程在一个 BEGIN IMMEDIATE 事务内完成，点赞数由 SQL 原子增减，多 worker 并发也不会丢失更新。
+        开启写回缓冲时只在内存中登记，由后台线程批量写入。
+        """
+        cls._liked_cache_forget(client_token)
+        if like_buffer.ENABLED:
+            return like_buffer.toggle(project_id, client_token)
 
-            # 2. 检查是否已经点过赞
-            cursor.execute(
-                'SELECT id FROM project_likes WHERE project_id = ? AND client_token = ?',
-                (project_id, str(client_token))
-            )
-            existing_like = cursor.fetchone()
-
-            if existing_like:
-                cursor.execute(
-                    'DELETE FROM project_likes WHERE project_id = ? AND client_token = ?', (project_id, str(client_token)))
-                new_stars = max(0, current_stars - 1)
-                cursor.execute('UPDATE projects SET stars = ? WHERE id = ?', (new_stars, project_id))
-                conn.commit()
-                return 'unliked', new_stars
+        client_token = str(client_token)
+        with database.transaction(immediate=True) as conn:
+            # 1. 已点过赞则直接删除
+            removed = conn.execute(
+                'DELETE FROM project_likes WHERE project_id = ? AND client_token = ? RETURNING id',
+                (project_id, client_token)
+            ).fetchall()
+
+            if removed:
+                action = 'unliked'
+                row = conn.execute(
+                    'UPDATE projects SET stars = MAX(COALESCE(stars, 0) - 1, 0) WHERE id = ? RETURNING stars',
+                    (project_id,)
+                ).fetchone()
             else:
-                cursor.execute(
-                    'INSERT INTO project_likes (project_id, client_token) VALUES (?, ?)', (project_id, str(client_token)))
-                new_stars = current_stars + 1
-                cursor.execute('UPDATE projects SET stars = ? WHERE id = ?', (new_stars, project_id))
-                conn.commit()
-                return 'liked', new_stars
-        finally:
-            conn.close()
+                # 2. 否则插入点赞记录（项目不存在时不会插入任何行）
+                inserted = conn.execute('''
+                    INSERT INTO project_likes (project_id, client_token)
+                    SELECT id, ? FROM projects WHERE id = ?
+                    ON CONFLICT (project_id, client_token) DO NOTHING
+                ''', (client_token, project_id)).rowcount
+                if not inserted:
+                    return None, 0
+                action = 'liked'
+                row = conn.execute(
+                    'UPDATE projects SET stars = COALESCE(stars, 0) + 1 WHERE id = ? RETURNING stars',
+                    (project_id,)
+                ).fetchone()
+
+            if row is None:
+                return None, 0
+            database.bump_content_version(conn)
+            return action, row['stars']
 
     @classmethod
-    def get_liked_project_ids(cls, client_token):
+    def get_liked_project_ids(cls, client_token, project_ids=None):
+        """
+        返回该访客点过赞的项目 id 集合。
+        传入 project_ids 时只查询当前页面要渲染的项目，并使用按访客缓存的结果。
+        """
         if not client_token:
             return set()
-        conn = sqlite3.connect('handshop.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT project_id FROM project_likes WHERE client_token = ?', (str(client_token),))
-        rows = cursor.fetchall()
-        conn.close()
+        client_token = str(client_token)
 
-        return {row[0] for row in rows}
+        if project_ids is None:
+            cursor = database.get_connection().cursor()
+            cursor.execute(
+                'SELECT project_id FROM project_likes WHERE client_token = ?', (client_token,))
+            liked_ids = {row[0] for row in cursor.fetchall()}
+        else:
+            project_ids = set(project_ids)
+            known = cls._liked_cache_lookup(client_token)
+            missing = project_ids - known.keys()
+            if missing:
+                placeholders = ', '.join('?' * len(missing))
+                cursor = database.get_connection().cursor()
+                cursor.execute(f'''
+                    SELECT project_id FROM project_likes
+                    WHERE client_token = ? AND project_id IN ({placeholders})
+                ''', (client_token, *missing))
+                found = {row[0] for row in cursor.fetchall()}
+                known = cls._liked_cache_store(client_token, {pid: pid in found for pid in missing})
+            liked_ids = {pid for pid in project_ids if known.get(pid)}
+
+        if like_buffer.ENABLED:
+            like_buffer.apply_pending(client_token, liked_ids)
+        return liked_ids
+
+    @classmethod
+    def _liked_cache_lookup(cls, client_token):
+        """读取缓存；其他连接（其他 worker / 线程）写过数据库时整体失效"""
+        version = database.data_version()
+        with cls._liked_cache_lock:
+            if getattr(cls._liked_cache_local, 'version', None) != version:
+                cls._liked_cache_local.version = version
+                cls._liked_cache.clear()
+                return {}
+            known = cls._liked_cache.get(client_token)
+            if known is None:
+                return {}
+            cls._liked_cache.move_to_end(client_token)
+            return dict(known)
+
+    @classmethod
+    def _liked_cache_store(cls, client_token, entries):
+        with cls._liked_cache_lock:
+            known = cls._liked_cache.setdefault(client_token, {})
+            known.update(entries)
+            cls._liked_cache.move_to_end(client_token)
+            while len(cls._liked_cache) > cls.LIKED_CACHE_SIZE:
+                cls._liked_cache.popitem(last=False)
+            return dict(known)
+
+    @classmethod
+    def _liked_cache_forget(cls, client_token):
+        with cls._liked_cache_lock:
+            cls._liked_cache.pop(str(client_token), None)
 
     @classmethod
     def get_by_id(cls, project_id):
-        conn = sqlite3.connect('handshop.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM projects WHERE id=?', (project_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            p = cls(
-                id=row['id'],
-                title=row['title'],
-                description=row['description'],
-                category=row['category'],
-                status=row['status'],
-                image_path=row['image_path'],
-                created_at=row['created_at'],
-                completed_at=row['completed_at'],
-                thumbnail_path=row['thumbnail_path'],
-                duration_days=row['duration_days'] if 'duration_days' in row.keys() else None,
-                stars=row['stars'] if 'stars' in row.keys() else None
-            )
-            return p
+        if read_model.active():
+            row = read_model.get(project_id)
+        else:
+            cursor = database.get_connection().cursor()
+            cursor.execute('SELECT * FROM projects WHERE id=?', (project_id,))
+            row = cursor.fetchone()
+        return cls._from_row(row) if row else None
+
+    @classmethod
+    def _normalize_date(cls, value):
+        """把日期转换为可按字符串排序的 YYYY-MM-DD（带时间时为 YYYY-MM-DD HH:MM:SS），无法识别时返回 None"""
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S' if value.time() != datetime.min.time() else '%Y-%m-%d')
+        if isinstance(value, date):
+            return value.isoformat()
+
+        text = str(value).strip()
+        for fmt in cls.DATE_INPUT_FORMATS:
+            try:
+                parsed = datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+            return parsed.strftime('%Y-%m-%d %H:%M:%S' if '%H' in fmt else '%Y-%m-%d')
         return None
 
     def save(self):
-        conn = sqlite3.connect('handshop.db')
-        cursor = conn.cursor()
-    
-        # 1. 统一格式化为 YYYY-MM-DD 字符串
-        completed_at_value = self.completed_at.strftime('%Y-%m-%d') if isinstance(self.completed_at, datetime) else self.completed_at
-        created_at_value = self.created_at.strftime('%Y-%m-%d') if isinstance(self.created_at, datetime) else self.created_at
-
-        # 清洗无效的 created_at（防止带入文件名等脏数据）
-        if not created_at_value or '-' not in str(created_at_value) or len(str(created_at_value)) < 8:
-            created_at_value = None
-
-        # 2. 如果项目已完成且同时拥有创建和完成日期，计算整数天数
-        duration_value = None
-        if self.status == '已完成' and created_at_value and completed_at_value:
-            try:
-                d1 = datetime.strptime(str(created_at_value).split()[0], '%Y-%m-%d')
-                d2 = datetime.strptime(str(completed_at_value).split()[0], '%Y-%m-%d')
-                delta = d2 - d1
-                duration_value = max(0, delta.days) # 保证天数非负整数
-            except Exception as e:
-                print(f"[ERROR] 计算用时失败: {e}")
-                duration_value = 0
-
-        if self.id:
-            # UPDATE
-            if created_at_value:
-                cursor.execute('''
-                    UPDATE projects 
-                    SET title=?, description=?, category=?, status=?, image_path=?, thumbnail_path=?, 
-                        created_at=?, completed_at=?, duration_days=?, stars=?
-                    WHERE id=?
-                ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path, 
-                      created_at_value, completed_at_value, duration_value, self.stars, self.id))
-            else:
-                cursor.execute('''
-                    UPDATE projects 
-                    SET title=?, description=?, category=?, status=?, image_path=?, thumbnail_path=?, 
-                        completed_at=?, duration_days=?, stars=?
-                    WHERE id=?
-                ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path, 
-                      completed_at_value, duration_value, self.stars, self.id))
-        else:
-            # INSERT
-            if created_at_value:
-                cursor.execute('''
-                    INSERT INTO projects (title, description, category, status, image_path, thumbnail_path, created_at, completed_at, duration_days, stars)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                 ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path, 
-                       created_at_value, completed_at_value, duration_value, self.stars))
+        # 1. 统一格式化为 ISO 日期字符串（同时清洗文件名等脏数据）
+        completed_at_value = self._normalize_date(self.completed_at)
+        created_at_value = self._normalize_date(self.created_at)
+
+        with database.transaction() as conn:
+            cursor = conn.cursor()
+            if self.id:
+                # UPDATE（stars 只由 toggle_like 原子增减，这里不回写，避免覆盖并发点赞）
+                if created_at_value:
+                    cursor.execute('''
+                        UPDATE projects
+                        SET title=?, description=?, category=?, status=?, image_path=?, thumbnail_path=?,
+                            created_at=?, completed_at=?,
+                            thumbnail_variants=CASE WHEN image_path IS ? THEN thumbnail_variants END
+                        WHERE id=?
+                    ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path,
+                          created_at_value, completed_at_value, self.image_path, self.id))
+                else:
+                    cursor.execute('''
+                        UPDATE projects
+                        SET title=?, description=?, category=?, status=?, image_path=?, thumbnail_path=?,
+                            completed_at=?,
+                            thumbnail_variants=CASE WHEN image_path IS ? THEN thumbnail_variants END
+                        WHERE id=?
+                    ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path,
+                          completed_at_value, self.image_path, self.id))
             else:
-                cursor.execute('''
-                    INSERT INTO projects (title, description, category, status, image_path, thumbnail_path, completed_at, duration_days, stars)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path, 
-                      completed_at_value, duration_value, self.stars))
-    
-        conn.commit()
-        conn.close()
-    
-    def delete(self):
-        if self.image_path and self.image_path != self.DEFAULT_IMAGE:
-            file_path = os.path.join('static', self.image_path)
+                # INSERT
+                if created_at_value:
+                    cursor.execute('''
+                        INSERT INTO projects (title, description, category, status, image_path, thumbnail_path, created_at, completed_at, stars)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path,
+                           created_at_value, completed_at_value, self.stars))
+                else:
+                    cursor.execute('''
+                        INSERT INTO projects (title, description, category, status, image_path, thumbnail_path, completed_at, stars)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (self.title, self.description, self.category, self.status, self.image_path, self.thumbnail_path,
+                          completed_at_value, self.stars))
+                self.id = cursor.lastrowid
+
+            # 2. 已完成且同时拥有创建和完成日期时，在 SQL 中计算整数天数
+            cursor.execute(f'UPDATE projects SET duration_days = {self.DURATION_SQL} WHERE id = ?', (self.id,))
+
+            # 3. 压缩图任务可能在项目入库前就已完成
+            thumbnails.apply_finished(conn, self.id)
+            database.bump_content_version(conn)
+
+    def get_thumbnail_variants(self):
+        """多尺寸压缩图列表 [(宽度, 路径)]，按宽度升序"""
+        if not self.thumbnail_variants:
+            return []
+        try:
+            variants = json.loads(self.thumbnail_variants)
+        except (TypeError, ValueError):
+            return []
+        return sorted((int(width), path) for width, path in variants.items())
+
+    def image_files(self):
+        """项目引用的所有图片文件（原图、压缩图及各尺寸压缩图），不含默认图片"""
+        paths = [self.image_path, self.thumbnail_path] + [path for _, path in self.get_thumbnail_variants()]
+        return list(dict.fromkeys(p for p in paths if p and p != self.DEFAULT_IMAGE))
+
+    @staticmethod
+    def remove_files(paths):
+        for path in paths:
+            file_path = os.path.join('static', path)
             try:
                 if os.path.exists(file_path):
                     os.remove(file_path)
             except Exception as e:
                 print(f"删除图片文件时出错: {e}")
-        
-        if self.thumbnail_path and self.thumbnail_path != self.DEFAULT_IMAGE:
-            thumb_path = os.path.join('static', self.thumbnail_path)
-            try:
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-            except Exception as e:
-                print(f"删除压缩图时出错: {e}")
 
-        conn = sqlite3.connect('handshop.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM projects WHERE id=?', (self.id,))
-        conn.commit()
-        conn.close()
+    @classmethod
+    def release_files(cls, image_path, paths):
+        """
+        原图不再被任何项目引用时删除其文件（含各尺寸压缩图），仍被引用时保留。
+        文件还在上传宽限期内时安排宽限期过后再检查，返回 False。
+        需在引用它的项目记录更新或删除之后调用。
+        """
+        if not image_path or image_path == cls.DEFAULT_IMAGE:
+            return False
+        try:
+            modified = os.path.getmtime(os.path.join('static', image_path))
+        except OSError:
+            modified = 0
+        remaining = modified + cls.UPLOAD_GRACE_SECONDS - time.time()
+        if remaining > 0:
+            cls._release_later(image_path, paths, remaining)
+            return False
+
+        with database.transaction(immediate=True) as conn:
+            in_use = conn.execute(
+                'SELECT 1 FROM projects WHERE image_path = ? LIMIT 1', (image_path,)
+            ).fetchone()
+            if in_use:
+                return False
+            thumbnails.forget(conn, image_path)
+        cls.remove_files(paths)
+        return True
+
+    @classmethod
+    def _release_later(cls, image_path, paths, delay):
+        timer = threading.Timer(delay + 1, cls._release_deferred, (image_path, paths))
+        timer.daemon = True
+        timer.start()
+
+    @classmethod
+    def _release_deferred(cls, image_path, paths):
+        """定时器线程中执行的延迟删除（期间又被引用或复用时照常保留）"""
+        try:
+            cls.release_files(image_path, paths)
+        except Exception as e:
+            print(f"[ERROR] 延迟删除图片文件 {image_path} 失败: {e}")
+        finally:
+            database.close_connection()
+
+    def delete(self):
+        with database.transaction() as conn:
+            conn.execute('DELETE FROM project_likes WHERE project_id=?', (self.id,))
+            conn.execute('DELETE FROM projects WHERE id=?', (self.id,))
+            database.bump_content_version(conn)
+
+        self.release_files(self.image_path, self.image_files())
 
     @staticmethod
     def allowed_file(filename):
@@ -290,62 +786,65 @@ class Project:
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+    @classmethod
+    def store_image(cls, stream):
+        """
+        把图片数据流按内容哈希保存到上传目录（已存在相同图片时直接复用），返回相对路径。
+        按文件头识别格式并校验尺寸与大小，不合格时抛出 UploadRejected，不留下文件。
+        上传与批量导入共用，调用方负责登记压缩图任务。
+        """
+        if isinstance(stream, upload_ingest.IngestFile):
+            # 表单解析时已边接收边校验并写入上传目录，只需按哈希改名
+            return f'{cls.UPLOAD_DIR}/{stream.commit()}'
+
+        with upload_ingest.IngestFile(os.path.join('static', cls.UPLOAD_DIR)) as sink:
+            for chunk in iter(lambda: stream.read(cls.UPLOAD_CHUNK_SIZE), b''):
+                sink.write(chunk)
+                if sink.error is not None:
+                    break
+            return f'{cls.UPLOAD_DIR}/{sink.commit()}'
+
     @classmethod
     def save_uploaded_file(cls, file):
+        """
+        按内容哈希保存原图（已存在相同图片时直接复用）并登记压缩图任务，
+        返回 (原图路径, 当前展示用的压缩图路径)。压缩图由后台进程生成，完成前先展示原图。
+        图片不合格时抛出 UploadRejected。
+        """
         if file and cls.allowed_file(file.filename):
-            ext = file.filename.rsplit('.', 1)[1].lower()
-            new_filename = f"{uuid.uuid4().hex}.{ext}"
-            save_dir = os.path.join('static', 'uploads')
-            thumb_dir = os.path.join(save_dir, 'thumbnail')
-            os.makedirs(save_dir, exist_ok=True)
-            os.makedirs(thumb_dir, exist_ok=True)
-
-            save_path = os.path.join(save_dir, new_filename)
-            file.save(save_path)
-
-            thumbnail_filename = f"thumb_{uuid.uuid4().hex}.webp"
-            thumb_path = os.path.join(thumb_dir, thumbnail_filename)
+            started = time.perf_counter()
+            image_path = cls.store_image(file.stream)
+            metrics.observe('handshop_upload_store_seconds', time.perf_counter() - started)
             try:
-                img = Image.open(save_path)
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-                img.save(thumb_path, "WEBP", quality=80, method=6)
+                thumbnails.ensure(image_path)
             except Exception as e:
-                print(f"生成压缩图时出错: {e}")
-                thumbnail_filename = None
-
-            return f'uploads/{new_filename}', f'uploads/thumbnail/{thumbnail_filename}'
+                print(f"登记压缩图任务时出错: {e}")
+            return image_path, image_path
         else:
             return cls.DEFAULT_IMAGE, cls.DEFAULT_IMAGE
 
+    def _format_date(self, field, fmt, empty):
+        """格式化日期并缓存结果，无法解析时返回 empty"""
+        key = (field, fmt)
+        formatted = self._formatted
+        if formatted is None:
+            formatted = self._formatted = {}
+        elif key in formatted:
+            return formatted[key]
+
+        value = getattr(self, field)
+        result = value.strftime(fmt) if isinstance(value, datetime) else empty
+        formatted[key] = result
+        return result
+
     def format_completed_date(self):
-        if not self.completed_at:
-            return '---'
-        if isinstance(self.completed_at, datetime):
-            return self.completed_at.strftime('%Y年%m月%d日')
-        parsed = self._parse_datetime(self.completed_at)
-        return parsed.strftime('%Y年%m月%d日') if isinstance(parsed, datetime) else '---'
+        return self._format_date('completed_at', '%Y年%m月%d日', '---')
 
     def get_completed_date_for_input(self):
-        if not self.completed_at:
-            return ''
-        if isinstance(self.completed_at, datetime):
-            return self.completed_at.strftime('%Y-%m-%d')
-        parsed = self._parse_datetime(self.completed_at)
-        return parsed.strftime('%Y-%m-%d') if isinstance(parsed, datetime) else ''
-            
+        return self._format_date('completed_at', '%Y-%m-%d', '')
+
     def format_created_date(self):
-        if not self.created_at:
-            return '---'
-        if isinstance(self.created_at, datetime):
-            return self.created_at.strftime('%Y年%m月%d日')
-        parsed = self._parse_datetime(self.created_at)
-        return parsed.strftime('%Y年%m月%d日') if isinstance(parsed, datetime) else '---'
+        return self._format_date('created_at', '%Y年%m月%d日', '---')
 
     def get_created_date_for_input(self):
-        if not self.created_at:
-            return ''
-        if isinstance(self.created_at, datetime):
-            return self.created_at.strftime('%Y-%m-%d')
-        parsed = self._parse_datetime(self.created_at)
-        return parsed.strftime('%Y-%m-%d') if isinstance(parsed, datetime) else ''
\ No newline at end of file
+        return self._format_date('created_at', '%Y-%m-%d', '')
@@ -0,0 +1,183 @@
+import os
+import threading
+
+import database
+
+# 项目读模型：每个 worker 在内存中保存一份 projects 表，列表与详情直接从内存读取。
+# projects 上的触发器把每次写入记录到 project_changes 表，读取前按需增量同步：
+# 当前连接的 PRAGMA data_version（其他连接提交过写入）和 total_changes（本连接写入过）
+# 都没有变化时不访问数据库，否则只重新读取变更过的项目。
+# 只有点赞数、标题等不影响列表成员与顺序的字段变化时原地更新行，排好的列表与筛选结果继续使用。
+ENABLED = os.environ.get('HANDSHOP_READ_MODEL', '1') == '1'
+
+# 变更日志保留的条数，落后更多的 worker 会整表重新加载
+CHANGE_LOG_KEEP = 1000
+
+# 决定项目出现在哪些列表、排在什么位置的字段
+ORDER_FIELDS = ('status_rank', 'sort_date', 'category', 'status')
+
+_lock = threading.Lock()
+_local = threading.local()
+# 所属进程与数据库，fork 或切换数据库后重新加载
+_owner = None
+# 已同步到的变更序号，None 表示尚未加载
+_seq = None
+# project_id -> 行（dict）
+_rows = {}
+# 按列表顺序排好的行，以及按筛选条件缓存的结果，数据变化时清空
+_ordered = None
+_views = {}
+
+
+def configure(enabled=None):
+    global ENABLED
+    if enabled is not None:
+        ENABLED = bool(enabled)
+
+
+def init_change_log():
+    """初始化 projects 的变更日志表与触发器"""
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS project_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER NOT NULL
+            )
+        ''')
+        for event, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS projects_log_{event.lower()}
+                AFTER {event} ON projects
+                BEGIN
+                    INSERT INTO project_changes (project_id) VALUES ({ref}.id);
+                END
+            ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS project_changes_prune
+            AFTER INSERT ON project_changes
+            BEGIN
+                DELETE FROM project_changes WHERE seq <= NEW.seq - {CHANGE_LOG_KEEP};
+            END
+        ''')
+
+
+def active():
+    """事务中读取时直接查库，避免把未提交的数据同步进共享的读模型"""
+    return ENABLED and not database.get_connection().in_transaction
+
+
+def _row_dict(row):
+    return {key: row[key] for key in row.keys()}
+
+
+def _load_all(conn):
+    """整表加载，先记下变更序号，期间的新写入会在下次同步时补上"""
+    global _seq, _rows
+    seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM project_changes').fetchone()[0]
+    _rows = {row['id']: _row_dict(row) for row in conn.execute('SELECT * FROM projects')}
+    _seq = seq
+
+
+def _apply_changes(conn):
+    """
+    增量同步，返回是否需要重新排序（有项目新增、删除或排序字段变化）；
+    返回 None 表示变更日志已被清理到同步点之后，需要整表加载。
+    """
+    global _seq
+    changes = conn.execute(
+        'SELECT seq, project_id FROM project_changes WHERE seq > ? ORDER BY seq', (_seq,)
+    ).fetchall()
+    if not changes:
+        return False
+    if changes[0]['seq'] != _seq + 1:
+        oldest = conn.execute('SELECT MIN(seq) FROM project_changes').fetchone()[0]
+        if oldest is None or oldest > _seq + 1:
+            return None
+
+    project_ids = list({row['project_id'] for row in changes})
+    placeholders = ', '.join('?' * len(project_ids))
+    fresh = {
+        row['id']: _row_dict(row)
+        for row in conn.execute(f'SELECT * FROM projects WHERE id IN ({placeholders})', project_ids)
+    }
+    reorder = False
+    for project_id in project_ids:
+        row = fresh.get(project_id)
+        current = _rows.get(project_id)
+        if row is None:
+            reorder = reorder or _rows.pop(project_id, None) is not None
+        elif current is None or any(current[field] != row[field] for field in ORDER_FIELDS):
+            _rows[project_id] = row
+            reorder = True
+        else:
+            # 列表与筛选结果引用的是同一个 dict，原地更新后无需重新排序
+            current.update(row)
+    _seq = changes[-1]['seq']
+    return reorder
+
+
+def _sync():
+    global _owner, _ordered
+    conn = database.get_connection()
+    owner = (os.getpid(), database.DB_PATH)
+    marker = (id(conn), database.data_version(), conn.total_changes)
+    if _owner == owner and _seq is not None and getattr(_local, 'marker', None) == marker:
+        return
+
+    with _lock:
+        reorder = _apply_changes(conn) if _owner == owner and _seq is not None else None
+        if reorder is None:
+            _owner = owner
+            _load_all(conn)
+            reorder = True
+        if reorder:
+            _ordered = None
+            _views.clear()
+        _local.marker = marker
+
+
+def _sort_key(row):
+    return str(row['sort_date'] or ''), row['id']
+
+
+def _ordered_rows():
+    """与 Project.ORDER_BY_SQL 相同的顺序：status_rank 升序，sort_date、id 降序"""
+    global _ordered
+    if _ordered is None:
+        rows = sorted(_rows.values(), key=_sort_key, reverse=True)
+        rows.sort(key=lambda row: row['status_rank'])
+        _ordered = rows
+    return _ordered
+
+
+def select(category=None, status=None, exclude_status=None):
+    """按列表顺序返回符合条件的行（只读，调用方不应修改）"""
+    _sync()
+    key = (category, status, exclude_status)
+    with _lock:
+        rows = _views.get(key)
+        if rows is None:
+            rows = [
+                row for row in _ordered_rows()
+                if (not category or row['category'] == category)
+                and (not status or row['status'] == status)
+                and (not exclude_status or row['status'] != exclude_status)
+            ]
+            _views[key] = rows
+        return rows
+
+
+def get(project_id):
+    _sync()
+    with _lock:
+        return _rows.get(project_id)
+
+
+def after(rows, position):
+    """返回列表中位于游标 (status_rank, sort_date, id) 之后的第一个下标"""
+    rank, sort_date, last_id = position
+    for index, row in enumerate(rows):
+        if row['status_rank'] > rank or (
+                row['status_rank'] == rank and _sort_key(row) < (sort_date, last_id)):
+            return index
+    return len(rows)
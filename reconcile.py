@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import database
+import thumbnails
+from project import Project
+
+# 上传目录与数据库的对账任务，依次执行三个阶段：
+#   rows        按 id 分批检查项目引用的图片：原图缺失时改回默认图片，压缩图缺失时改回原图并重新登记压缩图任务
+#   uploads     用 os.scandir 逐个遍历 static/uploads/ 下的原图，找出没有项目或进行中任务引用的文件
+#   thumbnails  同样遍历 static/uploads/thumbnail/，各尺寸压缩图按去掉 _<宽度> 后的路径判断是否仍被引用
+# 目录只顺序读取，每批 BATCH_SIZE 个文件查询一次数据库，内存占用与文件总数无关。
+# 每批处理完后把进度（阶段与位置）写入 reconcile_state 表，--max-seconds 到时停止，再次运行从断点继续；
+# 目录在两次运行之间有变化时个别文件可能被跳过或重复检查，下一轮完整运行会补上。
+# 修改时间在 Project.UPLOAD_GRACE_SECONDS 内的文件（正在保存或刚被复用）不计为孤立文件。
+# 宽限期内被替换或删除的图片由 Project.release_files 安排稍后删除，服务在此之前重启时由这里补上。
+
+PHASES = ('rows', 'uploads', 'thumbnails')
+
+# 每批检查的项目数 / 文件数（同时受 SQLite 参数个数上限约束）
+BATCH_SIZE = 500
+
+UPLOAD_DIR = Project.UPLOAD_DIR
+THUMBNAIL_DIR = thumbnails.THUMBNAIL_DIR
+
+# 各尺寸压缩图 thumb_xxx_320.webp / <哈希>_320.webp 对应的主压缩图
+VARIANT_RE = re.compile(r'^(.+)_\d+(\.[A-Za-z0-9]+)$')
+# 中断的写入留下的临时文件，不会被任何记录引用
+TMP_SUFFIX = '.tmp'
+
+TOTAL_KEYS = (
+    'projects', 'missing_images', 'missing_thumbnails', 'fixed_projects', 'thumbnail_jobs',
+    'files', 'recent_files', 'orphans', 'orphan_bytes', 'deleted', 'deleted_bytes',
+)
+
+
+def init_state_table():
+    """对账进度表，以及按压缩图路径判断引用所需的索引"""
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reconcile_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                phase TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                options TEXT NOT NULL,
+                totals TEXT NOT NULL,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_projects_thumbnail
+            ON projects (thumbnail_path)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_thumbnail_jobs_thumbnail
+            ON thumbnail_jobs (thumbnail_path, status)
+        ''')
+
+
+def _load_state(options):
+    """返回 (阶段, 位置, 累计结果)；没有断点或选项不同时从头开始"""
+    row = database.get_connection().execute(
+        'SELECT phase, position, options, totals FROM reconcile_state WHERE id = 1'
+    ).fetchone()
+    if row and json.loads(row['options']) == options:
+        return row['phase'], row['position'], json.loads(row['totals'])
+    if row:
+        print("[INFO] 上次未完成的对账使用了不同的选项，从头开始")
+    return PHASES[0], 0, dict.fromkeys(TOTAL_KEYS, 0)
+
+
+def _save_state(phase, position, options, totals):
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT INTO reconcile_state (id, phase, position, options, totals) VALUES (1, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                phase = excluded.phase, position = excluded.position, options = excluded.options,
+                totals = excluded.totals, updated_at = CURRENT_TIMESTAMP
+        ''', (phase, position, json.dumps(options, sort_keys=True), json.dumps(totals)))
+
+
+def _clear_state():
+    with database.transaction() as conn:
+        conn.execute('DELETE FROM reconcile_state')
+
+
+def _exists(path):
+    return os.path.isfile(os.path.join(thumbnails.STATIC_DIR, path))
+
+
+def _variant_paths(variants_json):
+    if not variants_json:
+        return []
+    try:
+        return list(json.loads(variants_json).values())
+    except (TypeError, ValueError, AttributeError):
+        return []
+
+
+# ==========================================================================
+# 项目记录
+# ==========================================================================
+
+def _check_rows(position, options, totals):
+    """按 id 分批检查项目引用的文件，每批结束后产出最后一个 id"""
+    default = Project.DEFAULT_IMAGE
+    while True:
+        rows = database.get_connection().execute('''
+            SELECT id, image_path, thumbnail_path, thumbnail_variants FROM projects
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (position, BATCH_SIZE)).fetchall()
+        if not rows:
+            return
+
+        # (项目 id, 原图, 新原图, 新压缩图)
+        fixes, regenerate = [], []
+        for row in rows:
+            image_path = row['image_path'] or default
+            thumbnail_path = row['thumbnail_path'] or default
+            variants = _variant_paths(row['thumbnail_variants'])
+
+            if image_path == default or not _exists(image_path):
+                if image_path != default:
+                    totals['missing_images'] += 1
+                    print(f"[INFO] 项目 {row['id']} 的原图不存在: {image_path}")
+                elif thumbnail_path == default and not variants:
+                    continue
+                fixes.append((row['id'], row['image_path'], default, default))
+                continue
+
+            if thumbnail_path == image_path and not variants:
+                # 还没有压缩图：任务进行中时 ensure_many 会跳过
+                regenerate.append(image_path)
+                continue
+            if not all(_exists(path) for path in [thumbnail_path] + variants):
+                totals['missing_thumbnails'] += 1
+                print(f"[INFO] 项目 {row['id']} 的压缩图不存在: {thumbnail_path}")
+                fixes.append((row['id'], image_path, image_path, image_path))
+                regenerate.append(image_path)
+
+        totals['projects'] += len(rows)
+        if options['fix']:
+            if fixes:
+                with database.transaction(immediate=True) as conn:
+                    # 只在记录的原图未被同时修改时更新
+                    fixed = 0
+                    for project_id, old_image, image_path, thumbnail_path in fixes:
+                        fixed += conn.execute('''
+                            UPDATE projects SET image_path = ?, thumbnail_path = ?, thumbnail_variants = NULL
+                            WHERE id = ? AND image_path IS ?
+                        ''', (image_path, thumbnail_path, project_id, old_image)).rowcount
+                    if fixed:
+                        database.bump_content_version(conn)
+                totals['fixed_projects'] += fixed
+            totals['thumbnail_jobs'] += thumbnails.ensure_many(regenerate)
+
+        position = rows[-1]['id']
+        yield position
+
+
+# ==========================================================================
+# 上传目录
+# ==========================================================================
+
+def _file_batches(directory, position):
+    """顺序遍历目录，每 BATCH_SIZE 个文件产出一次 (下次开始的位置, [DirEntry])"""
+    if not os.path.isdir(directory):
+        return
+    batch, index = [], position
+    with os.scandir(directory) as it:
+        for index, entry in enumerate(it, 1):
+            if index <= position:
+                continue
+            if entry.is_file(follow_symlinks=False):
+                batch.append(entry)
+                if len(batch) >= BATCH_SIZE:
+                    yield index, batch
+                    batch = []
+    if batch:
+        yield index, batch
+
+
+def _referenced(conn, phase, keys):
+    """keys 中仍被项目或进行中的压缩图任务引用的路径"""
+    if not keys:
+        return set()
+    placeholders = ', '.join('?' * len(keys))
+    column = 'image_path' if phase == 'uploads' else 'thumbnail_path'
+    return {row[0] for row in conn.execute(f'''
+        SELECT {column} FROM projects WHERE {column} IN ({placeholders})
+        UNION
+        SELECT {column} FROM thumbnail_jobs
+        WHERE {column} IN ({placeholders}) AND status IN ('pending', 'running')
+    ''', keys + keys)}
+
+
+def _check_files(phase, position, options, totals):
+    """找出（并按选项删除）没有被引用的文件，每批结束后产出目录中的位置"""
+    prefix = UPLOAD_DIR if phase == 'uploads' else THUMBNAIL_DIR
+    directory = os.path.join(thumbnails.STATIC_DIR, prefix)
+    # 本次运行已删除的文件数：之后再遍历目录时位于断点之前的文件少了这么多个
+    removed = 0
+
+    for position, entries in _file_batches(directory, position):
+        now = time.time()
+        # 路径 -> [(DirEntry, stat)]，各尺寸压缩图归到主压缩图路径下
+        candidates, orphans = {}, []
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            totals['files'] += 1
+            if now - stat.st_mtime < Project.UPLOAD_GRACE_SECONDS:
+                totals['recent_files'] += 1
+                continue
+            if entry.name.endswith(TMP_SUFFIX):
+                orphans.append((entry, stat))
+                continue
+            name = entry.name
+            if phase == 'thumbnails':
+                match = VARIANT_RE.match(name)
+                if match:
+                    name = match.group(1) + match.group(2)
+            candidates.setdefault(f'{prefix}/{name}', []).append((entry, stat))
+
+        # 删除时在写事务中确认未被引用并清理任务记录，文件在提交后删除
+        with database.transaction(immediate=options['delete']) as conn:
+            referenced = _referenced(conn, phase, list(candidates))
+            for key, items in candidates.items():
+                if key in referenced:
+                    continue
+                orphans.extend(items)
+                if options['delete']:
+                    if phase == 'uploads':
+                        thumbnails.forget(conn, key)
+                    else:
+                        conn.execute('''
+                            DELETE FROM thumbnail_jobs
+                            WHERE thumbnail_path = ? AND status NOT IN ('pending', 'running')
+                        ''', (key,))
+
+        for entry, stat in orphans:
+            totals['orphans'] += 1
+            totals['orphan_bytes'] += stat.st_size
+            path = f'{prefix}/{entry.name}'
+            if not options['delete']:
+                print(f"[INFO] 孤立文件: {path}（{stat.st_size} 字节）")
+                continue
+            try:
+                # 检查之后被重新上传（刷新了修改时间）的文件保留
+                if time.time() - os.stat(entry.path).st_mtime < Project.UPLOAD_GRACE_SECONDS:
+                    continue
+                os.remove(entry.path)
+            except OSError as e:
+                print(f"[ERROR] 删除孤立文件失败 {path}: {e}")
+                continue
+            removed += 1
+            totals['deleted'] += 1
+            totals['deleted_bytes'] += stat.st_size
+            print(f"[INFO] 已删除孤立文件: {path}")
+
+        yield position - removed
+
+
+def _run_phase(phase, position, options, totals):
+    if phase == 'rows':
+        return _check_rows(position, options, totals)
+    return _check_files(phase, position, options, totals)
+
+
+def reconcile(delete=False, fix=False, max_seconds=None, restart=False):
+    """
+    执行（或从断点继续）一轮对账，返回 (是否完成, 累计结果)。
+    delete=True 删除孤立文件，fix=True 修正缺失文件的项目记录并重新登记压缩图任务。
+    """
+    options = {'delete': bool(delete), 'fix': bool(fix)}
+    if restart:
+        _clear_state()
+    phase, position, totals = _load_state(options)
+    if position:
+        print(f"[INFO] 从断点继续: {phase} 阶段位置 {position}")
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+
+    for current in PHASES[PHASES.index(phase):]:
+        start = position if current == phase else 0
+        _save_state(current, start, options, totals)
+        for start in _run_phase(current, start, options, totals):
+            _save_state(current, start, options, totals)
+            if deadline and time.monotonic() >= deadline:
+                print(f"[INFO] 已到时间上限，停在 {current} 阶段位置 {start}，再次运行继续")
+                return False, totals
+    _clear_state()
+    return True, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传目录与数据库对账')
+    parser.add_argument('--delete', action='store_true', help='删除孤立文件（默认只列出）')
+    parser.add_argument('--fix', action='store_true', help='修正缺失文件的项目记录并重新登记压缩图任务')
+    parser.add_argument('--max-seconds', type=float, help='运行时间上限，到时保存进度后退出')
+    parser.add_argument('--restart', action='store_true', help='丢弃上次的进度，从头开始')
+    args = parser.parse_args()
+
+    import migrations
+    migrations.migrate()
+
+    started = time.monotonic()
+    finished, totals = reconcile(args.delete, args.fix, args.max_seconds, args.restart)
+    seconds = time.monotonic() - started
+    state = '完成' if finished else '未完成'
+    print(f"[INFO] 对账{state}（{seconds:.1f} 秒）: {totals}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import os
+import secrets
+from datetime import datetime, timezone
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import database
+
+# 服务端会话（可选）：会话内容保存在 SQLite 的 sessions 表中，Cookie 里只有随机会话 id。
+# 只有会话内容变化时才写库并重新下发 Cookie，不再每个请求都重新签名整个会话。
+# 设置环境变量 HANDSHOP_SESSION_STORE=sqlite 开启，默认仍使用 Flask 的签名 Cookie 会话。
+ENABLED = os.environ.get('HANDSHOP_SESSION_STORE', '') == 'sqlite'
+
+
+def init_sessions_table():
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at TIMESTAMP NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # 登录后更换会话 id 时记录旧 id，保存时删除
+        self.previous_sid = None
+
+
+def rotate(session):
+    """登录等权限变化时更换会话 id，防止会话固定攻击（签名 Cookie 会话无需处理）"""
+    if isinstance(session, ServerSession) and not session.new:
+        session.previous_sid = session.previous_sid or session.sid
+        session.sid = _new_sid()
+        session.modified = True
+
+
+class SqliteSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = database.get_connection().execute(
+                'SELECT data FROM sessions WHERE id = ? AND expires_at > ?', (sid, _utcnow())
+            ).fetchone()
+            if row:
+                try:
+                    return ServerSession(self.serializer.loads(row['data']), sid=sid)
+                except ValueError:
+                    pass
+        return ServerSession(sid=_new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        response.vary.add('Cookie')
+
+        if not session:
+            # 会话被清空（如退出登录）：删除记录与 Cookie
+            if session.modified and not session.new:
+                with database.transaction() as conn:
+                    conn.execute(
+                        'DELETE FROM sessions WHERE id IN (?, ?)', (session.sid, session.previous_sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # 未修改的会话不写库，也不重新下发 Cookie
+        if not session.modified:
+            return
+
+        expires = self.get_expiration_time(app, session)
+        stored_until = expires or datetime.now(timezone.utc) + app.permanent_session_lifetime
+        with database.transaction() as conn:
+            if session.previous_sid:
+                conn.execute('DELETE FROM sessions WHERE id = ?', (session.previous_sid,))
+            if session.new:
+                # 新建会话时顺便清理过期记录
+                conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (_utcnow(),))
+            conn.execute('''
+                INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            ''', (session.sid, self.serializer.dumps(dict(session)),
+                  stored_until.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')))
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
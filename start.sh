@@ -1,3 +1,3 @@
 #!/bin/bash
 cd /opt/handshop
-gunicorn -w 2 -b 0.0.0.0:5000 app:app
+gunicorn -c gunicorn.conf.py -w 4 -b 0.0.0.0:5000 app:app
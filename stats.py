@@ -0,0 +1,231 @@
+import argparse
+import json
+
+import database
+
+# 统计汇总表：由 projects / project_likes 上的触发器增量维护，统计页面只读取这几张小表，
+# 与历史数据量无关。所有写入路径（保存、删除、点赞、批量导入）都经过触发器，无需在代码中单独维护。
+#   stats_status       各分类、各状态的项目数（排队长度）
+#   stats_durations    已完成项目的用时天数分布（按分类），平均数与中位数由分布计算
+#   stats_completions  每月完成的项目数（按分类）
+#   stats_likes        每月收到的点赞数（取消点赞时扣回）
+# 汇总表统计的是库中现有的数据，与 rebuild() 按原表重新计算的结果始终一致：删除项目时，
+# 它的完成记录与收到的点赞也从月度统计中扣除（删除旧作品后往月的数字会随之变小），
+# 统计页面不单独保留已删除项目的历史。
+
+COMPLETED = '已完成'
+
+# 统计页面展示的最近月数
+RECENT_MONTHS = 24
+
+# 可以按月统计的日期（YYYY-MM 开头），旧数据中无法识别的日期不计入月度统计
+_MONTH_GLOB = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]*'"
+
+
+def _duration_cond(ref):
+    return f"{ref}.status = '{COMPLETED}' AND {ref}.duration_days IS NOT NULL"
+
+
+def _completion_cond(ref):
+    return f"{ref}.status = '{COMPLETED}' AND {ref}.completed_at GLOB {_MONTH_GLOB}"
+
+
+def _like_month(ref):
+    return f"substr(COALESCE({ref}.created_at, CURRENT_TIMESTAMP), 1, 7)"
+
+
+def _add_project_sql(ref, delta):
+    """把 ref（NEW / OLD）对应的项目计入（delta = 1）或移出（delta = -1）各汇总表"""
+    return f'''
+        INSERT INTO stats_status (category, status, projects)
+        VALUES ({ref}.category, {ref}.status, {delta})
+        ON CONFLICT (category, status) DO UPDATE SET projects = projects + {delta};
+
+        INSERT INTO stats_durations (category, duration_days, projects)
+        SELECT {ref}.category, {ref}.duration_days, {delta} WHERE {_duration_cond(ref)}
+        ON CONFLICT (category, duration_days) DO UPDATE SET projects = projects + {delta};
+
+        INSERT INTO stats_completions (month, category, projects)
+        SELECT substr({ref}.completed_at, 1, 7), {ref}.category, {delta} WHERE {_completion_cond(ref)}
+        ON CONFLICT (month, category) DO UPDATE SET projects = projects + {delta};
+    '''
+
+
+def _add_like_sql(ref, delta):
+    return f'''
+        INSERT INTO stats_likes (month, likes) VALUES ({_like_month(ref)}, {delta})
+        ON CONFLICT (month) DO UPDATE SET likes = likes + {delta};
+    '''
+
+
+def init_rollups():
+    """建立汇总表与触发器，并按现有数据计算一次"""
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_status (
+                category TEXT NOT NULL,
+                status TEXT NOT NULL,
+                projects INTEGER NOT NULL,
+                PRIMARY KEY (category, status)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_durations (
+                category TEXT NOT NULL,
+                duration_days INTEGER NOT NULL,
+                projects INTEGER NOT NULL,
+                PRIMARY KEY (category, duration_days)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_completions (
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                projects INTEGER NOT NULL,
+                PRIMARY KEY (month, category)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_likes (
+                month TEXT PRIMARY KEY,
+                likes INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS projects_stats_insert AFTER INSERT ON projects
+            BEGIN {_add_project_sql('NEW', 1)} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS projects_stats_delete AFTER DELETE ON projects
+            BEGIN {_add_project_sql('OLD', -1)} END
+        ''')
+        # 点赞数、压缩图等字段的更新不影响统计，不触发
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS projects_stats_update
+            AFTER UPDATE OF category, status, duration_days, completed_at ON projects
+            BEGIN {_add_project_sql('OLD', -1)} {_add_project_sql('NEW', 1)} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS project_likes_stats_insert AFTER INSERT ON project_likes
+            BEGIN {_add_like_sql('NEW', 1)} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS project_likes_stats_delete AFTER DELETE ON project_likes
+            BEGIN {_add_like_sql('OLD', -1)} END
+        ''')
+        rebuild()
+
+
+def rebuild():
+    """按 projects / project_likes 重新计算所有汇总表（修复数据或手工改库后使用）"""
+    with database.transaction(immediate=True) as conn:
+        for table in ('stats_status', 'stats_durations', 'stats_completions', 'stats_likes'):
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute('''
+            INSERT INTO stats_status (category, status, projects)
+            SELECT category, status, COUNT(*) FROM projects GROUP BY category, status
+        ''')
+        conn.execute(f'''
+            INSERT INTO stats_durations (category, duration_days, projects)
+            SELECT category, duration_days, COUNT(*) FROM projects p
+            WHERE {_duration_cond('p')} GROUP BY category, duration_days
+        ''')
+        conn.execute(f'''
+            INSERT INTO stats_completions (month, category, projects)
+            SELECT substr(completed_at, 1, 7), category, COUNT(*) FROM projects p
+            WHERE {_completion_cond('p')} GROUP BY 1, 2
+        ''')
+        conn.execute(f'''
+            INSERT INTO stats_likes (month, likes)
+            SELECT {_like_month('l')}, COUNT(*) FROM project_likes l GROUP BY 1
+        ''')
+
+
+def _median(histogram):
+    """由 [(天数, 项目数)]（按天数升序）计算中位数"""
+    total = sum(count for _, count in histogram)
+    if total == 0:
+        return None
+    lower, upper = (total - 1) // 2, total // 2
+    values, seen = [], 0
+    for days, count in histogram:
+        if seen <= lower < seen + count:
+            values.append(days)
+        if seen <= upper < seen + count:
+            values.append(days)
+            break
+        seen += count
+    return sum(values) / len(values)
+
+
+def summary(months=RECENT_MONTHS):
+    """统计页面的数据，只读取汇总表"""
+    conn = database.get_connection()
+
+    status = {}
+    for row in conn.execute('SELECT category, status, projects FROM stats_status WHERE projects > 0'):
+        status.setdefault(row['category'], {})[row['status']] = row['projects']
+
+    histograms = {}
+    for row in conn.execute('''
+        SELECT category, duration_days, projects FROM stats_durations
+        WHERE projects > 0 ORDER BY category, duration_days
+    '''):
+        histograms.setdefault(row['category'], []).append((row['duration_days'], row['projects']))
+    durations = {}
+    for category, histogram in histograms.items():
+        count = sum(n for _, n in histogram)
+        durations[category] = {
+            'completed': count,
+            'average_days': round(sum(days * n for days, n in histogram) / count, 1),
+            'median_days': _median(histogram),
+        }
+
+    # 最近 months 个有记录的月份，按时间升序
+    recent = [row['month'] for row in conn.execute('''
+        SELECT DISTINCT month FROM stats_completions WHERE projects > 0
+        ORDER BY month DESC LIMIT ?
+    ''', (months,))]
+    completions = {month: {} for month in sorted(recent)}
+    if recent:
+        placeholders = ', '.join('?' * len(recent))
+        for row in conn.execute(f'''
+            SELECT month, category, projects FROM stats_completions
+            WHERE month IN ({placeholders}) AND projects > 0
+        ''', recent):
+            completions[row['month']][row['category']] = row['projects']
+
+    likes = [
+        {'month': row['month'], 'likes': row['likes']}
+        for row in conn.execute('''
+            SELECT month, likes FROM stats_likes WHERE likes > 0 ORDER BY month DESC LIMIT ?
+        ''', (months,))
+    ][::-1]
+
+    return {
+        'status': status,
+        'durations': durations,
+        'completions': [
+            {'month': month, **counts, 'total': sum(counts.values())} for month, counts in completions.items()
+        ],
+        'likes': likes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='统计汇总表')
+    parser.add_argument('command', nargs='?', choices=['show', 'rebuild'], default='show')
+    args = parser.parse_args()
+
+    import migrations
+    migrations.migrate()
+
+    if args.command == 'rebuild':
+        rebuild()
+        print("[INFO] 统计汇总表已重新计算")
+    print(json.dumps(summary(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import metrics
+import migrations
+import read_model
+import thumbnails
+from app import app
+from project import Project
+
+
+@pytest.fixture
+def empty_db(tmp_path, monkeypatch):
+    """指向临时目录中尚未迁移的数据库，不启动压缩图任务与指标写入的后台线程"""
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'handshop.db'))
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(metrics, '_flusher_pid', os.getpid())
+    monkeypatch.setattr(thumbnails, 'WORKERS', 0)
+    monkeypatch.setattr(migrations, '_checked_pid', None)
+    yield database.DB_PATH
+    database.close_connection()
+
+
+@pytest.fixture
+def db(empty_db):
+    """迁移到最新版本的临时数据库"""
+    migrations.migrate()
+    return empty_db
+
+
+@pytest.fixture
+def client(db):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as session:
+        session['admin'] = 'admin'
+        session.permanent = True
+    return client
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    """在临时目录中运行，返回上传目录 static/uploads 的路径"""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'static' / 'uploads'
+    path.mkdir(parents=True)
+    return path
+
+
+@pytest.fixture
+def add_project(db):
+    """按给定字段保存一个项目并返回它"""
+    def add(title, category='knitting', status='制作中', created_at=None, completed_at=None):
+        project = Project(title=title, category=category, status=status,
+                          created_at=created_at, completed_at=completed_at, stars=0)
+        project.save()
+        return project
+    return add
+
+
+@pytest.fixture(params=[True, False], ids=['read_model', 'sql'])
+def read_path(request, monkeypatch):
+    """查询分别经过内存读模型与直接 SQL 两条路径"""
+    monkeypatch.setattr(read_model, 'ENABLED', request.param)
+    return request.param
+
+
+# 引入迁移之前 init_db.py 建立的表结构
+LEGACY_SCHEMA = '''
+    CREATE TABLE projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        image_path TEXT,
+        thumbnail_path TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP NULL,
+        duration_days INTEGER,
+        stars INTEGER DEFAULT 0
+    );
+    CREATE TABLE admins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE project_likes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER NOT NULL,
+        client_token TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+    );
+'''
+
+
+@pytest.fixture
+def legacy_db(empty_db):
+    """
+    旧版本的数据库（没有 user_version），返回执行任意 SQL 的函数，
+    用于在迁移前写入旧格式的数据。
+    """
+    with sqlite3.connect(empty_db) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+
+    def execute(sql, params=()):
+        with sqlite3.connect(empty_db) as conn:
+            cursor = conn.execute(sql, params)
+            lastrowid = cursor.lastrowid
+        conn.close()
+        return lastrowid
+    return execute
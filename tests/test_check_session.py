@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import migrations
+import thumbnails
+
+
+@pytest.fixture
+def heartbeat_only(client, monkeypatch):
+    # 心跳不应确认数据库版本或启动压缩图任务
+    def fail():
+        raise AssertionError('心跳触发了 before_request 的工作')
+
+    monkeypatch.setattr(migrations, 'ensure_current', fail)
+    monkeypatch.setattr(thumbnails, 'start_worker', fail)
+    return client
+
+
+def test_heartbeat_skips_request_hooks(heartbeat_only):
+    assert heartbeat_only.get('/check_session').status_code == 204
+
+
+def test_heartbeat_does_not_resend_cookie_within_refresh_interval(heartbeat_only):
+    with heartbeat_only.session_transaction() as session:
+        session['admin'] = 'admin'
+        session.permanent = True
+        session['_last_activity'] = datetime.now().isoformat()
+    response = heartbeat_only.get('/check_session')
+    assert response.status_code == 204
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_heartbeat_reports_expired_session(heartbeat_only):
+    with heartbeat_only.session_transaction() as session:
+        session['admin'] = 'admin'
+        session.permanent = True
+        session['_last_activity'] = (datetime.now() - timedelta(days=2)).isoformat()
+    assert heartbeat_only.get('/check_session').status_code == 401
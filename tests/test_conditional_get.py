@@ -0,0 +1,54 @@
+import pytest
+
+
+@pytest.fixture
+def page(client, add_project):
+    add_project('scarf')
+    return client
+
+
+@pytest.mark.parametrize('path', ['/', '/category/knitting', '/stats'])
+def test_unchanged_page_answers_304(page, path):
+    first = page.get(path)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+    assert 'no-cache' in first.headers['Cache-Control']
+    assert 'private' in first.headers['Cache-Control']
+    assert 'Cookie' in first.headers['Vary']
+
+    second = page.get(path, headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+
+def test_write_changes_the_etag(page, add_project):
+    etag = page.get('/').headers['ETag']
+    add_project('hat')
+    response = page.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert 'hat' in response.get_data(as_text=True)
+
+
+def test_like_changes_the_etag(page):
+    etag = page.get('/').headers['ETag']
+    page.post('/project/1/like')
+    assert page.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_etag_differs_per_visitor(page):
+    page.set_cookie('client_token', 'a')
+    first = page.get('/').headers['ETag']
+    page.set_cookie('client_token', 'b')
+    assert page.get('/').headers['ETag'] != first
+
+
+def test_pending_flash_message_is_not_answered_from_etag(page):
+    etag = page.get('/').headers['ETag']
+    with page.session_transaction() as session:
+        session['_flashes'] = [('success', '已保存')]
+    response = page.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
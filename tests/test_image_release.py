@@ -0,0 +1,89 @@
+import io
+import os
+import time
+
+from PIL import Image
+
+import database
+import thumbnails
+from project import Project
+
+
+def _png(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _age(uploads, image_path, seconds=3600):
+    """把文件的修改时间改到宽限期之前"""
+    path = uploads.parent / image_path
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def _project_with(add_project, image_path, title, thumbnail_path=None):
+    project = add_project(title)
+    project.image_path = image_path
+    project.thumbnail_path = thumbnail_path or image_path
+    project.save()
+    return project
+
+
+def test_same_image_is_stored_once(db, uploads):
+    first = Project.store_image(io.BytesIO(_png()))
+    second = Project.store_image(io.BytesIO(_png()))
+    assert first == second
+    assert len(list(uploads.iterdir())) == 1
+
+
+def test_file_is_deleted_only_after_the_last_reference(add_project, uploads):
+    image_path = Project.store_image(io.BytesIO(_png()))
+    thumbnails.ensure(image_path)
+    thumbnail_path = thumbnails.thumbnail_path_for(image_path)
+    variant = uploads.parent / thumbnail_path
+    variant.parent.mkdir(parents=True)
+    variant.write_bytes(b'webp')
+    _age(uploads, image_path)
+
+    scarf = _project_with(add_project, image_path, 'scarf', thumbnail_path)
+    hat = _project_with(add_project, image_path, 'hat', thumbnail_path)
+
+    scarf.delete()
+    assert (uploads.parent / image_path).exists()
+
+    hat.delete()
+    assert not (uploads.parent / image_path).exists()
+    assert not variant.exists()
+    assert database.get_connection().execute(
+        'SELECT COUNT(*) FROM thumbnail_jobs WHERE image_path = ?', (image_path,)).fetchone()[0] == 0
+
+
+def test_release_during_grace_period_is_retried(add_project, uploads, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(Project, '_release_later',
+                        classmethod(lambda cls, image_path, paths, delay: scheduled.append((image_path, paths))))
+    image_path = Project.store_image(io.BytesIO(_png()))
+    project = _project_with(add_project, image_path, 'scarf')
+
+    project.delete()
+    assert (uploads.parent / image_path).exists()
+    assert scheduled == [(image_path, [image_path])]
+
+    # 宽限期过后由定时器再次检查
+    _age(uploads, image_path)
+    Project._release_deferred(*scheduled[0])
+    assert not (uploads.parent / image_path).exists()
+
+
+def test_deferred_release_keeps_a_reused_image(add_project, uploads, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(Project, '_release_later',
+                        classmethod(lambda cls, image_path, paths, delay: scheduled.append((image_path, paths))))
+    image_path = Project.store_image(io.BytesIO(_png()))
+    _project_with(add_project, image_path, 'scarf').delete()
+    _project_with(add_project, image_path, 'hat')
+
+    _age(uploads, image_path)
+    Project._release_deferred(*scheduled[0])
+    assert (uploads.parent / image_path).exists()
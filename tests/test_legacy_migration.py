@@ -0,0 +1,51 @@
+import database
+import migrations
+import read_model
+from project import Project
+
+
+def _add_legacy(legacy_db, title, status, created_at, completed_at=None, category='knitting'):
+    return legacy_db(
+        'INSERT INTO projects (title, category, status, created_at, completed_at) VALUES (?, ?, ?, ?, ?)',
+        (title, category, status, created_at, completed_at))
+
+
+def test_legacy_dates_are_normalized_and_durations_filled(legacy_db):
+    wip = _add_legacy(legacy_db, 'wip', '制作中', '2024/01/05')
+    done = _add_legacy(legacy_db, 'done', '已完成', '2024-01-01T08:30:00', '2024.02.10')
+    queued = _add_legacy(legacy_db, 'queued', '排队中', '2024-03-01 10:00:00')
+
+    assert migrations.migrate() == migrations.LATEST_VERSION
+    assert migrations.current_version() == migrations.LATEST_VERSION
+
+    rows = {row['id']: row for row in database.get_connection().execute('SELECT * FROM projects')}
+    assert rows[wip]['created_at'] == '2024-01-05'
+    assert rows[done]['created_at'] == '2024-01-01 08:30:00'
+    assert rows[done]['completed_at'] == '2024-02-10'
+    assert rows[done]['duration_days'] == 40
+    assert rows[queued]['created_at'] == '2024-03-01 10:00:00'
+    assert [(row['status_rank'], row['sort_date']) for row in rows.values()] == [
+        (0, '2024-01-05'), (2, '2024-02-10'), (1, '2024-03-01 10:00:00')]
+
+
+def test_migrated_listing_uses_the_sort_index(legacy_db, monkeypatch):
+    _add_legacy(legacy_db, 'done', '已完成', '2024/01/01', '2024/01/20')
+    _add_legacy(legacy_db, 'wip', '制作中', '2024/02/01')
+    _add_legacy(legacy_db, 'queued', '排队中', '2024/03/01', category='crafting')
+    migrations.migrate()
+
+    monkeypatch.setattr(read_model, 'ENABLED', False)
+    assert [p.title for p in Project.get_all()] == ['wip', 'queued', 'done']
+    plan = ' '.join(row['detail'] for row in database.get_connection().execute(
+        f'EXPLAIN QUERY PLAN SELECT * FROM projects WHERE category = ? ORDER BY {Project.ORDER_BY_SQL}',
+        ('knitting',)))
+    assert 'idx_projects_category_sort' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_migration_keeps_renamed_admin_and_runs_once(legacy_db):
+    legacy_db("INSERT INTO admins (username, password_hash) VALUES ('owner', 'x')")
+    migrations.migrate()
+    assert migrations.migrate() == 0
+    admins = [row['username'] for row in database.get_connection().execute('SELECT username FROM admins')]
+    assert admins == ['owner']
@@ -0,0 +1,75 @@
+import threading
+
+import database
+import migrations
+from project import Project
+
+
+def _stars_and_likes(project_id):
+    conn = database.get_connection()
+    stars = conn.execute('SELECT stars FROM projects WHERE id = ?', (project_id,)).fetchone()['stars']
+    likes = conn.execute(
+        'SELECT COUNT(*) FROM project_likes WHERE project_id = ?', (project_id,)).fetchone()[0]
+    return stars, likes
+
+
+def _run_in_threads(count, target):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run(number):
+        try:
+            barrier.wait()
+            target(number)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            database.close_connection()
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_toggle_likes_and_unlikes(add_project):
+    project = add_project('scarf')
+    assert Project.toggle_like(project.id, 'a') == ('liked', 1)
+    assert Project.toggle_like(project.id, 'b') == ('liked', 2)
+    assert Project.toggle_like(project.id, 'a') == ('unliked', 1)
+    assert Project.toggle_like(project.id + 100, 'a') == (None, 0)
+    assert _stars_and_likes(project.id) == (1, 1)
+
+
+def test_concurrent_likes_are_not_lost(add_project):
+    project = add_project('scarf')
+    _run_in_threads(16, lambda n: Project.toggle_like(project.id, f'visitor-{n}'))
+    assert _stars_and_likes(project.id) == (16, 16)
+
+
+def test_concurrent_toggles_from_one_visitor_stay_consistent(add_project):
+    project = add_project('scarf')
+    # 同一访客并发切换偶数次，最终回到未点赞，点赞数与记录数一致
+    _run_in_threads(8, lambda n: Project.toggle_like(project.id, 'visitor'))
+    assert _stars_and_likes(project.id) == (0, 0)
+
+
+def test_like_endpoint_sets_token_and_reports_404(client, add_project):
+    project = add_project('scarf')
+    response = client.post(f'/project/{project.id}/like')
+    assert response.get_json()['action'] == 'liked'
+    assert 'client_token=' in response.headers['Set-Cookie']
+    assert client.post(f'/project/{project.id}/like').get_json() == {
+        'success': True, 'action': 'unliked', 'message': '已取消点赞~', 'stars': 0}
+    assert client.post('/project/999/like').status_code == 404
+
+
+def test_migration_removes_duplicate_likes_and_recounts_stars(legacy_db):
+    project_id = legacy_db("INSERT INTO projects (title, category, status, stars) VALUES ('scarf', 'knitting', '制作中', 7)")
+    for token in ('a', 'a', 'b', 'a'):
+        legacy_db('INSERT INTO project_likes (project_id, client_token) VALUES (?, ?)', (project_id, token))
+
+    migrations.migrate()
+    assert _stars_and_likes(project_id) == (2, 2)
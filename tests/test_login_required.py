@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/dashboard', '/completed_projects', '/add_project', '/delete_project/1'])
+def test_anonymous_visitor_is_redirected_to_login(client, path):
+    response = client.get(path)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/login')
+
+
+def test_logged_in_admin_can_open_dashboard(client):
+    with client.session_transaction() as session:
+        session['admin'] = 'admin'
+        session.permanent = True
+    assert client.get('/dashboard').status_code == 200
@@ -0,0 +1,25 @@
+import metrics
+
+
+def test_metrics_allows_direct_local_scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'handshop_http_requests_total' in response.data
+
+
+def test_metrics_ignores_spoofed_forwarded_for(client):
+    response = client.get('/metrics', headers={'X-Forwarded-For': '127.0.0.1'},
+                          environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 403
+
+
+def test_metrics_rejects_proxied_request_from_local_proxy(client):
+    response = client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'})
+    assert response.status_code == 403
+
+
+def test_request_does_not_write_snapshot(client, monkeypatch):
+    writes = []
+    monkeypatch.setattr(metrics, 'flush', lambda force=False: writes.append(force))
+    assert client.get('/check_session').status_code == 204
+    assert writes == []
@@ -0,0 +1,31 @@
+import pytest
+
+import page_cache
+from project import Project
+
+
+@pytest.fixture
+def cache(client, monkeypatch):
+    monkeypatch.setattr(page_cache, '_entries', page_cache.OrderedDict())
+    monkeypatch.setattr(page_cache, '_version', None)
+    monkeypatch.setattr(page_cache, 'ENABLED', True)
+    Project(title='scarf', category='knitting', status='制作中', stars=0).save()
+    return page_cache._entries
+
+
+def test_junk_query_strings_share_one_entry(client, cache):
+    for n in range(20):
+        assert client.get(f'/?x={n}').status_code == 200
+    assert len(cache) == 1
+
+
+def test_category_pages_are_keyed_by_parsed_parameters(client, cache):
+    for path in ('/category/knitting', '/category/knitting?page=1', '/category/knitting?page=1&utm=a'):
+        assert client.get(path).status_code == 200
+    assert len(cache) == 1
+
+
+def test_empty_pages_are_not_cached(client, cache):
+    for path in ('/category/no-such-category', '/category/knitting?page=99'):
+        assert client.get(path).status_code == 200
+    assert len(cache) == 0
@@ -0,0 +1,77 @@
+from project import Project
+
+
+def _seed(add_project):
+    # 同一天的多个项目用来检验 (sort_date, id) 的并列排序
+    for day in (1, 1, 2, 3):
+        add_project(f'wip {day}', created_at=f'2024-01-0{day}')
+    for day in (1, 2):
+        add_project(f'queued {day}', status='排队中', created_at=f'2024-02-0{day}')
+    add_project('done', status='已完成', created_at='2024-01-01', completed_at='2024-03-01')
+    add_project('box', category='crafting', created_at='2024-01-05')
+
+
+def _walk(limit, **filters):
+    pages, cursor = [], None
+    while True:
+        projects, cursor = Project.get_after(cursor, limit=limit, **filters)
+        pages.append([p.id for p in projects])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_match_the_listing_order(add_project, read_path):
+    _seed(add_project)
+    expected = [p.id for p in Project.get_all()]
+    for limit in (1, 2, 3, 8, 20):
+        pages = _walk(limit)
+        assert [pid for page in pages for pid in page] == expected
+        assert all(0 < len(page) <= limit for page in pages)
+
+
+def test_cursor_pages_respect_filters(add_project, read_path):
+    _seed(add_project)
+    knitting = [p.id for p in Project.get_all('knitting')]
+    assert [pid for page in _walk(2, category='knitting') for pid in page] == knitting
+
+    queued = [pid for page in _walk(1, status='排队中') for pid in page]
+    assert [Project.get_by_id(pid).title for pid in queued] == ['queued 2', 'queued 1']
+
+
+def test_cursor_survives_inserts_before_it(add_project, read_path):
+    _seed(add_project)
+    first, cursor = Project.get_after(limit=3)
+    add_project('newest', created_at='2024-12-01')
+    rest, _ = Project.get_after(cursor, limit=20)
+    seen = [p.id for p in first + rest]
+    assert len(seen) == len(set(seen))
+    assert 'newest' not in [p.title for p in rest]
+
+
+def test_decode_cursor_rejects_garbage():
+    token = Project.encode_cursor(1, '2024-01-02', 7)
+    assert Project.decode_cursor(token) == (1, '2024-01-02', 7)
+    assert Project.decode_cursor('not a cursor') is None
+    assert Project.decode_cursor('') is None
+    assert Project.decode_cursor(token[:-3]) is None
+
+
+def test_api_projects_pages_with_cursor(client, add_project):
+    _seed(add_project)
+    response = client.get('/api/projects?limit=5&fields=id,title')
+    body = response.get_json()
+    assert body['success'] is True
+    assert set(body['projects'][0]) == {'id', 'title'}
+    ids = [item['id'] for item in body['projects']]
+
+    body = client.get(f"/api/projects?limit=5&fields=id&cursor={body['next_cursor']}").get_json()
+    ids += [item['id'] for item in body['projects']]
+    assert body['next_cursor'] is None
+    assert ids == [p.id for p in Project.get_all()]
+
+
+def test_api_projects_rejects_bad_cursor_and_fields(client, db):
+    response = client.get('/api/projects?cursor=garbage')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert client.get('/api/projects?fields=id,password').status_code == 400
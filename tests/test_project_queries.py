@@ -0,0 +1,32 @@
+from project import Project
+
+
+def test_get_latest_returns_the_top_of_the_listing_order(add_project, read_path):
+    add_project('queued', status='排队中', created_at='2024-05-01')
+    add_project('old wip', created_at='2024-01-01')
+    add_project('new wip', created_at='2024-03-01')
+    add_project('done', status='已完成', created_at='2024-01-01', completed_at='2024-06-01')
+    add_project('box', category='crafting', created_at='2024-04-01')
+
+    assert [p.title for p in Project.get_latest(3)] == ['box', 'new wip', 'old wip']
+    assert [p.title for p in Project.get_latest(2, category='knitting')] == ['new wip', 'old wip']
+    assert [p.title for p in Project.get_latest(10, category='knitting')] == [
+        'new wip', 'old wip', 'queued', 'done']
+
+
+def test_get_unfinished_excludes_completed_projects(add_project, read_path):
+    add_project('wip', created_at='2024-02-01')
+    add_project('queued', status='排队中', created_at='2024-03-01')
+    add_project('done', status='已完成', created_at='2024-01-01', completed_at='2024-06-01')
+    add_project('box', category='crafting', status='排队中', created_at='2024-04-01')
+
+    assert [p.title for p in Project.get_unfinished()] == ['wip', 'box', 'queued']
+    assert [p.title for p in Project.get_unfinished('knitting')] == ['wip', 'queued']
+
+
+def test_dashboard_lists_unfinished_projects(admin_client, add_project):
+    add_project('wip scarf')
+    add_project('finished hat', status='已完成', created_at='2024-01-01', completed_at='2024-02-01')
+    html = admin_client.get('/dashboard').get_data(as_text=True)
+    assert 'wip scarf' in html
+    assert 'finished hat' not in html
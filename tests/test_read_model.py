@@ -0,0 +1,46 @@
+import read_model
+from project import Project
+
+
+def _add(title, status, created_at):
+    project = Project(title=title, category='knitting', status=status, created_at=created_at, stars=0)
+    project.save()
+    return project
+
+
+def test_likes_update_rows_in_place_without_resorting(client):
+    first = _add('first', '制作中', '2024-01-01')
+    second = _add('second', '制作中', '2024-02-01')
+    assert [p.title for p in Project.get_all()] == ['second', 'first']
+    ordered = read_model._ordered
+
+    for token in ('a', 'b', 'c'):
+        Project.toggle_like(first.id, token)
+
+    assert [(p.title, p.stars) for p in Project.get_all()] == [('second', 0), ('first', 3)]
+    assert Project.get_by_id(first.id).stars == 3
+    assert read_model._ordered is ordered
+
+
+def test_status_change_reorders(client):
+    first = _add('first', '制作中', '2024-01-01')
+    _add('second', '制作中', '2024-02-01')
+    assert [p.title for p in Project.get_all()] == ['second', 'first']
+    ordered = read_model._ordered
+
+    first.status = '已完成'
+    first.completed_at = '2024-03-01'
+    first.save()
+
+    assert [p.title for p in Project.get_all()] == ['second', 'first']
+    assert read_model._ordered is not ordered
+    assert [p.title for p in Project.get_unfinished()] == ['second']
+
+
+def test_deleted_project_leaves_the_listing(client):
+    first = _add('first', '制作中', '2024-01-01')
+    _add('second', '排队中', '2024-02-01')
+    assert len(Project.get_all()) == 2
+    first.delete()
+    assert [p.title for p in Project.get_all()] == ['second']
+    assert Project.get_by_id(first.id) is None
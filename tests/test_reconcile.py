@@ -0,0 +1,114 @@
+import os
+import time
+
+import database
+import reconcile
+import thumbnails
+from project import Project
+
+
+def _write(uploads, relative, data=b'x', age=3600):
+    """在 static/ 下写入文件，修改时间默认早于宽限期"""
+    path = uploads.parent / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    old = time.time() - age
+    os.utime(path, (old, old))
+    return path
+
+
+def _project_with(add_project, title, image_path, thumbnail_path=None):
+    project = add_project(title)
+    project.image_path = image_path
+    project.thumbnail_path = thumbnail_path or image_path
+    project.save()
+    return project
+
+
+def _jobs():
+    rows = database.get_connection().execute('SELECT image_path FROM thumbnail_jobs ORDER BY id')
+    return [row['image_path'] for row in rows]
+
+
+def test_orphans_are_listed_then_deleted(add_project, uploads):
+    kept = _write(uploads, 'uploads/kept.png')
+    kept_thumb = _write(uploads, 'uploads/thumbnail/kept.webp')
+    kept_variant = _write(uploads, 'uploads/thumbnail/kept_320.webp')
+    _project_with(add_project, 'scarf', 'uploads/kept.png', 'uploads/thumbnail/kept.webp')
+    orphan = _write(uploads, 'uploads/orphan.png', b'12345')
+    orphan_variant = _write(uploads, 'uploads/thumbnail/orphan_640.webp')
+    partial = _write(uploads, 'uploads/upload.png.tmp')
+    recent = _write(uploads, 'uploads/recent.png', age=0)
+
+    finished, totals = reconcile.reconcile()
+    assert finished
+    assert totals['orphans'] == 3
+    assert totals['recent_files'] == 1
+    assert totals['deleted'] == 0
+    assert orphan.exists() and orphan_variant.exists() and partial.exists()
+
+    finished, totals = reconcile.reconcile(delete=True)
+    assert finished and totals['deleted'] == 3
+    assert totals['deleted_bytes'] == 5 + 1 + 1
+    assert not orphan.exists() and not orphan_variant.exists() and not partial.exists()
+    assert kept.exists() and kept_thumb.exists() and kept_variant.exists()
+    # 宽限期内的文件（可能正在保存）保留
+    assert recent.exists()
+
+
+def test_files_of_pending_thumbnail_jobs_are_kept(db, uploads):
+    image = _write(uploads, 'uploads/queued.png')
+    assert thumbnails.ensure_many(['uploads/queued.png']) == 1
+    reconcile.reconcile(delete=True)
+    assert image.exists()
+
+
+def test_fix_resets_projects_with_missing_files(add_project, uploads):
+    _write(uploads, 'uploads/present.png')
+    missing_image = _project_with(add_project, 'scarf', 'uploads/gone.png', 'uploads/thumbnail/gone.webp')
+    missing_thumb = _project_with(add_project, 'hat', 'uploads/present.png', 'uploads/thumbnail/gone.webp')
+
+    finished, totals = reconcile.reconcile()
+    assert totals['missing_images'] == 1 and totals['missing_thumbnails'] == 1
+    assert Project.get_by_id(missing_image.id).image_path == 'uploads/gone.png'
+    assert _jobs() == []
+
+    finished, totals = reconcile.reconcile(fix=True)
+    assert totals['fixed_projects'] == 2
+    project = Project.get_by_id(missing_image.id)
+    assert (project.image_path, project.thumbnail_path) == (Project.DEFAULT_IMAGE, Project.DEFAULT_IMAGE)
+    project = Project.get_by_id(missing_thumb.id)
+    assert (project.image_path, project.thumbnail_path) == ('uploads/present.png', 'uploads/present.png')
+    assert _jobs() == ['uploads/present.png']
+
+
+def test_interrupted_run_resumes_from_saved_position(add_project, uploads, monkeypatch):
+    monkeypatch.setattr(reconcile, 'BATCH_SIZE', 1)
+    for index in range(3):
+        add_project(f'project {index}')
+    for index in range(4):
+        _write(uploads, f'uploads/orphan{index}.png')
+
+    runs, finished = 0, False
+    while not finished:
+        # 每批之后都已超时，每次运行只处理一批
+        finished, totals = reconcile.reconcile(delete=True, max_seconds=1e-9)
+        runs += 1
+        assert runs < 20
+    assert runs > 3
+    assert totals['projects'] == 3
+    assert totals['deleted'] == 4
+    assert list(uploads.iterdir()) == []
+    count = database.get_connection().execute('SELECT COUNT(*) FROM reconcile_state').fetchone()[0]
+    assert count == 0
+
+
+def test_changed_options_restart_the_run(add_project, uploads, monkeypatch):
+    monkeypatch.setattr(reconcile, 'BATCH_SIZE', 1)
+    for index in range(3):
+        add_project(f'project {index}')
+    finished, totals = reconcile.reconcile(max_seconds=1e-9)
+    assert not finished and totals['projects'] == 1
+
+    finished, totals = reconcile.reconcile(fix=True)
+    assert finished and totals['projects'] == 3
@@ -0,0 +1,59 @@
+import database
+import stats
+from project import Project
+
+TABLES = {
+    'stats_status': 'category, status, projects',
+    'stats_durations': 'category, duration_days, projects',
+    'stats_completions': 'month, category, projects',
+    'stats_likes': 'month, likes',
+}
+
+
+def _rollups():
+    conn = database.get_connection()
+    return {
+        table: sorted(tuple(row) for row in conn.execute(
+            f'SELECT {columns} FROM {table} WHERE {columns.split(", ")[-1]} != 0'))
+        for table, columns in TABLES.items()
+    }
+
+
+def _add(title, category, status, created_at, completed_at=None):
+    project = Project(title=title, category=category, status=status,
+                      created_at=created_at, completed_at=completed_at, stars=0)
+    project.save()
+    return project
+
+
+def test_trigger_maintained_rollups_match_rebuild(db):
+    scarf = _add('scarf', 'knitting', '已完成', '2024-01-03', '2024-01-20')
+    hat = _add('hat', 'knitting', '制作中', '2024-02-01')
+    box = _add('box', 'crafting', '排队中', '2024-02-10')
+    for token in ('a', 'b', 'c'):
+        Project.toggle_like(scarf.id, token)
+        Project.toggle_like(hat.id, token)
+    Project.toggle_like(hat.id, 'b')
+
+    hat.status = '已完成'
+    hat.completed_at = '2024-03-05'
+    hat.save()
+    box.category = 'knitting'
+    box.save()
+    scarf.delete()
+
+    incremental = _rollups()
+    stats.rebuild()
+    assert _rollups() == incremental
+
+
+def test_deleting_a_project_removes_it_from_monthly_history(db):
+    scarf = _add('scarf', 'knitting', '已完成', '2024-01-03', '2024-01-20')
+    _add('hat', 'knitting', '已完成', '2024-01-05', '2024-01-25')
+    Project.toggle_like(scarf.id, 'a')
+    assert stats.summary()['completions'] == [{'month': '2024-01', 'knitting': 2, 'total': 2}]
+
+    scarf.delete()
+    summary = stats.summary()
+    assert summary['completions'] == [{'month': '2024-01', 'knitting': 1, 'total': 1}]
+    assert summary['likes'] == []
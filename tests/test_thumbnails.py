@@ -0,0 +1,43 @@
+import sys
+
+import database
+import migrations
+import thumbnails
+
+
+def _running_job(image_path, age_seconds):
+    with database.transaction() as conn:
+        return conn.execute(f'''
+            INSERT INTO thumbnail_jobs (image_path, thumbnail_path, status, updated_at)
+            VALUES (?, ?, 'running', datetime('now', '-{age_seconds} seconds'))
+            RETURNING id
+        ''', (image_path, thumbnails.thumbnail_path_for(image_path))).fetchone()['id']
+
+
+def _status(job_id):
+    return database.get_connection().execute(
+        'SELECT status FROM thumbnail_jobs WHERE id = ?', (job_id,)).fetchone()['status']
+
+
+def test_cli_migrates_an_unmigrated_database(empty_db, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['thumbnails.py', 'status'])
+    thumbnails.main()
+    assert migrations.current_version() == migrations.LATEST_VERSION
+    assert '{}' in capsys.readouterr().out
+
+
+def test_only_expired_leases_are_requeued(db):
+    expired = _running_job('uploads/a.png', thumbnails.LEASE_SECONDS + 60)
+    live = _running_job('uploads/b.png', 5)
+    assert thumbnails._requeue_stale() == 1
+    assert _status(expired) == 'pending'
+    assert _status(live) == 'running'
+
+
+def test_renewed_lease_is_not_requeued(db, monkeypatch):
+    monkeypatch.setattr(thumbnails, '_leases', set())
+    job_id = _running_job('uploads/a.png', thumbnails.LEASE_SECONDS + 60)
+    thumbnails._leases.add(job_id)
+    thumbnails._renew_leases()
+    assert thumbnails._requeue_stale() == 0
+    assert _status(job_id) == 'running'
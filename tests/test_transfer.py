@@ -0,0 +1,118 @@
+import io
+import json
+from datetime import date
+
+import pytest
+from PIL import Image
+
+import database
+import transfer
+from project import Project
+
+
+def _png(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _titles():
+    rows = database.get_connection().execute('SELECT title FROM projects ORDER BY id')
+    return [row['title'] for row in rows]
+
+
+def _likes():
+    rows = database.get_connection().execute('''
+        SELECT p.title, l.client_token FROM project_likes l JOIN projects p ON p.id = l.project_id
+        ORDER BY l.id
+    ''')
+    return [tuple(row) for row in rows]
+
+
+def test_ndjson_round_trip_remaps_like_ids(add_project, tmp_path):
+    add_project('scarf')
+    hat = add_project('hat', status='已完成', created_at='2024-01-01', completed_at='2024-01-11')
+    Project.toggle_like(hat.id, 'visitor')
+    path = tmp_path / 'export.ndjson'
+    assert transfer.export_projects(str(path), include_likes=True) == {'projects': 2, 'likes': 1}
+
+    counts = transfer.import_projects(str(path))
+    assert counts['projects'] == 2 and counts['likes'] == 1
+    assert _titles() == ['scarf', 'hat', 'scarf', 'hat']
+    # 点赞指向新导入的 hat，而不是导出文件里的旧 id
+    assert _likes() == [('hat', 'visitor'), ('hat', 'visitor')]
+    imported = Project.get_by_id(4)
+    assert imported.duration_days == 10
+
+
+def test_same_file_is_imported_once(add_project, tmp_path):
+    add_project('scarf')
+    path = tmp_path / 'export.ndjson'
+    transfer.export_projects(str(path))
+
+    assert transfer.import_projects(str(path))['projects'] == 1
+    assert transfer.import_projects(str(path)) is None
+    assert _titles() == ['scarf', 'scarf']
+    assert transfer.import_projects(str(path), force=True)['projects'] == 1
+    assert _titles() == ['scarf', 'scarf', 'scarf']
+
+
+def test_duplicate_and_orphan_likes_are_skipped(db, tmp_path):
+    path = tmp_path / 'likes.ndjson'
+    lines = [
+        {'type': 'project', 'id': 7, 'title': 'scarf'},
+        {'type': 'like', 'project_id': 7, 'client_token': 'a'},
+        {'type': 'like', 'project_id': 7, 'client_token': 'a'},
+        {'type': 'like', 'project_id': 99, 'client_token': 'b'},
+    ]
+    path.write_text('\n'.join(json.dumps(line) for line in lines), encoding='utf-8')
+
+    counts = transfer.import_projects(str(path))
+    assert counts['likes'] == 1
+    assert counts['skipped_likes'] == 1
+    assert _likes() == [('scarf', 'a')]
+
+
+def test_bad_record_rolls_back_the_whole_file(add_project, tmp_path):
+    add_project('existing')
+    path = tmp_path / 'broken.ndjson'
+    path.write_text('{"title": "first"}\n{"title": ""}\n', encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        transfer.import_projects(str(path))
+    assert _titles() == ['existing']
+    # 失败的导入没有被记录，修正后仍可导入
+    assert database.get_connection().execute('SELECT COUNT(*) FROM transfer_imports').fetchone()[0] == 0
+
+
+def test_csv_import(db, tmp_path):
+    path = tmp_path / 'projects.csv'
+    path.write_text('title,category,status,created_at,stars\n'
+                    'scarf,knitting,制作中,2024/3/1,\n', encoding='utf-8')
+    transfer.import_projects(str(path))
+    project = Project.get_by_id(1)
+    assert (project.title, project.category, project.stars) == ('scarf', 'knitting', 0)
+    assert project.created_at.date() == date(2024, 3, 1)
+
+
+def test_zip_images_are_deduplicated_by_content(add_project, uploads, tmp_path):
+    image_path = Project.store_image(io.BytesIO(_png()))
+    for title in ('scarf', 'hat'):
+        project = add_project(title)
+        project.image_path = project.thumbnail_path = image_path
+        project.save()
+    path = tmp_path / 'export.zip'
+    counts = transfer.export_projects(str(path), include_images=True)
+    assert counts['images'] == 1
+
+    for stale in uploads.iterdir():
+        stale.unlink()
+    counts = transfer.import_projects(str(path))
+    assert counts['projects'] == 2 and counts['missing_images'] == 0
+    assert [p.name for p in uploads.iterdir()] == [image_path.split('/')[-1]]
+    rows = database.get_connection().execute('SELECT image_path FROM projects WHERE id > 2')
+    assert {row['image_path'] for row in rows} == {image_path}
+
+    # 再次导入同一压缩包：图片已按内容哈希存在，不会多出文件
+    transfer.import_projects(str(path), force=True)
+    assert len(list(uploads.iterdir())) == 1
@@ -0,0 +1,102 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+import upload_ingest
+from upload_ingest import IngestFile, UploadRejected
+
+
+def _image(image_format='PNG', size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def _feed(ingest, data, chunk=7):
+    """像表单解析那样分成小块写入"""
+    for start in range(0, len(data), chunk):
+        ingest.write(data[start:start + chunk])
+
+
+@pytest.mark.parametrize('image_format, ext', [('PNG', 'png'), ('JPEG', 'jpg'), ('GIF', 'gif')])
+def test_supported_image_is_committed_by_hash(tmp_path, image_format, ext):
+    data = _image(image_format)
+    ingest = IngestFile(str(tmp_path))
+    _feed(ingest, data)
+    assert (ingest.ext, ingest.width, ingest.height) == (ext, 40, 30)
+
+    name = ingest.commit()
+    ingest.close()
+    assert name == f'{hashlib.sha256(data).hexdigest()}.{ext}'
+    assert [p.name for p in tmp_path.iterdir()] == [name]
+    assert (tmp_path / name).read_bytes() == data
+
+
+def test_same_content_reuses_the_stored_file(tmp_path):
+    names = []
+    for _ in range(2):
+        ingest = IngestFile(str(tmp_path))
+        _feed(ingest, _image())
+        names.append(ingest.commit())
+        ingest.close()
+    assert names[0] == names[1]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def _rejected(tmp_path, data, **kwargs):
+    ingest = IngestFile(str(tmp_path), **kwargs)
+    _feed(ingest, data)
+    assert isinstance(ingest.error, UploadRejected)
+    with pytest.raises(UploadRejected):
+        ingest.commit()
+    ingest.close()
+    # 被拒绝的上传不留下临时文件
+    assert list(tmp_path.iterdir()) == []
+    return ingest.error
+
+
+def test_wrong_magic_bytes_are_rejected(tmp_path):
+    _rejected(tmp_path, b'<?php echo 1; ?>' * 10)
+    _rejected(tmp_path, b'RIFF\x00\x00\x00\x00WEBPVP8 ' + b'\x00' * 64)
+
+
+def test_oversized_upload_is_rejected_after_writing_started(tmp_path):
+    data = _image(size=(200, 200))
+    error = _rejected(tmp_path, data, max_bytes=len(data) - 1)
+    assert 'MB' in str(error)
+
+
+def test_too_many_pixels_is_rejected_from_the_header(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_ingest, 'MAX_PIXELS', 1000)
+    error = _rejected(tmp_path, _image(size=(100, 100)))
+    assert '100×100' in str(error)
+
+
+def test_truncated_image_is_rejected_on_commit(tmp_path):
+    header = _image()[:6]
+    ingest = IngestFile(str(tmp_path))
+    ingest.write(header)
+    assert ingest.error is None
+    with pytest.raises(UploadRejected):
+        ingest.commit()
+    ingest.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_closing_without_commit_removes_the_temporary_file(tmp_path):
+    ingest = IngestFile(str(tmp_path))
+    _feed(ingest, _image())
+    assert len(list(tmp_path.iterdir())) == 1
+    ingest.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sniff_waits_for_a_complete_header():
+    data = _image()
+    assert upload_ingest.sniff(data[:4]) is None
+    assert upload_ingest.sniff(data[:12]) is None
+    assert upload_ingest.sniff(data) == ('png', 40, 30)
+    with pytest.raises(UploadRejected):
+        upload_ingest.sniff(b'\x89PNX')
@@ -0,0 +1,90 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+import upload_ingest
+from project import Project
+
+
+def _png(size=(40, 30), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _files(path):
+    return sorted(p.name for p in path.rglob('*') if p.is_file())
+
+
+@pytest.fixture
+def ingested(monkeypatch):
+    """记录表单解析时创建的 IngestFile"""
+    created = []
+
+    class RecordingIngestFile(upload_ingest.IngestFile):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(upload_ingest, 'IngestFile', RecordingIngestFile)
+    return created
+
+
+def test_anonymous_multipart_posts_use_the_default_stream(client, uploads, ingested):
+    for path in ('/login', '/project/1/like', '/add_project'):
+        client.post(path, data={'username': 'x', 'password': 'y', 'image': (io.BytesIO(_png()), 'a.png')},
+                    content_type='multipart/form-data')
+    assert ingested == []
+    assert _files(uploads) == []
+
+
+def test_admin_upload_is_ingested_while_parsing(admin_client, uploads, ingested):
+    admin_client.post('/add_project', data={
+        'title': 'scarf', 'category': 'knitting', 'status': '排队中',
+        'image': (io.BytesIO(_png()), 'photo.png'),
+    }, content_type='multipart/form-data')
+    assert len(ingested) == 1
+
+
+def test_admin_upload_is_stored_by_content_hash(admin_client, uploads):
+    data = _png()
+    response = admin_client.post('/add_project', data={
+        'title': 'scarf', 'category': 'knitting', 'status': '排队中',
+        'image': (io.BytesIO(data), 'photo.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    name = f'{hashlib.sha256(data).hexdigest()}.png'
+    assert _files(uploads) == [name]
+    project = Project.get_all()[0]
+    assert project.image_path == f'uploads/{name}'
+
+
+def test_rejected_admin_upload_leaves_no_file(admin_client, uploads):
+    response = admin_client.post('/add_project', data={
+        'title': 'scarf', 'category': 'knitting', 'status': '排队中',
+        'image': (io.BytesIO(b'not an image at all'), 'photo.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert _files(uploads) == []
+    assert Project.get_all()[0].image_path == Project.DEFAULT_IMAGE
+
+
+def test_oversized_edit_keeps_the_old_image(admin_client, uploads, monkeypatch):
+    first = _png()
+    admin_client.post('/add_project', data={
+        'title': 'scarf', 'category': 'knitting', 'status': '排队中',
+        'image': (io.BytesIO(first), 'photo.png'),
+    }, content_type='multipart/form-data')
+    old_image = Project.get_all()[0].image_path
+
+    monkeypatch.setattr(upload_ingest, 'MAX_BYTES', len(first))
+    response = admin_client.post('/edit_project/1', data={
+        'title': 'scarf', 'category': 'knitting', 'status': '排队中',
+        'image': (io.BytesIO(_png(size=(400, 300), color='blue')), 'bigger.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert Project.get_by_id(1).image_path == old_image
+    assert _files(uploads) == [old_image.split('/')[-1]]
@@ -0,0 +1,467 @@
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+import database
+import metrics
+
+# 压缩图后台任务：上传请求只保存原图并登记任务，由进程池在请求线程之外完成 WEBP 编码。
+# 任务记录在 thumbnail_jobs 表中，服务重启后未完成的任务会继续处理。
+# 处理中的任务由领取它的进程定期续期（updated_at），超过租约时间没有续期的才放回队列，
+# 其他进程启动或运行时不会把仍在编码的任务重新领走。
+
+# 每个应用进程内的编码进程数，设为 0 时不在应用内处理（改用 `python thumbnails.py run`）
+WORKERS = int(os.environ.get('HANDSHOP_THUMBNAIL_WORKERS', 1))
+
+# 空闲时检查新任务的间隔（秒）
+IDLE_POLL_SECONDS = 30
+
+# 处理中任务的续期间隔与租约时长（秒）：超过租约没有续期的任务视为进程已中断
+HEARTBEAT_SECONDS = 30
+LEASE_SECONDS = 120
+
+STATIC_DIR = 'static'
+THUMBNAIL_DIR = 'uploads/thumbnail'
+
+# 生成的压缩图宽度（像素），DEFAULT_WIDTH 对应项目的 thumbnail_path，其余通过 srcset 按需加载
+WIDTHS = (320, 640, 1280)
+DEFAULT_WIDTH = 640
+
+_wakeup = threading.Event()
+_worker_lock = threading.Lock()
+_worker_pid = None
+# 本进程正在编码的任务 id
+_leases_lock = threading.Lock()
+_leases = set()
+
+
+def init_jobs_table():
+    """初始化压缩图任务表及项目的多尺寸压缩图字段"""
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS thumbnail_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                image_path TEXT NOT NULL,
+                thumbnail_path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        job_columns = {row['name'] for row in conn.execute('PRAGMA table_info(thumbnail_jobs)')}
+        if 'variants' not in job_columns:
+            conn.execute('ALTER TABLE thumbnail_jobs ADD COLUMN variants TEXT')
+
+        # 项目的多尺寸压缩图（JSON：{宽度: 路径}）
+        project_columns = {row['name'] for row in conn.execute('PRAGMA table_info(projects)')}
+        if 'thumbnail_variants' not in project_columns:
+            conn.execute('ALTER TABLE projects ADD COLUMN thumbnail_variants TEXT')
+
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_thumbnail_jobs_status
+            ON thumbnail_jobs (status, id)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_thumbnail_jobs_image
+            ON thumbnail_jobs (image_path, status)
+        ''')
+        # 按原图查找项目：压缩图回写与原图引用计数
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_projects_image
+            ON projects (image_path)
+        ''')
+
+
+def new_thumbnail_path():
+    return f'{THUMBNAIL_DIR}/thumb_{uuid.uuid4().hex}.webp'
+
+
+def thumbnail_path_for(image_path):
+    """按内容哈希命名的原图对应固定的压缩图路径 uploads/thumbnail/<哈希>.webp"""
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    return f'{THUMBNAIL_DIR}/{name}.webp'
+
+
+def ensure(image_path):
+    """
+    同一原图已有完成的压缩图且文件仍在时直接复用，否则登记任务。
+    返回 True 表示登记了新任务。
+    """
+    conn = database.get_connection()
+    job = conn.execute('''
+        SELECT thumbnail_path, status FROM thumbnail_jobs
+        WHERE image_path = ? ORDER BY id DESC LIMIT 1
+    ''', (image_path,)).fetchone()
+    if job and (job['status'] in ('pending', 'running')
+                or os.path.exists(os.path.join(STATIC_DIR, job['thumbnail_path']))):
+        return False
+    enqueue(image_path, thumbnail_path_for(image_path))
+    return True
+
+
+def ensure_many(image_paths):
+    """批量版 ensure：一次查询已有任务，新任务在同一个事务中登记，返回登记的任务数"""
+    image_paths = list(dict.fromkeys(image_paths))
+    if not image_paths:
+        return 0
+    conn = database.get_connection()
+    latest = {}
+    # 分批查询，避免超过 SQLite 的参数个数上限
+    for start in range(0, len(image_paths), 500):
+        chunk = image_paths[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        for job in conn.execute(f'''
+            SELECT image_path, thumbnail_path, status FROM thumbnail_jobs
+            WHERE id IN (SELECT MAX(id) FROM thumbnail_jobs WHERE image_path IN ({placeholders}) GROUP BY image_path)
+        ''', chunk):
+            latest[job['image_path']] = job
+
+    jobs = []
+    for image_path in image_paths:
+        job = latest.get(image_path)
+        if job and (job['status'] in ('pending', 'running')
+                    or os.path.exists(os.path.join(STATIC_DIR, job['thumbnail_path']))):
+            continue
+        jobs.append((image_path, thumbnail_path_for(image_path)))
+
+    with database.transaction() as conn:
+        conn.executemany(
+            'INSERT INTO thumbnail_jobs (image_path, thumbnail_path) VALUES (?, ?)', jobs)
+    _wakeup.set()
+    return len(jobs)
+
+
+def forget(conn, image_path):
+    """原图不再被引用时删除其任务记录，避免之后重新上传时套用已删除的压缩图"""
+    conn.execute('DELETE FROM thumbnail_jobs WHERE image_path = ?', (image_path,))
+
+
+def enqueue(image_path, thumbnail_path=None):
+    """登记一个压缩图任务，返回压缩图最终的相对路径"""
+    thumbnail_path = thumbnail_path or new_thumbnail_path()
+    with database.transaction() as conn:
+        conn.execute(
+            'INSERT INTO thumbnail_jobs (image_path, thumbnail_path) VALUES (?, ?)',
+            (image_path, thumbnail_path)
+        )
+    _wakeup.set()
+    return thumbnail_path
+
+
+def enqueue_all(default_image='undo.png'):
+    """为所有已上传图片重新生成压缩图（已有待处理任务的图片会跳过），返回登记的任务数"""
+    conn = database.get_connection()
+    rows = conn.execute('''
+        SELECT DISTINCT image_path, thumbnail_path FROM projects
+        WHERE image_path IS NOT NULL AND image_path != ?
+          AND image_path NOT IN (
+              SELECT image_path FROM thumbnail_jobs WHERE status IN ('pending', 'running')
+          )
+    ''', (default_image,)).fetchall()
+
+    jobs = []
+    for row in rows:
+        thumbnail_path = row['thumbnail_path']
+        # 沿用已有的压缩图文件名，缺失或指向原图时重新命名
+        if not thumbnail_path or not thumbnail_path.startswith(THUMBNAIL_DIR + '/') \
+                or thumbnail_path.endswith('/None'):
+            thumbnail_path = new_thumbnail_path()
+        jobs.append((row['image_path'], thumbnail_path))
+
+    with database.transaction() as conn:
+        conn.executemany(
+            'INSERT INTO thumbnail_jobs (image_path, thumbnail_path) VALUES (?, ?)', jobs)
+    _wakeup.set()
+    return len(jobs)
+
+
+def retry_failed():
+    with database.transaction() as conn:
+        count = conn.execute('''
+            UPDATE thumbnail_jobs SET status = 'pending', error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'failed'
+        ''').rowcount
+    _wakeup.set()
+    return count
+
+
+def list_jobs(statuses=('pending', 'running', 'failed'), limit=100):
+    placeholders = ', '.join('?' * len(statuses))
+    return database.get_connection().execute(f'''
+        SELECT * FROM thumbnail_jobs WHERE status IN ({placeholders})
+        ORDER BY id LIMIT ?
+    ''', (*statuses, limit)).fetchall()
+
+
+def count_jobs():
+    rows = database.get_connection().execute(
+        'SELECT status, COUNT(*) AS total FROM thumbnail_jobs GROUP BY status').fetchall()
+    return {row['status']: row['total'] for row in rows}
+
+
+def variant_path(thumbnail_path, width):
+    """thumb_xxx.webp 对应宽度的文件名 thumb_xxx_320.webp"""
+    base, ext = os.path.splitext(thumbnail_path)
+    return f'{base}_{width}{ext}'
+
+
+def generate_thumbnail(static_dir, image_path, thumbnail_path):
+    """
+    在编码进程中执行：按 WIDTHS 生成多个宽度的 WEBP 压缩图（不放大原图），
+    返回 {实际宽度: 相对路径}。
+    """
+    os.makedirs(os.path.join(static_dir, os.path.dirname(thumbnail_path)), exist_ok=True)
+    with Image.open(os.path.join(static_dir, image_path)) as img:
+        # JPEG 直接按 1/2、1/4、1/8 缩小解码，手机大图无需完整解码
+        largest = max(WIDTHS)
+        img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        variants = {}
+        current = img
+        for width in sorted(WIDTHS, reverse=True):
+            if width > img.width and width != DEFAULT_WIDTH:
+                continue
+            target = min(width, img.width)
+            if current.width > target:
+                height = max(1, round(current.height * target / current.width))
+                # reducing_gap：先用 reduce() 整数倍缩小，再做精细缩放
+                current = current.resize((target, height), Image.LANCZOS, reducing_gap=3.0)
+
+            path = thumbnail_path if width == DEFAULT_WIDTH else variant_path(thumbnail_path, width)
+            full_path = os.path.join(static_dir, path)
+            tmp_path = f'{full_path}.tmp'
+            current.save(tmp_path, "WEBP", quality=80, method=4)
+            os.replace(tmp_path, full_path)
+            variants[current.width] = path
+    return variants
+
+
+def _timed_generate(static_dir, image_path, thumbnail_path):
+    """在编码进程中执行，返回 (variants, 编码耗时秒数)"""
+    started = time.perf_counter()
+    variants = generate_thumbnail(static_dir, image_path, thumbnail_path)
+    return variants, time.perf_counter() - started
+
+
+def _claim_job():
+    """原子地领取一个待处理任务，多个进程同时领取也不会重复"""
+    with database.transaction(immediate=True) as conn:
+        return conn.execute('''
+            UPDATE thumbnail_jobs
+            SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM thumbnail_jobs WHERE status = 'pending' ORDER BY id LIMIT 1
+            )
+            RETURNING id, image_path, thumbnail_path
+        ''').fetchone()
+
+
+def _finish_job(job, variants=None, error=None):
+    with database.transaction(immediate=True) as conn:
+        if error is None:
+            variants_json = json.dumps(variants or {}, sort_keys=True)
+            conn.execute('''
+                UPDATE thumbnail_jobs
+                SET status = 'done', error = NULL, variants = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (variants_json, job['id']))
+            # 任务完成后，引用该原图的项目改用压缩图
+            updated = conn.execute(
+                'UPDATE projects SET thumbnail_path = ?, thumbnail_variants = ? WHERE image_path = ?',
+                (job['thumbnail_path'], variants_json, job['image_path'])
+            ).rowcount
+            if updated:
+                database.bump_content_version(conn)
+        else:
+            conn.execute('''
+                UPDATE thumbnail_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (str(error)[:500], job['id']))
+
+
+def apply_finished(conn, project_id):
+    """项目保存时若引用的原图已有完成的压缩图（任务先于项目入库完成），直接换上"""
+    job = conn.execute('''
+        SELECT thumbnail_path, variants FROM thumbnail_jobs
+        WHERE image_path = (
+            SELECT image_path FROM projects WHERE id = ? AND thumbnail_path = image_path
+        ) AND status = 'done'
+        ORDER BY id DESC LIMIT 1
+    ''', (project_id,)).fetchone()
+    if job:
+        conn.execute(
+            'UPDATE projects SET thumbnail_path = ?, thumbnail_variants = ? WHERE id = ?',
+            (job['thumbnail_path'], job['variants'], project_id)
+        )
+
+
+def _requeue_stale():
+    """把租约已过期的“处理中”任务（领取它的进程中途退出）放回队列"""
+    with database.transaction() as conn:
+        return conn.execute(f'''
+            UPDATE thumbnail_jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND updated_at < datetime('now', '-{int(LEASE_SECONDS)} seconds')
+        ''').rowcount
+
+
+def _renew_leases():
+    """为本进程正在编码的任务续期"""
+    with _leases_lock:
+        job_ids = list(_leases)
+    if not job_ids:
+        return
+    placeholders = ', '.join('?' * len(job_ids))
+    with database.transaction() as conn:
+        conn.execute(f'''
+            UPDATE thumbnail_jobs SET updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND id IN ({placeholders})
+        ''', job_ids)
+
+
+def _keep_leases(stop):
+    """续期线程：定期续期本进程的任务，并回收其他进程留下的过期任务"""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            _renew_leases()
+            if _requeue_stale():
+                _wakeup.set()
+        except Exception as e:
+            print(f"[ERROR] 续期压缩图任务失败: {e}")
+    database.close_connection()
+
+
+def run_worker(workers=None, stop_when_idle=False):
+    """持续领取并处理任务；stop_when_idle=True 时队列清空后返回"""
+    workers = workers or WORKERS or 1
+    slots = threading.BoundedSemaphore(workers)
+    # 当前进程已有多个线程（请求线程、本线程），直接 fork 可能把其他线程持有的锁（sqlite3、日志等）
+    # 复制到编码进程中造成死锁；改由 forkserver（不支持时 spawn）启动干净的编码进程。
+    # 编码进程只读写图片文件，不访问数据库；静态目录传绝对路径，不依赖子进程的工作目录
+    static_dir = os.path.abspath(STATIC_DIR)
+
+    stop = threading.Event()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        _requeue_stale()
+        threading.Thread(target=_keep_leases, args=(stop,), name='thumbnail-lease', daemon=True).start()
+        try:
+            while True:
+                slots.acquire()
+                try:
+                    job = _claim_job()
+                except Exception as e:
+                    slots.release()
+                    print(f"[ERROR] 领取压缩图任务失败: {e}")
+                    job = None
+                else:
+                    if job is None:
+                        slots.release()
+
+                if job is None:
+                    if stop_when_idle:
+                        # 等待进行中的任务全部结束
+                        for _ in range(workers):
+                            slots.acquire()
+                        return
+                    _wakeup.wait(IDLE_POLL_SECONDS)
+                    _wakeup.clear()
+                    continue
+
+                with _leases_lock:
+                    _leases.add(job['id'])
+                future = pool.submit(
+                    _timed_generate, static_dir, job['image_path'], job['thumbnail_path'])
+                future.add_done_callback(lambda f, job=job: _on_done(job, f, slots))
+        finally:
+            stop.set()
+
+
+def _pool_context():
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        # forkserver 预先导入本模块（含 Pillow），之后的编码进程由它 fork，无需各自导入
+        context.set_forkserver_preload(['thumbnails'])
+    return context
+
+
+def _on_done(job, future, slots):
+    try:
+        error = future.exception()
+        if error is None:
+            variants, seconds = future.result()
+            metrics.observe('handshop_thumbnail_encode_seconds', seconds)
+        else:
+            variants = None
+        metrics.inc('handshop_thumbnail_jobs_total', (('result', 'failed' if error else 'done'),))
+        _finish_job(job, variants, error)
+        metrics.flush()
+    except Exception as e:
+        print(f"[ERROR] 更新压缩图任务状态失败: {e}")
+    finally:
+        with _leases_lock:
+            _leases.discard(job['id'])
+        slots.release()
+    if future.exception() is not None:
+        print(f"生成压缩图时出错: {future.exception()}")
+
+
+def start_worker():
+    """在当前应用进程中启动后台处理线程（每个进程只启动一次）"""
+    global _worker_pid
+    if WORKERS <= 0 or _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+    threading.Thread(target=_run_in_background, name='thumbnail-worker', daemon=True).start()
+
+
+def _run_in_background():
+    try:
+        run_worker(WORKERS)
+    except Exception as e:
+        print(f"[ERROR] 压缩图后台任务已停止: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='压缩图后台任务管理')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='查看待处理 / 处理中 / 失败的任务')
+    sub.add_parser('rebuild', help='为所有已上传图片重新生成压缩图')
+    sub.add_parser('retry', help='重新处理失败的任务')
+    run = sub.add_parser('run', help='在前台处理任务')
+    run.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    run.add_argument('--once', action='store_true', help='队列清空后退出')
+    args = parser.parse_args()
+
+    import migrations
+    migrations.migrate()
+
+    if args.command == 'status':
+        print(count_jobs())
+        for job in list_jobs():
+            print(f"#{job['id']} [{job['status']}] {job['image_path']} -> {job['thumbnail_path']}"
+                  f" (尝试 {job['attempts']} 次){' ' + job['error'] if job['error'] else ''}")
+    elif args.command == 'rebuild':
+        print(f"已登记 {enqueue_all()} 个压缩图任务")
+    elif args.command == 'retry':
+        print(f"已重新排队 {retry_failed()} 个失败任务")
+    elif args.command == 'run':
+        run_worker(args.workers, stop_when_idle=args.once)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import zipfile
+from datetime import datetime
+
+import database
+import thumbnails
+import upload_ingest
+from project import Project
+
+# 项目数据的批量导出与导入，用于在实例之间迁移数据（代替手工复制 handshop.db）。
+# 导出逐行读取数据库、逐行写出，不把全部项目读入内存；支持三种格式：
+#   ndjson  每行一条记录（{"type": "project", ...} 或 {"type": "like", ...}）
+#   csv     只包含项目
+#   zip     projects.ndjson 加上 images/ 目录下的原图
+# 导入在一个事务中用 executemany 分批写入，压缩图任务在提交后批量登记。
+# 中途中断时事务整体回滚，重新执行即可：已解压的图片按内容哈希跳过，已登记的压缩图任务继续处理；
+# 已成功导入的文件记录在 transfer_imports 表中，重复执行时跳过（--force 强制再导入一次）。
+
+FORMATS = ('ndjson', 'csv', 'zip')
+
+# 导出的项目字段（压缩图不导出，导入后重新生成）
+PROJECT_FIELDS = (
+    'id', 'title', 'description', 'category', 'status', 'image_path',
+    'created_at', 'completed_at', 'duration_days', 'stars',
+)
+LIKE_FIELDS = ('project_id', 'client_token', 'created_at')
+
+PROJECTS_MEMBER = 'projects.ndjson'
+IMAGES_PREFIX = 'images/'
+
+# 每次 executemany 写入的行数
+BATCH_SIZE = 1000
+# 计算导入文件哈希时每次读取的字节数
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+HASHED_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z]+$')
+# 已是存储格式的日期（导出文件中的日期都是这种格式），不必再逐个尝试解析
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$')
+
+
+def init_imports_table():
+    with database.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS transfer_imports (
+                source TEXT PRIMARY KEY,
+                filename TEXT,
+                projects INTEGER NOT NULL,
+                likes INTEGER NOT NULL,
+                imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext in ('ndjson', 'jsonl', 'json'):
+        return 'ndjson'
+    if ext in FORMATS:
+        return ext
+    raise ValueError(f'无法根据扩展名判断格式: {path}（请使用 --format 指定）')
+
+
+# ==========================================================================
+# 导出
+# ==========================================================================
+
+def iter_projects():
+    """按 id 顺序逐行读取项目（游标迭代，不一次性取出全部结果）"""
+    conn = database.get_connection()
+    for row in conn.execute(f"SELECT {', '.join(PROJECT_FIELDS)} FROM projects ORDER BY id"):
+        yield {key: row[key] for key in PROJECT_FIELDS}
+
+
+def iter_likes():
+    conn = database.get_connection()
+    for row in conn.execute(f"SELECT {', '.join(LIKE_FIELDS)} FROM project_likes ORDER BY id"):
+        yield {key: row[key] for key in LIKE_FIELDS}
+
+
+def _write_ndjson(out, include_likes, on_project=None):
+    counts = {'projects': 0, 'likes': 0}
+    for record in iter_projects():
+        if on_project:
+            on_project(record)
+        out.write(json.dumps({'type': 'project', **record}, ensure_ascii=False) + '\n')
+        counts['projects'] += 1
+    if include_likes:
+        # 点赞写在所有项目之后，导入时据此换算新的项目 id
+        for record in iter_likes():
+            out.write(json.dumps({'type': 'like', **record}, ensure_ascii=False) + '\n')
+            counts['likes'] += 1
+    return counts
+
+
+def _write_csv(out):
+    writer = csv.DictWriter(out, fieldnames=PROJECT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for record in iter_projects():
+        writer.writerow(record)
+        count += 1
+    return {'projects': count, 'likes': 0}
+
+
+def _write_zip(path, include_likes, include_images):
+    image_paths = set()
+
+    def collect(record):
+        if include_images and record['image_path'] and record['image_path'] != Project.DEFAULT_IMAGE:
+            image_paths.add(record['image_path'])
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with zf.open(PROJECTS_MEMBER, 'w', force_zip64=True) as raw:
+            with io.TextIOWrapper(raw, encoding='utf-8', newline='\n') as out:
+                counts = _write_ndjson(out, include_likes, on_project=collect)
+
+        # 图片本身已压缩，直接存储；zipfile 按块读取文件
+        counts['images'] = 0
+        for image_path in sorted(image_paths):
+            file_path = os.path.join(thumbnails.STATIC_DIR, image_path)
+            if not os.path.isfile(file_path):
+                print(f"[ERROR] 图片不存在，已跳过: {image_path}")
+                continue
+            zf.write(file_path, IMAGES_PREFIX + image_path, compress_type=zipfile.ZIP_STORED)
+            counts['images'] += 1
+    return counts
+
+
+def export_projects(path, fmt=None, include_likes=False, include_images=False):
+    """导出到文件（path 为 - 时写到标准输出，仅限 ndjson / csv），返回各类记录数"""
+    fmt = fmt or ('ndjson' if path == '-' else detect_format(path))
+    if fmt != 'zip' and include_images:
+        raise ValueError('只有 zip 格式可以包含图片')
+    if fmt == 'csv' and include_likes:
+        raise ValueError('csv 格式只包含项目，导出点赞记录请使用 ndjson 或 zip')
+    if fmt == 'zip':
+        if path == '-':
+            raise ValueError('zip 格式需要输出到文件')
+        return _write_zip(path, include_likes, include_images)
+
+    if path == '-':
+        out = sys.stdout
+        return _write_ndjson(out, include_likes) if fmt == 'ndjson' else _write_csv(out)
+    # 先写临时文件，完成后再替换，避免中断时留下不完整的导出文件
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+        counts = _write_ndjson(out, include_likes) if fmt == 'ndjson' else _write_csv(out)
+    os.replace(tmp_path, path)
+    return counts
+
+
+# ==========================================================================
+# 导入
+# ==========================================================================
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'第 {number} 行不是有效的 JSON: {e}')
+
+
+def _read_csv(lines):
+    for record in csv.DictReader(lines):
+        yield {'type': 'project', **record}
+
+
+def _extract_images(zf):
+    """把压缩包中的原图按内容哈希存入上传目录，返回 {导出时的路径: 新路径}"""
+    image_map = {}
+    save_dir = os.path.join(thumbnails.STATIC_DIR, Project.UPLOAD_DIR)
+    for info in zf.infolist():
+        if info.is_dir() or not info.filename.startswith(IMAGES_PREFIX):
+            continue
+        old_path = info.filename[len(IMAGES_PREFIX):]
+        name = os.path.basename(old_path)
+        if not Project.allowed_file(name):
+            continue
+        # 已按哈希命名且目标文件大小一致（之前中断的导入已解压过）时不再重新计算
+        existing = os.path.join(save_dir, name)
+        if HASHED_NAME_RE.match(name) and os.path.isfile(existing) \
+                and os.path.getsize(existing) == info.file_size:
+            image_map[old_path] = f'{Project.UPLOAD_DIR}/{name}'
+            continue
+        with zf.open(info) as stream:
+            try:
+                image_map[old_path] = Project.store_image(stream)
+            except upload_ingest.UploadRejected as e:
+                print(f"[ERROR] 跳过图片 {old_path}: {e}")
+                image_map[old_path] = Project.DEFAULT_IMAGE
+    return image_map
+
+
+def _clean(value):
+    """CSV 中的空字符串视为 NULL"""
+    return None if value == '' else value
+
+
+def _to_int(value, default=None):
+    value = _clean(value)
+    try:
+        return int(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _normalize_date(value):
+    value = _clean(value)
+    if value is None:
+        return None
+    if isinstance(value, str) and ISO_DATE_RE.match(value):
+        return value
+    return Project._normalize_date(value) or str(value)
+
+
+def _import_records(records, image_map=None):
+    """
+    在一个事务中写入项目与点赞，返回 (各类记录数, 新导入项目的最小 id)。
+    新项目的 id 从当前最大值之后连续分配，点赞记录据此换算项目 id。
+    """
+    image_map = image_map or {}
+    counts = {'projects': 0, 'likes': 0, 'skipped_likes': 0}
+    id_map = {}
+    projects, likes = [], []
+
+    def flush_projects(conn):
+        conn.executemany('''
+            INSERT INTO projects (id, title, description, category, status, image_path, thumbnail_path,
+                                  created_at, completed_at, stars)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+        ''', projects)
+        counts['projects'] += len(projects)
+        projects.clear()
+
+    def flush_likes(conn):
+        # 重复的点赞（唯一索引冲突）被忽略，只统计实际写入的行
+        counts['likes'] += conn.executemany('''
+            INSERT OR IGNORE INTO project_likes (project_id, client_token, created_at)
+            VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', likes).rowcount
+        likes.clear()
+
+    with database.transaction(immediate=True) as conn:
+        # 已删除项目的 id 不再复用（与 AUTOINCREMENT 一致）
+        base = conn.execute('''
+            SELECT MAX(
+                COALESCE((SELECT MAX(id) FROM projects), 0),
+                COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'projects'), 0)
+            )
+        ''').fetchone()[0]
+        next_id = base + 1
+
+        for record in records:
+            kind = record.get('type', 'project')
+            if kind == 'project':
+                title = _clean(record.get('title'))
+                if not title:
+                    raise ValueError(f'项目缺少标题: {record}')
+                image_path = _clean(record.get('image_path')) or Project.DEFAULT_IMAGE
+                image_path = image_map.get(image_path, image_path)
+                old_id = _to_int(record.get('id'))
+                if old_id is not None:
+                    id_map[old_id] = next_id
+                # 压缩图生成前先展示原图（与上传时相同）
+                projects.append((
+                    next_id, title, _clean(record.get('description')),
+                    record.get('category') or 'crafting', record.get('status') or '排队中',
+                    image_path, image_path,
+                    _normalize_date(record.get('created_at')), _normalize_date(record.get('completed_at')),
+                    _to_int(record.get('stars'), 0),
+                ))
+                next_id += 1
+                if len(projects) >= BATCH_SIZE:
+                    flush_projects(conn)
+            elif kind == 'like':
+                project_id = id_map.get(_to_int(record.get('project_id')))
+                if project_id is None or not record.get('client_token'):
+                    counts['skipped_likes'] += 1
+                    continue
+                if projects:
+                    flush_projects(conn)
+                likes.append((project_id, str(record['client_token']), _clean(record.get('created_at'))))
+                if len(likes) >= BATCH_SIZE:
+                    flush_likes(conn)
+
+        if projects:
+            flush_projects(conn)
+        if likes:
+            flush_likes(conn)
+
+        # 用时天数与已完成的压缩图在 SQL 中一次性补上
+        conn.execute(f'UPDATE projects SET duration_days = {Project.DURATION_SQL} WHERE id > ?', (base,))
+        conn.execute('''
+            UPDATE projects SET (thumbnail_path, thumbnail_variants) = (
+                SELECT thumbnail_path, variants FROM thumbnail_jobs
+                WHERE thumbnail_jobs.image_path = projects.image_path AND status = 'done'
+                ORDER BY id DESC LIMIT 1
+            )
+            WHERE id > ? AND thumbnail_path = image_path AND EXISTS (
+                SELECT 1 FROM thumbnail_jobs
+                WHERE thumbnail_jobs.image_path = projects.image_path AND status = 'done'
+            )
+        ''', (base,))
+        if counts['projects'] or counts['likes']:
+            database.bump_content_version(conn)
+    return counts, base + 1
+
+
+def import_projects(path, fmt=None, force=False):
+    """从导出文件导入，返回各类记录数；该文件已导入过且未指定 force 时返回 None"""
+    fmt = fmt or detect_format(path)
+    source = _file_digest(path)
+    if not force:
+        done = database.get_connection().execute(
+            'SELECT imported_at FROM transfer_imports WHERE source = ?', (source,)).fetchone()
+        if done:
+            print(f"[INFO] {path} 已于 {done['imported_at']} 导入，跳过（使用 --force 再次导入）")
+            return None
+
+    image_map = {}
+    if fmt == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            image_map = _extract_images(zf)
+            print(f"[INFO] 已解压 {len(image_map)} 张图片")
+            with zf.open(PROJECTS_MEMBER) as raw:
+                counts, first_id = _import_records(
+                    _read_ndjson(io.TextIOWrapper(raw, encoding='utf-8')), image_map)
+    else:
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = _read_ndjson(f) if fmt == 'ndjson' else _read_csv(f)
+            counts, first_id = _import_records(reader, image_map)
+
+    with database.transaction() as conn:
+        conn.execute('''
+            INSERT INTO transfer_imports (source, filename, projects, likes) VALUES (?, ?, ?, ?)
+            ON CONFLICT (source) DO UPDATE SET
+                projects = excluded.projects, likes = excluded.likes, imported_at = CURRENT_TIMESTAMP
+        ''', (source, os.path.basename(path), counts['projects'], counts['likes']))
+
+    # 提交后批量登记压缩图任务；缺少原图文件的项目继续使用原路径
+    conn = database.get_connection()
+    image_paths = [row['image_path'] for row in conn.execute('''
+        SELECT DISTINCT image_path FROM projects
+        WHERE id >= ? AND image_path != ? AND thumbnail_path = image_path
+    ''', (first_id, Project.DEFAULT_IMAGE))]
+    present = [p for p in image_paths if os.path.isfile(os.path.join(thumbnails.STATIC_DIR, p))]
+    counts['missing_images'] = len(image_paths) - len(present)
+    counts['thumbnail_jobs'] = thumbnails.ensure_many(present)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='项目数据批量导出 / 导入')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='导出项目（- 表示标准输出）')
+    export.add_argument('path')
+    export.add_argument('--format', choices=FORMATS, help='默认按扩展名判断')
+    export.add_argument('--likes', action='store_true', help='同时导出点赞记录（ndjson / zip）')
+    export.add_argument('--images', action='store_true', help='同时打包原图（zip）')
+    load = sub.add_parser('import', help='导入之前导出的文件')
+    load.add_argument('path')
+    load.add_argument('--format', choices=FORMATS, help='默认按扩展名判断')
+    load.add_argument('--force', action='store_true', help='同一文件已导入过时仍然导入')
+    load.add_argument('--thumbnails', action='store_true', help='导入后在前台生成压缩图，完成后退出')
+    args = parser.parse_args()
+
+    import migrations
+    migrations.migrate()
+
+    started = datetime.now()
+    try:
+        if args.command == 'export':
+            counts = export_projects(args.path, args.format, args.likes, args.images)
+        else:
+            counts = import_projects(args.path, args.format, args.force)
+            if counts is not None and args.thumbnails:
+                thumbnails.run_worker(os.cpu_count() or 1, stop_when_idle=True)
+    except (ValueError, OSError, zipfile.BadZipFile) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+    if counts is not None:
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"[INFO] 完成（{seconds:.1f} 秒）: {counts}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import hashlib
+import io
+import os
+import uuid
+import warnings
+
+from PIL import Image
+
+# 上传图片的单次写入：表单解析时（werkzeug 的文件流工厂）或从数据流读取时逐块写入 IngestFile，
+# 先在内存中累积文件头，识别出格式与尺寸后才开始写磁盘，同时计算内容哈希并限制大小；
+# 通过校验的数据直接写在上传目录的临时文件中，commit() 时改名为 <哈希>.<扩展名>。
+# 不是 JPEG / PNG / GIF、尺寸过大（解压炸弹）或超过大小上限的上传会被丢弃，其余数据不再写入。
+# 请求中只读取文件头，不解码图像，完整解码只在压缩图进程中进行一次。
+
+# 单张图片的大小上限（字节），应用的 MAX_CONTENT_LENGTH 在此基础上留出表单字段的余量
+MAX_BYTES = int(os.environ.get('HANDSHOP_UPLOAD_MAX_BYTES', 16 * 1024 * 1024))
+
+# 像素数上限（宽 × 高），默认 4000 万像素
+MAX_PIXELS = int(os.environ.get('HANDSHOP_UPLOAD_MAX_PIXELS', 40_000_000))
+
+# 识别尺寸时最多累积的文件头字节数（JPEG 的 EXIF / ICC 段可能较大）
+HEADER_LIMIT = 512 * 1024
+
+# 文件头 -> (Pillow 格式, 保存的扩展名)
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG', 'png'),
+    (b'GIF87a', 'GIF', 'gif'),
+    (b'GIF89a', 'GIF', 'gif'),
+)
+
+TMP_SUFFIX = '.tmp'
+
+
+class UploadRejected(ValueError):
+    """上传内容不是支持的图片，或超出大小 / 尺寸限制"""
+
+
+def sniff(header):
+    """
+    由文件头识别图片，返回 (扩展名, 宽, 高)；数据还不足以判断时返回 None。
+    不支持的格式或超出限制时抛出 UploadRejected。
+    """
+    for magic, image_format, ext in SIGNATURES:
+        if header.startswith(magic):
+            break
+    else:
+        if any(magic.startswith(header) for magic, _, _ in SIGNATURES):
+            return None
+        raise UploadRejected('不是支持的图片格式（JPEG / PNG / GIF）')
+
+    try:
+        with warnings.catch_warnings():
+            # 像素数由下面的 MAX_PIXELS 判断
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(header), formats=(image_format,)) as img:
+                width, height = img.size
+    except Image.DecompressionBombError:
+        raise UploadRejected('图片尺寸过大')
+    except Exception:
+        # 文件头还没有接收完整
+        if len(header) >= HEADER_LIMIT:
+            raise UploadRejected('无法识别图片尺寸')
+        return None
+
+    if width <= 0 or height <= 0 or width * height > MAX_PIXELS:
+        raise UploadRejected(f'图片尺寸过大（{width}×{height}，上限 {MAX_PIXELS // 1_000_000} 百万像素）')
+    return ext, width, height
+
+
+class IngestFile(io.RawIOBase):
+    """
+    边接收边校验、计算哈希并写入上传目录的文件流。
+    可直接作为 werkzeug 的文件容器（支持 seek / read），未 commit() 就关闭时删除临时文件。
+    """
+
+    def __init__(self, save_dir, max_bytes=None):
+        super().__init__()
+        self.save_dir = save_dir
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.tmp_path = os.path.join(save_dir, f'.{uuid.uuid4().hex}{TMP_SUFFIX}')
+        self.size = 0
+        self.ext = self.width = self.height = None
+        self.error = None
+        self._header = bytearray()
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._committed = False
+        self.saved_name = None
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        length = len(data)
+        if self.error is not None:
+            # 已拒绝：丢弃其余数据
+            return length
+        self.size += length
+        if self.size > self.max_bytes:
+            self._reject(UploadRejected(f'图片超过 {self.max_bytes / 1024 / 1024:g} MB'))
+            return length
+
+        if self.ext is None:
+            self._header += data
+            try:
+                result = sniff(bytes(self._header))
+            except UploadRejected as e:
+                self._reject(e)
+                return length
+            if result is None:
+                return length
+            self.ext, self.width, self.height = result
+            data, self._header = bytes(self._header), None
+            os.makedirs(self.save_dir, exist_ok=True)
+            self._file = open(self.tmp_path, 'w+b')
+
+        self._digest.update(data)
+        self._file.write(data)
+        return length
+
+    def _reject(self, error):
+        self.error = error
+        self._header = None
+        self._discard()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not self._committed and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence) if self._file is not None else 0
+
+    def tell(self):
+        return self._file.tell() if self._file is not None else 0
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer) if self._file is not None else 0
+
+    def commit(self):
+        """
+        按内容哈希保存（相同图片已存在时直接复用），返回文件名。
+        被拒绝或无法识别时抛出 UploadRejected。
+        """
+        if self._committed:
+            return self.saved_name
+        if self.error is None and self.ext is None:
+            self.error = UploadRejected('无法识别图片内容')
+        if self.error is not None:
+            self._discard()
+            raise self.error
+
+        self._file.close()
+        self._file = None
+        name = f'{self._digest.hexdigest()}.{self.ext}'
+        path = os.path.join(self.save_dir, name)
+        if os.path.exists(path):
+            # 相同图片已存在：丢弃临时文件，并刷新修改时间以免被并发的删除清理掉
+            os.remove(self.tmp_path)
+            os.utime(path)
+        else:
+            os.replace(self.tmp_path, path)
+        self._committed = True
+        self.saved_name = name
+        return name
+
+    def close(self):
+        if not self.closed:
+            self._discard()
+        super().close()